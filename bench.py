@@ -0,0 +1,796 @@
+# bench.py
+"""
+Бенчмарки бота на временной SQLite-базе.
+
+    python bench.py db --updates 200 --rate 200 --latency-ms 5
+    python bench.py render --words 1800 --sends 20000
+    python bench.py audio --presses 200 --delay-ms 50
+    python bench.py import --rows 500000
+    python bench.py snapshot --words 200000
+    python bench.py webhook --updates 3000 --rate 1000
+    python bench.py callbacks --presses 100000
+    python bench.py questions --takes 20000 --rate 1000 --users 50
+    python bench.py metrics --events 200000
+
+db – задержка обработки апдейтов (p50/p99), когда запросы к БД выполняются прямо
+в event loop («до») и через пул потоков run_db («после»). --latency-ms имитирует
+сетевую задержку каждого запроса к PostgreSQL.
+
+render – стоимость подготовки карточки слова к отправке: сборка текста и клавиатуры
+с сериализацией в JSON, как делает aiogram, («до») и готовый payload из кэша («после»).
+
+audio – нажатия «Послушать слово» против локального HTTP-сервера с mp3 (вместо GCS):
+блокирующий requests.get в event loop («до») и общий aiohttp-клиент («после»).
+Корректность загрузчика (single-flight, 404, повтор после 503) – в tests/test_audio_fetch.py.
+
+import – импорт словаря из CSV: прежний цикл с запросом на каждую строку («до»,
+на первых --legacy-rows строках) и потоковый import_words.py («после»): первый
+прогон вставляет все строки, второй – с изменённой частью переводов – обновляет их.
+
+snapshot – загрузка каталога слов при старте процесса: из БД через ORM («до»)
+и из двоичного снимка bot/snapshot.py («после»), плюс поиск по (word_et, part_of_speech).
+
+webhook – приём апдейтов: встроенный start_polling aiogram («aiogram») и poll_updates
+с очередью по чатам («polling») против локального фейкового Bot API, bot/webhook.py, куда
+апдейты POST-ит генератор как Telegram («webhook»). Задержка – от появления апдейта
+до конца обработчика; 503 при переполнении очереди повторяются.
+
+callbacks – стоимость выбора обработчика нажатия inline-кнопки: прежние текстовые
+callback_data с цепочкой startswith и split («до») и подписанный двоичный формат
+bot/callbacks.py с поиском по opcode («после»); отдельно – полный путь через
+Dispatcher.process_update с пустыми обработчиками.
+
+questions – выдача теста пользователю: сборка вопроса на месте («до») и готовый вопрос
+из пула bot/questions.py, который дособирает фоновая задача («после»). Заодно считается,
+сколько раз пользователю выпало то же слово, что и в предыдущем тесте.
+
+metrics – цена метрик bot/metrics.py на событие: запись в гистограмму, SQL-запрос
+без хуков движка («до») и с ними («после»), Dispatcher.process_update нажатия без
+HandlerMetricsMiddleware и с ним, плюс время сборки ответа /metrics.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# База для бенчмарков – временный файл, его нужно задать до импорта bot.database
+_tmp_dir = tempfile.mkdtemp(prefix="eesti_bench_")
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}")
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, latencies, elapsed=None):
+    line = (f"{name:<12} n={len(latencies):<6} p50={percentile(latencies, 50) * 1000:8.2f} мс "
+            f"p99={percentile(latencies, 99) * 1000:8.2f} мс")
+    if elapsed:
+        line += f"  {len(latencies) / elapsed:10.1f} оп/с"
+    print(line)
+
+
+def seed_words(count: int = 200):
+    from bot.database import SessionLocal, Word, init_db
+    init_db()
+    session = SessionLocal()
+    try:
+        if session.query(Word).count() == 0:
+            parts = ["nimisõna", "tegusõna", "omadussõna", "määrsõna"]
+            session.add_all([
+                Word(word_et=f"sõna{i}", part_of_speech=parts[i % len(parts)],
+                     translation=f"перевод{i}", ai_generated_text=f"Пример {i}")
+                for i in range(count)
+            ])
+            session.commit()
+    finally:
+        session.close()
+
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+
+class FakeMessage:
+    """Минимальная замена types.Message для вызова обработчиков без Telegram."""
+
+    def __init__(self, chat_id, text=""):
+        self.chat = FakeChat(chat_id)
+        self.text = text
+        self.bot = None
+
+    async def answer(self, *args, **kwargs):
+        return None
+
+
+def bench_db(args):
+    from sqlalchemy import event
+    from bot import handlers
+    from bot.database import SessionLocal, engine, run_db
+
+    seed_words()
+    latency = args.latency_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _simulate_network(conn, cursor, statement, parameters, context, executemany):
+        time.sleep(latency)
+
+    async def run_inline(fn, *a, **kw):
+        # Поведение до переноса в пул потоков: запрос выполняется прямо в event loop
+        session = SessionLocal()
+        try:
+            result = fn(session, *a, **kw)
+            session.commit()
+            return result
+        finally:
+            session.close()
+
+    async def drive():
+        latencies = []
+
+        async def one(i, arrival):
+            # Задержка считается от момента «прихода» апдейта, а не от начала обработчика
+            await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+            await handlers.progress_handler(FakeMessage(1000 + i))
+            latencies.append(time.perf_counter() - arrival)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i, started + i / args.rate) for i in range(args.updates)))
+        return latencies, time.perf_counter() - started
+
+    print(f"{args.updates} апдейтов /progress по {args.rate:g}/с, задержка БД {args.latency_ms} мс на запрос")
+    handlers.run_db = run_inline
+    report("до", *asyncio.run(drive()))
+    handlers.run_db = run_db
+    report("после", *asyncio.run(drive()))
+
+
+def bench_render(args):
+    import json
+    import random
+    from aiogram.utils.payload import prepare_arg
+    from bot.catalog import word_catalog
+    from bot.word_cards import CardCache, get_word_message
+
+    seed_words(args.words)
+    words = word_catalog.current.words
+    sends = [random.choice(words) for _ in range(args.sends)]
+
+    def rendered(word):
+        text, keyboard = get_word_message(word)
+        return {'text': text, 'parse_mode': "HTML", 'reply_markup': prepare_arg(keyboard)}
+
+    cache = CardCache()
+    for name, render in (("до", rendered), ("после", cache.get)):
+        latencies = []
+        started = time.perf_counter()
+        for word in sends:
+            t0 = time.perf_counter()
+            payload = render(word)
+            # Так aiogram готовит reply_markup перед запросом: строка передаётся как есть
+            prepare_arg(payload['reply_markup'])
+            latencies.append(time.perf_counter() - t0)
+        report(name, latencies, time.perf_counter() - started)
+    assert json.loads(cache.get(words[0])['reply_markup']) == json.loads(rendered(words[0])['reply_markup'])
+    print(f"карточек в кэше: {len(cache)}, попаданий {cache.hits}, промахов {cache.misses}")
+
+
+def _start_audio_server(delay: float):
+    """
+    Локальная замена хранилища аудио: /<слово>.mp3 с задержкой delay.
+    Сервер работает в своём потоке со своим event loop – блокирующий клиент его не остановит.
+    """
+    import threading
+    from aiohttp import web
+    hits = {}
+    ready = threading.Event()
+    state = {}
+
+    async def serve(request):
+        name = request.match_info['name']
+        hits[name] = hits.get(name, 0) + 1
+        await asyncio.sleep(delay)
+        return web.Response(body=b'ID3' + name.encode() * 100, content_type='audio/mpeg')
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{name}.mp3', serve)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        state['port'] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: asyncio.run(run()), daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{state['port']}", hits
+
+
+BENCH_TOKEN = "123456789:AAbbccddeeffgghhiijjkkllmmnnooppqqr"
+
+
+def _synthetic_update(update_id: int, chats: int = 1000):
+    chat_id = 100000 + update_id % chats
+    return {
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'date': int(time.time()), 'text': "/random_word",
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': {'id': chat_id, 'is_bot': False, 'first_name': "bench"}},
+    }
+
+
+def _start_fake_bot_api():
+    """
+    Фейковый Bot API в отдельном потоке: getUpdates с long polling по очереди апдейтов,
+    остальные методы отвечают ok. Возвращает (base_url, loop, push), push(update) –
+    потокобезопасно добавить апдейт.
+    """
+    import threading
+    from collections import deque
+    from aiohttp import web
+
+    pending = deque()
+    started = threading.Event()
+    state = {}
+
+    async def api(request):
+        method = request.match_info['method']
+        if method.lower() != 'getupdates':
+            return web.json_response({'ok': True, 'result': True})
+        params = dict(await request.post())
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        while pending and pending[0]['update_id'] < offset:
+            pending.popleft()
+        if not pending:
+            state['arrived'].clear()
+            try:
+                await asyncio.wait_for(state['arrived'].wait(), timeout=float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return web.json_response({'ok': True, 'result': list(pending)[:limit]})
+
+    async def run():
+        state['arrived'] = asyncio.Event()
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', api)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        state['port'] = site._server.sockets[0].getsockname()[1]
+        started.set()
+        await asyncio.Event().wait()
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_until_complete, args=(run(),), daemon=True).start()
+    started.wait()
+
+    def push(update):
+        def add():
+            pending.append(update)
+            state['arrived'].set()
+        loop.call_soon_threadsafe(add)
+
+    return f"http://127.0.0.1:{state['port']}", loop, push
+
+
+def bench_webhook(args):
+    import itertools
+    import socket
+    import aiohttp
+    from aiogram import Bot, Dispatcher
+    from aiogram.bot.api import TelegramAPIServer
+    from bot.dispatch_queue import ChatDispatchQueue, poll_updates
+    from bot.webhook import WebhookServer
+
+    base_url, api_loop, push = _start_fake_bot_api()
+
+    # Сквозная нумерация: апдейты прошлого режима могли остаться в фейковом API
+    update_ids = itertools.count(1)
+
+    async def produce(send):
+        """Генератор апдейтов с постоянной частотой (работает в потоке фейкового API)."""
+        produced = {}
+        started = time.monotonic()
+        tasks = []
+        for i in range(1, args.updates + 1):
+            delay = started + i / args.rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = _synthetic_update(next(update_ids))
+            produced[update['update_id']] = time.monotonic()
+            tasks.append(asyncio.ensure_future(send(update)))
+        await asyncio.gather(*tasks)
+        return produced
+
+    def run_mode(name, dispatch_updates):
+        async def drive():
+            bot = Bot(token=BENCH_TOKEN, server=TelegramAPIServer.from_base(base_url))
+            dp = Dispatcher(bot)
+            done = {}
+
+            async def on_message(message):
+                await asyncio.sleep(args.handler_ms / 1000)
+                done[message.message_id] = time.monotonic()
+
+            dp.register_message_handler(on_message)
+            produced, extra, stop = await dispatch_updates(dp)
+            while len(done) < args.updates:
+                await asyncio.sleep(0.01)
+            await stop()
+            await (await bot.get_session()).close()
+            latencies = [done[i] - produced[i] for i in produced]
+            report(name, latencies, max(done.values()) - min(produced.values()))
+            if extra:
+                print(f"             {extra()}")
+        asyncio.run(drive())
+
+    def queue_stats(dispatch):
+        stats = dispatch.stats()['handlers'].get('/random_word', {})
+        return (f"ожидание в очереди: сред. {stats.get('avg_wait_ms', 0):.1f} мс, "
+                f"макс. {stats.get('max_wait_ms', 0):.1f} мс")
+
+    async def aiogram_polling(dp):
+        # Встроенный start_polling aiogram с параметрами по умолчанию
+        poller = asyncio.ensure_future(dp.start_polling())
+
+        async def send(update):
+            push(update)
+        produced = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(produce(send), api_loop))
+
+        async def stop():
+            dp.stop_polling()
+            poller.cancel()
+        return produced, None, stop
+
+    async def polling(dp):
+        # Как bot/main.py: poll_updates и очередь по чатам
+        dispatch = ChatDispatchQueue(workers=args.workers, max_pending=args.queue_size)
+        dispatch.start(dp)
+        poller = asyncio.ensure_future(poll_updates(dp, dispatch))
+
+        async def send(update):
+            push(update)
+        produced = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(produce(send), api_loop))
+
+        async def stop():
+            poller.cancel()
+            await dispatch.close()
+        return produced, lambda: queue_stats(dispatch), stop
+
+    async def webhook(dp):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        dispatch = ChatDispatchQueue(workers=args.workers, max_pending=args.queue_size)
+        dispatch.start(dp)
+        server = WebhookServer(dispatch)
+        await server.start('127.0.0.1', port)
+        url = f"http://127.0.0.1:{port}{server.path}"
+        acks = []
+
+        async def produce_over_http():
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100)) as session:
+                async def send(update):
+                    while True:
+                        t0 = time.monotonic()
+                        async with session.post(url, json=update) as response:
+                            acks.append(time.monotonic() - t0)
+                            if response.status != 503:
+                                return
+                        # Как Telegram: повтор доставки после отказа
+                        await asyncio.sleep(float(response.headers.get('Retry-After', 1)))
+                return await produce(send)
+
+        produced = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(produce_over_http(), api_loop))
+
+        async def stop():
+            await server.close()
+            await dispatch.close()
+        return produced, lambda: (f"ответ Telegram: p50={percentile(acks, 50) * 1000:.2f} мс "
+                                  f"p99={percentile(acks, 99) * 1000:.2f} мс; 503: {server.rejected}; "
+                                  f"{queue_stats(dispatch)}"), stop
+
+    print(f"{args.updates} апдейтов, {args.rate:.0f}/с, обработчик {args.handler_ms} мс")
+    run_mode("aiogram", aiogram_polling)
+    run_mode("polling", polling)
+    run_mode("webhook", webhook)
+
+
+def bench_audio(args):
+    import requests
+    from bot.audio_fetch import AudioFetcher
+
+    async def drive():
+        base_url, hits = _start_audio_server(args.delay_ms / 1000)
+        # Нажатия приходят одновременно; слов меньше, чем нажатий – часть совпадает
+        words = [f"sõna{i % args.words}" for i in range(args.presses)]
+
+        async def blocking(word):
+            t0 = time.perf_counter()
+            requests.get(f"{base_url}/{word}.mp3").content
+            return time.perf_counter() - t0
+
+        loop_started = time.perf_counter()
+        latencies = await asyncio.gather(*(blocking(word) for word in words))
+        # Задержка пользователя – от нажатия до ответа: блокирующие вызовы идут по очереди
+        queued = [sum(latencies[:i + 1]) for i in range(len(latencies))]
+        report("до", queued, time.perf_counter() - loop_started)
+        blocking_hits = sum(hits.values())
+
+        hits.clear()
+        fetcher = AudioFetcher()
+
+        async def pooled(word):
+            t0 = time.perf_counter()
+            await fetcher.fetch(f"{base_url}/{word}.mp3")
+            return time.perf_counter() - t0
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(pooled(word) for word in words))
+        report("после", latencies, time.perf_counter() - started)
+        print(f"запросов к серверу: до {blocking_hits}, после {sum(hits.values())} "
+              f"(single-flight: {fetcher.shared} нажатий без своего запроса)")
+        await fetcher.close()
+
+    asyncio.run(drive())
+
+
+def bench_import(args):
+    import csv
+    import random
+    from bot.database import SessionLocal, Word, init_db
+    from import_words import import_words, print_report, read_rows
+
+    init_db()
+    parts = ["nimisõna", "tegusõna", "omadussõna", "määrsõna"]
+    path = os.path.join(_tmp_dir, "corpus.csv")
+
+    def write_corpus(changed_share=0.0):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["word_et", "part_of_speech", "translation", "ai_generated_text"])
+            for i in range(args.rows):
+                version = 2 if random.random() < changed_share else 1
+                writer.writerow([f"sõna{i}", parts[i % len(parts)], f"перевод{i}.{version}", f"Пример {i}"])
+
+    write_corpus()
+    # «До»: запрос на каждую строку и session.add, как в прежнем import_words.py
+    session = SessionLocal()
+    started = time.perf_counter()
+    legacy = 0
+    for word_et, part_of_speech, translation, ai_generated_text in read_rows(path):
+        if legacy >= args.legacy_rows:
+            break
+        legacy += 1
+        if session.query(Word).filter_by(word_et=word_et, part_of_speech=part_of_speech).first():
+            continue
+        session.add(Word(word_et=word_et, part_of_speech=part_of_speech, translation=translation,
+                         ai_generated_text=ai_generated_text))
+    session.rollback()
+    session.close()
+    elapsed = time.perf_counter() - started
+    print(f"до           {legacy} строк за {elapsed:.2f} с, {legacy / elapsed:.0f} строк/с")
+    for name, changed_share in (("после: новые", 0.0), ("после: 10% изменено", 0.1)):
+        if changed_share:
+            write_corpus(changed_share)
+        stats = import_words(path, batch_size=args.batch_size)
+        print(name)
+        print_report(stats)
+
+
+def bench_snapshot(args):
+    import random
+    from sqlalchemy import insert
+    from bot.database import SessionLocal, Word, init_db
+    from bot.catalog import CatalogStore
+
+    init_db()
+    parts = ["nimisõna", "tegusõna", "omadussõna", "määrsõna"]
+    session = SessionLocal()
+    if session.query(Word).count() < args.words:
+        session.execute(insert(Word.__table__), [
+            {'word_et': f"sõna{i}", 'part_of_speech': parts[i % len(parts)], 'translation': f"перевод{i}",
+             'ai_generated_text': f"Пример использования слова sõna{i} в предложении.", 'repeat_more': False}
+            for i in range(args.words)
+        ])
+        session.commit()
+    path = os.path.join(_tmp_dir, "catalog.snapshot")
+    for name, store in (("до", CatalogStore("")), ("после", CatalogStore(path))):
+        if store.snapshot_path:
+            store.load(session)  # первый запуск собирает снимок
+        started = time.perf_counter()
+        catalog = store.load(session)
+        elapsed = time.perf_counter() - started
+        keys = [(word.word_et, word.part_of_speech) for word in random.sample(catalog.words, 10000)]
+        latencies = []
+        for key in keys:
+            t0 = time.perf_counter()
+            assert catalog.find(*key) is not None
+            latencies.append(time.perf_counter() - t0)
+        print(f"{name:<12} загрузка {len(catalog)} слов: {elapsed * 1000:8.1f} мс")
+        report("  find", latencies)
+    print(f"размер снимка: {os.path.getsize(path) / 1e6:.1f} МБ")
+    session.close()
+
+
+def bench_callbacks(args):
+    import random
+    from aiogram import Bot, Dispatcher, types
+    from bot.callbacks import (callback_router, MENU, HELP, SETTINGS, START_MAILING, RANDOM_WORD, RANDOM_TEST,
+                               PROGRESS, TOGGLE_REPEAT, PLAY, TEST_ANSWER, TEST_ANSWER_REV)
+
+    # Смесь нажатий: в основном ответы в тестах и «Послушать слово», реже меню
+    words = [f"{random.choice(['', 'kõige', 'ülikooli'])}sõna{i}" for i in range(2000)]
+    presses = []
+    for _ in range(args.presses):
+        word_id = random.randrange(len(words))
+        option, correct_index = random.randrange(4), random.randrange(4)
+        kind = random.choices(range(5), weights=[40, 15, 20, 10, 15])[0]
+        if kind == 0:
+            presses.append((f"test_answer:{word_id}:{option}:{correct_index}",
+                            TEST_ANSWER.data(word_id, option, option == correct_index)))
+        elif kind == 1:
+            presses.append((f"test_answer_rev:{word_id}:{option}:{correct_index}",
+                            TEST_ANSWER_REV.data(word_id, option, option == correct_index)))
+        elif kind == 2:
+            presses.append((f"play:{words[word_id]}", PLAY.data(word_id)))
+        elif kind == 3:
+            presses.append((f"toggle_repeat:{word_id}", TOGGLE_REPEAT.data(word_id)))
+        else:
+            name, callback_type = random.choice([("menu", MENU), ("help", HELP), ("settings", SETTINGS),
+                                                 ("startmailing", START_MAILING), ("random_word", RANDOM_WORD),
+                                                 ("random_test", RANDOM_TEST), ("progress", PROGRESS)])
+            presses.append((name, callback_type.data()))
+
+    def legacy_route(data):
+        # Прежний путь: фильтры зарегистрированных обработчиков по порядку, затем цепочка startswith
+        if data == "help" or data == "settings" or data == "menu":
+            return data, ()
+        if data.startswith("play:"):
+            return "play", (data.split(":", 1)[1],)
+        if data.startswith("toggle_repeat:"):
+            return "toggle_repeat", (int(data.split(":", 1)[1]),)
+        if data.startswith("test_answer:") or data.startswith("test_answer_rev:"):
+            _, word_id, selected, correct = data.split(":")
+            return "test_answer", (int(word_id), selected == correct)
+        if data in ("random_test", "startmailing", "random_word", "progress"):
+            return data, ()
+        return None, ()
+
+    def router_route(data):
+        callback_type, values = callback_router.decode(data)
+        return callback_router._handlers.get(callback_type.opcode), values
+
+    for name, route, index in (("до", legacy_route, 0), ("после", router_route, 1)):
+        latencies = []
+        started = time.perf_counter()
+        for press in presses:
+            t0 = time.perf_counter()
+            route(press[index])
+            latencies.append(time.perf_counter() - t0)
+        report(name, latencies, time.perf_counter() - started)
+        sizes = [len(press[index].encode('utf-8')) for press in presses]
+        print(f"{'':<12} в среднем {sum(latencies) / len(latencies) * 1e6:.2f} мкс на нажатие; callback_data: "
+              f"средняя длина {sum(sizes) / len(sizes):.1f} байт, максимум {max(sizes)}")
+
+    # Полный путь через диспетчер aiogram: фильтры обработчиков против одного роутера
+    async def noop(callback_query, *values):
+        pass
+
+    async def through_dispatcher():
+        bot = Bot(token=BENCH_TOKEN)
+        results = {}
+        for name, index in (("до", 0), ("после", 1)):
+            dp = Dispatcher(bot)
+            if index == 0:
+                dp.register_callback_query_handler(noop, lambda c: c.data == "help")
+                dp.register_callback_query_handler(noop, lambda c: c.data == "settings")
+                dp.register_callback_query_handler(noop, lambda c: c.data == "menu")
+                dp.register_callback_query_handler(noop, lambda c: c.data is not None and not c.data.startswith("play:"))
+                dp.register_callback_query_handler(noop, lambda c: c.data is not None and c.data.startswith("play:"))
+            else:
+                for callback_type in (MENU, HELP, SETTINGS, START_MAILING, RANDOM_WORD, RANDOM_TEST, PROGRESS,
+                                      TOGGLE_REPEAT, PLAY, TEST_ANSWER, TEST_ANSWER_REV):
+                    callback_router.register(callback_type, noop)
+                dp.register_callback_query_handler(callback_router.dispatch)
+            updates = [types.Update(**{
+                'update_id': i,
+                'callback_query': {'id': str(i), 'chat_instance': "bench", 'data': press[index],
+                                   'from': {'id': 1, 'is_bot': False, 'first_name': "bench"}},
+            }) for i, press in enumerate(presses)]
+            latencies = []
+            started = time.perf_counter()
+            for update in updates:
+                t0 = time.perf_counter()
+                await dp.process_update(update)
+                latencies.append(time.perf_counter() - t0)
+            results[name] = (latencies, time.perf_counter() - started)
+        await (await bot.get_session()).close()
+        return results
+
+    print("через Dispatcher.process_update:")
+    for name, (latencies, elapsed) in asyncio.run(through_dispatcher()).items():
+        report(name, latencies, elapsed)
+        print(f"{'':<12} в среднем {sum(latencies) / len(latencies) * 1e6:.2f} мкс на нажатие")
+    print(f"роутер: {callback_router.stats()}")
+
+
+def bench_questions(args):
+    import random
+    from bot.catalog import word_catalog
+    from bot.questions import QuestionPool, build_question, TEST_TYPES, TEST_WEIGHTS
+
+    seed_words(args.words)
+    word_catalog.current
+    chats = [str(100000 + i) for i in range(args.users)]
+
+    def legacy_take(chat_id):
+        # Прежний путь: вопрос собирается на месте, без учёта предыдущих вопросов пользователя
+        return build_question(random.choices(TEST_TYPES, weights=TEST_WEIGHTS)[0])
+
+    async def run(take):
+        latencies = []
+        last, repeats = {}, 0
+        started = time.perf_counter()
+        for i in range(args.takes):
+            # Нажатия идут с частотой --rate; в паузах фоновая задача дособирает пул
+            delay = started + i / args.rate - time.perf_counter()
+            await asyncio.sleep(max(delay, 0))
+            chat_id = random.choice(chats)
+            t0 = time.perf_counter()
+            question = take(chat_id)
+            latencies.append(time.perf_counter() - t0)
+            repeats += last.get(chat_id) == question.word_id
+            last[chat_id] = question.word_id
+        return latencies, time.perf_counter() - started, repeats
+
+    async def main():
+        pool = QuestionPool(size=args.pool_size, batch=args.batch)
+        pool.start()
+        await asyncio.sleep(0.5)
+        results = [("до", await run(legacy_take)), ("после", await run(pool.take))]
+        await pool.close()
+        return results, pool.stats()
+
+    results, stats = asyncio.run(main())
+    for name, (latencies, elapsed, repeats) in results:
+        report(name, latencies, elapsed)
+        print(f"{'':<12} в среднем {sum(latencies) / len(latencies) * 1e6:.1f} мкс на вопрос; "
+              f"то же слово подряд: {repeats}")
+    print(f"пул: {stats}")
+
+
+def bench_metrics(args):
+    import random
+    from aiogram import Bot, Dispatcher, types
+    from sqlalchemy import create_engine, text
+    from bot.callbacks import callback_router, MENU, TEST_ANSWER
+    from bot.dispatch_queue import handler_key
+    from bot.metrics import metrics, Histogram, HandlerMetricsMiddleware, instrument_engine
+
+    histogram = Histogram("bench_seconds", "бенчмарк", ("kind",))
+    kinds = [f"kind{i}" for i in range(20)]
+    values = [(random.expovariate(20), random.choice(kinds)) for _ in range(args.events)]
+    started = time.perf_counter()
+    for value, kind in values:
+        histogram.observe(value, kind)
+    elapsed = time.perf_counter() - started
+    print(f"Histogram.observe: {elapsed / args.events * 1e6:.2f} мкс на событие")
+
+    statements = min(args.events, 20000)
+    for name, instrumented in (("до", False), ("после", True)):
+        engine = create_engine(f"sqlite:///{os.path.join(_tmp_dir, f'metrics_{name}.db')}")
+        if instrumented:
+            instrument_engine(engine)
+        with engine.connect() as conn:
+            query = text("SELECT 1")
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(statements):
+                t0 = time.perf_counter()
+                conn.execute(query).scalar()
+                latencies.append(time.perf_counter() - t0)
+        report(f"SQL {name}", latencies, time.perf_counter() - started)
+        engine.dispose()
+
+    async def noop(callback_query, *values):
+        pass
+
+    async def through_dispatcher():
+        bot = Bot(token=BENCH_TOKEN)
+        for callback_type in (MENU, TEST_ANSWER):
+            callback_router.register(callback_type, noop)
+        presses = [TEST_ANSWER.data(i % 2000, i % 4, i % 4 == 0) if i % 3 else MENU.data()
+                   for i in range(statements)]
+        updates = [types.Update(**{
+            'update_id': i,
+            'callback_query': {'id': str(i), 'chat_instance': "bench", 'data': data,
+                               'from': {'id': 1, 'is_bot': False, 'first_name': "bench"}},
+        }) for i, data in enumerate(presses)]
+        results = []
+        for name, instrumented in (("до", False), ("после", True)):
+            dp = Dispatcher(bot)
+            if instrumented:
+                dp.middleware.setup(HandlerMetricsMiddleware(handler_key))
+            dp.register_callback_query_handler(callback_router.dispatch)
+            latencies = []
+            started = time.perf_counter()
+            for update in updates:
+                t0 = time.perf_counter()
+                await dp.process_update(update)
+                latencies.append(time.perf_counter() - t0)
+            results.append((name, latencies, time.perf_counter() - started))
+        await (await bot.get_session()).close()
+        return results
+
+    print("Dispatcher.process_update нажатия:")
+    for name, latencies, elapsed in asyncio.run(through_dispatcher()):
+        report(name, latencies, elapsed)
+        print(f"{'':<12} в среднем {sum(latencies) / len(latencies) * 1e6:.2f} мкс на нажатие")
+
+    metrics._metrics.append(histogram)
+    started = time.perf_counter()
+    body = metrics.render()
+    print(f"/metrics: {len(body.splitlines())} строк, {len(body)} байт за {(time.perf_counter() - started) * 1000:.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+    db = commands.add_parser("db", help="задержка обработки апдейтов при медленной БД")
+    db.add_argument("--updates", type=int, default=200)
+    db.add_argument("--latency-ms", type=float, default=5)
+    db.add_argument("--rate", type=float, default=200, help="апдейтов в секунду")
+    db.set_defaults(func=bench_db)
+    render = commands.add_parser("render", help="стоимость подготовки карточки слова")
+    render.add_argument("--words", type=int, default=1800)
+    render.add_argument("--sends", type=int, default=20000)
+    render.set_defaults(func=bench_render)
+    audio = commands.add_parser("audio", help="загрузка аудио при одновременных нажатиях")
+    audio.add_argument("--presses", type=int, default=200)
+    audio.add_argument("--words", type=int, default=50, help="сколько разных слов среди нажатий")
+    audio.add_argument("--delay-ms", type=float, default=50, help="задержка ответа сервера")
+    audio.set_defaults(func=bench_audio)
+    imp = commands.add_parser("import", help="импорт словаря из CSV")
+    imp.add_argument("--rows", type=int, default=500000)
+    imp.add_argument("--legacy-rows", type=int, default=20000, help="строк для прежнего построчного импорта")
+    imp.add_argument("--batch-size", type=int, default=5000)
+    imp.set_defaults(func=bench_import)
+    snapshot = commands.add_parser("snapshot", help="загрузка каталога слов при старте")
+    snapshot.add_argument("--words", type=int, default=200000)
+    snapshot.set_defaults(func=bench_snapshot)
+    webhook = commands.add_parser("webhook", help="приём апдейтов: polling против webhook")
+    webhook.add_argument("--updates", type=int, default=3000)
+    webhook.add_argument("--rate", type=float, default=1000, help="апдейтов в секунду")
+    webhook.add_argument("--handler-ms", type=float, default=5, help="время работы обработчика")
+    webhook.add_argument("--queue-size", type=int, default=1000)
+    webhook.add_argument("--workers", type=int, default=64)
+    webhook.set_defaults(func=bench_webhook)
+    callbacks = commands.add_parser("callbacks", help="разбор callback_data и выбор обработчика")
+    callbacks.add_argument("--presses", type=int, default=100000)
+    callbacks.set_defaults(func=bench_callbacks)
+    questions = commands.add_parser("questions", help="выдача тестов: сборка на месте против пула")
+    questions.add_argument("--words", type=int, default=1800)
+    questions.add_argument("--users", type=int, default=50)
+    questions.add_argument("--takes", type=int, default=20000)
+    questions.add_argument("--rate", type=float, default=1000, help="тестов в секунду")
+    questions.add_argument("--pool-size", type=int, default=200)
+    questions.add_argument("--batch", type=int, default=50)
+    questions.set_defaults(func=bench_questions)
+    metrics = commands.add_parser("metrics", help="цена метрик на событие")
+    metrics.add_argument("--events", type=int, default=200000)
+    metrics.set_defaults(func=bench_metrics)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# bot/answer_log.py
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.sql import func
+from bot.catalog import word_catalog
+from bot.database import SessionLocal, UserWordStatus, run_db, upsert_insert
+from bot.srs import apply_answers
+from config.settings import ANSWER_FLUSH_SECONDS, ANSWER_FLUSH_EVENTS
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerLog:
+    """
+    Отложенная запись ответов в тестах. Обработчик только кладёт ответ в буфер;
+    ответы схлопываются по (chat_id, word_id) в приращения счётчиков и новое состояние
+    интервального повторения и записываются одним upsert раз в flush_seconds секунд
+    или после flush_events ответов. При остановке бота (и при выходе интерпретатора)
+    буфер сбрасывается.
+    """
+
+    def __init__(self, flush_seconds: int = ANSWER_FLUSH_SECONDS, flush_events: int = ANSWER_FLUSH_EVENTS):
+        self.flush_seconds = flush_seconds
+        self.flush_events = flush_events
+        self._pending = {}  # (chat_id, word_id) -> [(оценка, время ответа), ...]
+        self._events = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # состояние SRS читается и пишется одним flush за раз
+        self._wake = None
+        self._task = None
+        # Метрики
+        self.recorded = 0
+        self.flushes = 0
+        self.flushed_events = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Сколько ответов ждёт записи."""
+        return self._events
+
+    def stats(self) -> dict:
+        return {'depth': self.depth, 'recorded': self.recorded, 'flushes': self.flushes,
+                'flushed_events': self.flushed_events, 'failed_flushes': self.failed_flushes,
+                'last_flush_seconds': self.last_flush_seconds, 'max_flush_seconds': self.max_flush_seconds}
+
+    def record(self, chat_id: str, word_id: int, quality: int, answered_at: datetime = None):
+        with self._lock:
+            self._pending.setdefault((chat_id, word_id), []).append((quality, answered_at or datetime.now()))
+            self._events += 1
+            self.recorded += 1
+            full = self._events >= self.flush_events
+        if full and self._wake is not None:
+            self._wake.set()
+
+    def flush(self, session, commit: bool = False) -> int:
+        """
+        Записывает накопленные ответы в сессию. С commit=True фиксирует транзакцию, не отпуская
+        _flush_lock: иначе следующий flush прочтёт ещё не зафиксированное состояние SRS.
+        Без него commit делает вызывающий.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                events, self._events = self._events, 0
+            if not pending:
+                return 0
+            started = time.monotonic()
+            try:
+                self._write(session, pending)
+                session.flush()
+                if commit:
+                    session.commit()
+            except Exception:
+                self.failed_flushes += 1
+                self._restore(pending, events)
+                raise
+            duration = time.monotonic() - started
+            self.flushes += 1
+            self.flushed_events += events
+            self.last_flush_seconds = duration
+            self.max_flush_seconds = max(self.max_flush_seconds, duration)
+            return events
+
+    def _write(self, session, pending):
+        chat_ids = {chat_id for chat_id, _ in pending}
+        word_ids = {word_id for _, word_id in pending}
+        current = {
+            (status.chat_id, status.word_id): status
+            for status in session.query(UserWordStatus).filter(
+                UserWordStatus.chat_id.in_(chat_ids), UserWordStatus.word_id.in_(word_ids))
+            if (status.chat_id, status.word_id) in pending
+        }
+        catalog = word_catalog.current
+        rows = []
+        for (chat_id, word_id), answers in pending.items():
+            status = current.get((chat_id, word_id))
+            record = catalog.get(word_id)
+            # Флаг «повторять чаще» пользователя, если он его менял, иначе – флаг слова
+            repeat_more = status.repeat_more if status and status.repeat_more is not None else \
+                bool(record and record.repeat_more)
+            interval, ease, reps, due_at = apply_answers(
+                status.srs_interval if status else None, status.srs_ease if status else None,
+                status.srs_reps if status else None, answers, repeat_more=repeat_more)
+            correct = sum(1 for quality, _ in answers if quality >= 3)
+            rows.append({
+                'chat_id': chat_id, 'word_id': word_id, 'sent_count': 0,
+                'correct_answers': correct, 'incorrect_answers': len(answers) - correct,
+                'srs_interval': interval, 'srs_ease': ease, 'srs_reps': reps, 'due_at': due_at,
+            })
+        insert = upsert_insert(session)
+        if insert is None:
+            # Запасной путь для СУБД без ON CONFLICT
+            for row in rows:
+                status = current.get((row['chat_id'], row['word_id']))
+                if status is None:
+                    session.add(UserWordStatus(**row))
+                    continue
+                status.correct_answers = (status.correct_answers or 0) + row['correct_answers']
+                status.incorrect_answers = (status.incorrect_answers or 0) + row['incorrect_answers']
+                status.srs_interval, status.srs_ease = row['srs_interval'], row['srs_ease']
+                status.srs_reps, status.due_at = row['srs_reps'], row['due_at']
+            return
+        stmt = insert(UserWordStatus).values(rows)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[UserWordStatus.chat_id, UserWordStatus.word_id],
+            set_={
+                'correct_answers': func.coalesce(UserWordStatus.correct_answers, 0) + stmt.excluded.correct_answers,
+                'incorrect_answers': func.coalesce(UserWordStatus.incorrect_answers, 0) + stmt.excluded.incorrect_answers,
+                'srs_interval': stmt.excluded.srs_interval,
+                'srs_ease': stmt.excluded.srs_ease,
+                'srs_reps': stmt.excluded.srs_reps,
+                'due_at': stmt.excluded.due_at,
+            },
+        ))
+
+    def _restore(self, pending, events):
+        # Не теряем ответы: более ранние идут перед пришедшими за время записи
+        with self._lock:
+            for key, answers in pending.items():
+                self._pending[key] = answers + self._pending.get(key, [])
+            self._events += events
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._events:
+                continue
+            try:
+                await run_db(self.flush, commit=True)
+            except Exception:
+                logger.exception(f"Ошибка при записи ответов в тестах (в буфере {self.depth})")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await run_db(self.flush, commit=True)
+
+    def flush_now(self):
+        """Синхронная запись остатка буфера – для выхода интерпретатора без штатной остановки."""
+        if not self._events:
+            return
+        session = SessionLocal()
+        try:
+            self.flush(session, commit=True)
+        except Exception:
+            session.rollback()
+            logger.exception("Ошибка при записи ответов в тестах при выходе")
+        finally:
+            session.close()
+
+
+answer_log = AnswerLog()
+atexit.register(answer_log.flush_now)
@@ -0,0 +1,141 @@
+# bot/audio_cache.py
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from bot.database import AudioFile, run_db
+from config.settings import AUDIO_REVALIDATE_SECONDS, AUDIO_MISS_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class AudioCache:
+    """
+    Слово -> file_id аудио, уже загруженного в Telegram: повторное «Послушать слово»
+    отправляется по file_id без скачивания и загрузки mp3. Записи хранятся в таблице
+    audio_files и в памяти процесса; при первом обращении таблица читается целиком.
+    Вместе с file_id запоминаются ETag/Last-Modified исходного файла – раз в
+    AUDIO_REVALIDATE_SECONDS они сверяются условным HEAD-запросом, и при изменении
+    файла запись удаляется (следующее нажатие загрузит новый файл).
+    Промах в БД запоминается на miss_seconds: повторные нажатия на слово без file_id
+    не ходят в БД; remember() сразу снимает отметку.
+    """
+    MAX_MISSES = 10000
+
+    def __init__(self, revalidate_seconds: int = AUDIO_REVALIDATE_SECONDS, miss_seconds: int = AUDIO_MISS_SECONDS):
+        self.revalidate_after = timedelta(seconds=revalidate_seconds)
+        self.miss_seconds = miss_seconds
+        self._entries = {}  # word_et -> AudioFile (отсоединённые от сессии)
+        self._misses = {}   # word_et -> monotonic-время, до которого не искать file_id в БД
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._revalidating = set()
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    def load(self, session):
+        entries = {row.word_et: row for row in session.query(AudioFile).all()}
+        with self._lock:
+            self._entries = entries
+            self._misses.clear()
+            self._loaded = True
+        return len(entries)
+
+    def _recent_miss(self, word: str) -> bool:
+        expires_at = self._misses.get(word)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def _remember_miss(self, word: str):
+        now = time.monotonic()
+        with self._lock:
+            self._misses.pop(word, None)
+            self._misses[word] = now + self.miss_seconds
+            # Срок у всех отметок одинаковый – самые старые в начале словаря
+            while len(self._misses) > self.MAX_MISSES or next(iter(self._misses.values())) <= now:
+                del self._misses[next(iter(self._misses))]
+
+    async def get(self, word: str, count: bool = True):
+        if not self._loaded:
+            await run_db(self.load)
+        entry = self._entries.get(word)
+        if entry is None and not self._recent_miss(word):
+            # file_id мог появиться позже загрузки таблицы – его загрузил
+            # предварительный прогрев в процессе-планировщике (bot/audio_prewarm.py)
+            entry = await run_db(_load_entry, word)
+            if entry is not None:
+                with self._lock:
+                    self._entries.setdefault(word, entry)
+            elif self.miss_seconds > 0:
+                self._remember_miss(word)
+        if count:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'invalidated': self.invalidated,
+                'known_missing': len(self._misses)}
+
+    def peek(self, word: str):
+        """Запись из памяти процесса, без обращения к БД."""
+        return self._entries.get(word)
+
+    async def remember(self, word: str, file_id: str, etag: str = None, last_modified: str = None):
+        entry = AudioFile(word_et=word, file_id=file_id, etag=etag, last_modified=last_modified,
+                          checked_at=datetime.now())
+        with self._lock:
+            self._entries[word] = entry
+            self._misses.pop(word, None)
+        await run_db(_save_entry, entry)
+
+    async def invalidate(self, word: str):
+        with self._lock:
+            entry = self._entries.pop(word, None)
+        if entry is not None:
+            self.invalidated += 1
+            await run_db(_delete_entry, word)
+
+    def needs_revalidation(self, entry) -> bool:
+        return entry.checked_at is None or datetime.now() - entry.checked_at > self.revalidate_after
+
+    def revalidate_later(self, word: str, entry, url: str, fetcher):
+        """Фоновая сверка исходного файла; пользователь уже получил аудио по file_id."""
+        if word in self._revalidating or not self.needs_revalidation(entry):
+            return
+        self._revalidating.add(word)
+        asyncio.ensure_future(self._revalidate(word, entry, url, fetcher))
+
+    async def _revalidate(self, word: str, entry, url: str, fetcher):
+        try:
+            modified = await fetcher.is_modified(url, entry.etag, entry.last_modified)
+            if modified:
+                logger.info(f"Аудио «{word}» изменилось – file_id сброшен")
+                await self.invalidate(word)
+            elif modified is False:
+                entry.checked_at = datetime.now()
+                await run_db(_save_entry, entry)
+        except Exception as e:
+            logger.exception(f"Ошибка при проверке аудио «{word}»")
+        finally:
+            self._revalidating.discard(word)
+
+
+def _load_entry(session, word: str):
+    return session.get(AudioFile, word)
+
+
+def _save_entry(session, entry):
+    session.merge(AudioFile(word_et=entry.word_et, file_id=entry.file_id, etag=entry.etag,
+                            last_modified=entry.last_modified, checked_at=entry.checked_at))
+
+
+def _delete_entry(session, word: str):
+    session.query(AudioFile).filter_by(word_et=word).delete()
+
+
+audio_cache = AudioCache()
@@ -0,0 +1,145 @@
+# bot/audio_fetch.py
+import asyncio
+import logging
+import os
+from collections import namedtuple
+import aiohttp
+from config.settings import AUDIO_CONCURRENCY, AUDIO_TIMEOUT_SECONDS, AUDIO_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Получаем базовый URL для аудиофайлов из переменной окружения,
+# иначе используем значение по умолчанию.
+AUDIO_BASE_URL = os.getenv('AUDIO_BASE_URL', 'https://storage.googleapis.com/eesti-bot-project')
+
+def get_audio_url(word: str) -> str:
+    """
+    Формирует URL аудиофайла по шаблону:
+    https://storage.googleapis.com/eesti-bot-project/<слово>.mp3
+    """
+    filename = f"{word}.mp3"
+    return f"{AUDIO_BASE_URL}/{filename}"
+
+# Ответы, после которых имеет смысл повторить запрос
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Скачанный файл и валидаторы кэша исходного файла
+AudioDownload = namedtuple('AudioDownload', ['content', 'etag', 'last_modified'])
+
+
+class AudioFetchError(Exception):
+    """Аудио не удалось скачать даже после повторов."""
+
+
+class AudioFetcher:
+    """
+    Асинхронная загрузка аудиофайлов по HTTP. Одна ClientSession на процесс
+    (keep-alive соединения переиспользуются), таймаут на каждый запрос, не больше
+    limit одновременных загрузок, повторы при сетевых ошибках и 5xx. Если несколько
+    пользователей одновременно слушают одно и то же слово, файл скачивается один раз
+    (single-flight), остальные ждут тот же результат.
+    """
+
+    def __init__(self, limit: int = AUDIO_CONCURRENCY, timeout: float = AUDIO_TIMEOUT_SECONDS,
+                 retries: int = AUDIO_RETRIES):
+        self.limit = limit
+        self.timeout = timeout
+        self.retries = retries
+        self._session = None
+        self._semaphore = None
+        self._inflight = {}  # url -> asyncio.Task
+        # Метрики
+        self.requests = 0
+        self.shared = 0
+        self.retried = 0
+        self.failures = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=min(self.timeout, 5)),
+            )
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._session
+
+    async def fetch(self, url: str):
+        """AudioDownload; None, если файла нет (404). AudioFetchError – если сервер недоступен."""
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        else:
+            self.shared += 1
+        # shield: отмена одного ожидающего не отменяет загрузку для остальных
+        return await asyncio.shield(task)
+
+    async def _fetch(self, url: str):
+        session = self._get_session()
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.retried += 1
+                    await asyncio.sleep(min(0.2 * 2 ** attempt, 2))
+                self.requests += 1
+                try:
+                    async with session.get(url) as response:
+                        if response.status == 404:
+                            return None
+                        if response.status in TRANSIENT_STATUSES:
+                            error = f"HTTP {response.status}"
+                            continue
+                        response.raise_for_status()
+                        return AudioDownload(await response.read(), response.headers.get('ETag'),
+                                             response.headers.get('Last-Modified'))
+                except (aiohttp.ClientConnectionError, aiohttp.ServerTimeoutError, asyncio.TimeoutError) as e:
+                    error = f"{e.__class__.__name__}: {e}"
+                except aiohttp.ClientResponseError as e:
+                    # 4xx кроме 404 повторять бессмысленно
+                    self.failures += 1
+                    raise AudioFetchError(f"{url}: HTTP {e.status}") from e
+        self.failures += 1
+        logger.warning(f"Не удалось скачать {url} за {self.retries + 1} попыток: {error}")
+        raise AudioFetchError(f"{url}: {error}")
+
+    async def is_modified(self, url: str, etag: str = None, last_modified: str = None):
+        """
+        Условный HEAD-запрос: True – файл изменился или пропал, False – не изменился,
+        None – проверить не удалось (сеть, нет валидаторов).
+        """
+        if not etag and not last_modified:
+            return None
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        session = self._get_session()
+        try:
+            async with self._semaphore:
+                async with session.head(url, headers=headers) as response:
+                    if response.status == 304:
+                        return False
+                    if response.status == 404:
+                        return True
+                    if response.status != 200:
+                        return None
+                    if etag and response.headers.get('ETag'):
+                        return response.headers['ETag'] != etag
+                    return response.headers.get('Last-Modified') != last_modified
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Не удалось проверить {url}: {e.__class__.__name__}: {e}")
+            return None
+
+    def stats(self) -> dict:
+        return {'inflight': len(self._inflight), 'requests': self.requests, 'shared': self.shared,
+                'retried': self.retried, 'failures': self.failures}
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+audio_fetcher = AudioFetcher()
@@ -1,54 +1,93 @@
 # bot/audio_handlers.py
-import os
-import requests
+import logging
 from io import BytesIO
 from aiogram import types
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-
-# Получаем базовый URL для аудиофайлов из переменной окружения,
-# иначе используем значение по умолчанию.
-AUDIO_BASE_URL = os.getenv('AUDIO_BASE_URL', 'https://storage.googleapis.com/eesti-bot-project')
-
-def get_audio_url(word: str) -> str:
-    """
-    Формирует URL аудиофайла по шаблону:
-    https://storage.googleapis.com/eesti-bot-project/<слово>.mp3
-    """
-    filename = f"{word}.mp3"
-    return f"{AUDIO_BASE_URL}/{filename}"
-
-async def send_word_audio(callback_query: types.CallbackQuery):
-    data = callback_query.data  # ожидается формат "play:<слово>"
+from aiogram.utils.exceptions import BadRequest, InvalidQueryID
+from bot.audio_fetch import audio_fetcher, get_audio_url
+from bot.audio_cache import audio_cache
+from bot.audio_prewarm import audio_prewarmer
+from bot.callbacks import callback_router, PLAY
+from bot.catalog import word_catalog
+
+logger = logging.getLogger(__name__)
+
+# Ошибки Bot API, после которых сохранённый file_id больше не годится
+FILE_ID_ERRORS = ('wrong file identifier', 'wrong remote file id', 'file reference expired')
+
+def is_file_id_error(error: BadRequest) -> bool:
+    text = str(error).lower()
+    return any(marker in text for marker in FILE_ID_ERRORS)
+
+async def answer_callback(callback_query: types.CallbackQuery, text: str = None):
+    """Ответ на нажатие; устаревший callback (бот долго отвечал) не мешает уже отправленному аудио."""
     try:
-        prefix, word = data.split(":", 1)
-    except ValueError:
-        await callback_query.answer("Некорректные данные!")
+        await callback_query.answer(text)
+    except InvalidQueryID as e:
+        logger.warning(f"Не удалось ответить на нажатие: {e}")
+
+async def send_word_audio(callback_query: types.CallbackQuery, word_id: int):
+    # В callback_data – id слова (bot/callbacks.py), само слово берём из каталога
+    word_obj = word_catalog.current.get(word_id)
+    if word_obj is None:
+        await callback_query.answer("Слово не найдено!")
         return
+    word = word_obj.word_et
 
     audio_url = get_audio_url(word)
-    try:
-        response = requests.get(audio_url)
-        response.raise_for_status()
-    except Exception as e:
-        await callback_query.answer("Аудиофайл не найден!")
+    # Уже загружали в Telegram – отправляем по file_id, без скачивания и загрузки
+    entry = await audio_cache.get(word)
+    if entry is not None:
+        try:
+            await callback_query.message.answer_audio(audio=entry.file_id, title=word)
+        except BadRequest as e:
+            if not is_file_id_error(e):
+                # Кнопка не должна «крутиться», даже если ошибку разбирает уровень выше
+                await answer_callback(callback_query, "Не удалось отправить аудио")
+                raise
+            # Telegram не принял file_id (устарел, удалён) – загрузим файл заново
+            logger.warning(f"file_id аудио «{word}» отклонён: {e}")
+            await audio_cache.invalidate(word)
+        else:
+            await answer_callback(callback_query)
+            audio_prewarmer.record_click(word, ready=True)
+            audio_cache.revalidate_later(word, entry, audio_url, audio_fetcher)
+            return
+
+    # mp3 мог заранее скачать прогрев рассылки (bot/audio_prewarm.py)
+    download = audio_prewarmer.get_download(word)
+    audio_prewarmer.record_click(word, ready=download is not None)
+    if download is None:
+        try:
+            # Общий асинхронный клиент: не блокирует event loop и переиспользует соединения
+            download = await audio_fetcher.fetch(audio_url)
+        except Exception as e:
+            logger.exception(f"Ошибка при загрузке аудио {audio_url}")
+            download = None
+    if download is None:
+        await answer_callback(callback_query, "Аудиофайл не найден!")
         return
 
     # Читаем аудио как байты
-    audio_bytes = BytesIO(response.content)
+    audio_bytes = BytesIO(download.content)
     # Указываем имя файла (для передачи сохраняем расширение .mp3)
     audio_bytes.name = f"{word}.mp3"
     
     # Отправляем аудиофайл через send_audio (а не как голосовое сообщение),
     # чтобы избежать автоматического воспроизведения следующего аудио.
     # Параметр title задаёт название аудио (в нашем случае — слово без расширения)
-    await callback_query.message.answer_audio(
-        audio=types.InputFile(audio_bytes, filename=f"{word}.mp3"),
-        title=word
-    )
-    await callback_query.answer()
+    try:
+        sent = await callback_query.message.answer_audio(
+            audio=types.InputFile(audio_bytes, filename=f"{word}.mp3"),
+            title=word
+        )
+    except Exception:
+        await answer_callback(callback_query, "Не удалось отправить аудио")
+        raise
+    await answer_callback(callback_query)
+    if sent is not None and sent.audio is not None:
+        await audio_cache.remember(word, sent.audio.file_id, download.etag, download.last_modified)
+        audio_prewarmer.forget_download(word)
 
 def register_audio_handlers(dp):
-    dp.register_callback_query_handler(
-        send_word_audio,
-        lambda c: c.data is not None and c.data.startswith("play:")
-    )
+    # Нажатия принимает общий роутер callback_router, зарегистрированный в bot/handlers.py
+    callback_router.register(PLAY, send_word_audio)
@@ -0,0 +1,168 @@
+# bot/audio_prewarm.py
+import asyncio
+import logging
+from collections import OrderedDict
+from io import BytesIO
+from aiogram import Bot, types
+from bot.audio_cache import audio_cache
+from bot.audio_fetch import audio_fetcher, get_audio_url
+from bot.sender import message_sender
+from config.settings import AUDIO_CACHE_CHAT_ID, AUDIO_PREWARM_WORKERS, AUDIO_PREWARM_QUEUE, AUDIO_PREWARM_FILES
+
+logger = logging.getLogger(__name__)
+
+
+class AudioPrewarmer:
+    """
+    Предварительный прогрев аудио для слов из рассылки: «Послушать слово» обычно
+    нажимают через несколько секунд после карточки, и к этому моменту mp3 уже должен
+    быть готов. Рассылка кладёт слова в ограниченную очередь (переполнение – слово
+    пропускается, не задерживая рассылку); одно слово у многих пользователей
+    прогревается один раз. Обработчики очереди скачивают mp3 и:
+
+        при AUDIO_CACHE_CHAT_ID – загружают его в служебный чат и запоминают file_id
+        в audio_cache (работает и из процессов-планировщиков: file_id лежит в БД);
+        без него – держат последние max_downloads файлов в памяти процесса.
+
+    При нажатии обработчик сообщает, было ли аудио готово (record_click) – отсюда
+    доля попаданий прогрева (hit_rate).
+    """
+
+    def __init__(self, workers: int = AUDIO_PREWARM_WORKERS, queue_size: int = AUDIO_PREWARM_QUEUE,
+                 chat_id: str = AUDIO_CACHE_CHAT_ID, max_downloads: int = AUDIO_PREWARM_FILES):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.chat_id = chat_id
+        self.max_downloads = max_downloads
+        self._bot = None
+        self._queue = None
+        self._tasks = []
+        self._scheduled = set()         # слова в очереди и в работе
+        self._warmed = set()            # слова, которые подготовил прогрев
+        self._downloads = OrderedDict() # word -> AudioDownload (если служебного чата нет)
+        # Метрики
+        self.queued = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.warmed = 0
+        self.failed = 0
+        self.clicks = 0
+        self.ready_clicks = 0
+        self.prewarmed_clicks = 0
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._scheduled.clear()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Доля нажатий, когда аудио уже было готово (file_id или mp3 в памяти)."""
+        return self.ready_clicks / self.clicks if self.clicks else 0.0
+
+    def is_ready(self, word: str) -> bool:
+        return audio_cache.peek(word) is not None or word in self._downloads
+
+    def enqueue(self, words) -> int:
+        """Ставит слова в очередь прогрева, не дожидаясь его; возвращает число новых задач."""
+        if self._queue is None:
+            return 0
+        added = 0
+        for word in words:
+            if word in self._scheduled or self.is_ready(word):
+                self.deduplicated += 1
+                continue
+            try:
+                self._queue.put_nowait(word)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                continue
+            self._scheduled.add(word)
+            self.queued += 1
+            added += 1
+        return added
+
+    def get_download(self, word: str):
+        """mp3, скачанный прогревом (без служебного чата); None, если его нет."""
+        download = self._downloads.get(word)
+        if download is not None:
+            self._downloads.move_to_end(word)
+        return download
+
+    def forget_download(self, word: str):
+        """mp3 больше не нужен: после первой отправки слово отправляется по file_id."""
+        self._downloads.pop(word, None)
+
+    def record_click(self, word: str, ready: bool):
+        self.clicks += 1
+        if ready:
+            self.ready_clicks += 1
+            if word in self._warmed:
+                self.prewarmed_clicks += 1
+
+    def stats(self) -> dict:
+        return {'depth': self.depth, 'queued': self.queued, 'deduplicated': self.deduplicated,
+                'dropped': self.dropped, 'warmed': self.warmed, 'failed': self.failed,
+                'clicks': self.clicks, 'ready_clicks': self.ready_clicks,
+                'prewarmed_clicks': self.prewarmed_clicks, 'hit_rate': self.hit_rate}
+
+    async def _worker(self):
+        while True:
+            word = await self._queue.get()
+            try:
+                if await self._warm(word):
+                    self._warmed.add(word)
+                    self.warmed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Не удалось прогреть аудио «{word}»: {e}")
+            finally:
+                self._scheduled.discard(word)
+                self._queue.task_done()
+
+    async def _warm(self, word: str) -> bool:
+        # Запись могла появиться в БД из другого процесса
+        if await audio_cache.get(word, count=False) is not None:
+            return False
+        # Если пользователь уже нажал кнопку, audio_fetcher отдаст обоим одну загрузку
+        download = await audio_fetcher.fetch(get_audio_url(word))
+        if download is None:
+            return False
+        if not self.chat_id:
+            self._downloads[word] = download
+            while len(self._downloads) > self.max_downloads:
+                self._downloads.popitem(last=False)
+            return True
+        async def upload(chat_id):
+            # InputFile – на каждую попытку: aiohttp дочитывает и закрывает поток при отправке
+            return await self._bot.send_audio(chat_id, types.InputFile(BytesIO(download.content), filename=f"{word}.mp3"),
+                                              title=word, disable_notification=True)
+
+        # Загрузка идёт через общую очередь отправки – с учётом лимитов Telegram и повторами
+        sent = await message_sender.submit(upload, self.chat_id)
+        if sent is None or sent.audio is None:
+            return False
+        await audio_cache.remember(word, sent.audio.file_id, download.etag, download.last_modified)
+        try:
+            # file_id остаётся действительным и после удаления сообщения
+            await self._bot.delete_message(self.chat_id, sent.message_id)
+        except Exception as e:
+            logger.debug(f"Не удалось удалить служебное сообщение с аудио «{word}»: {e}")
+        return True
+
+
+audio_prewarmer = AudioPrewarmer()
@@ -0,0 +1,246 @@
+# bot/callbacks.py
+"""
+Компактные callback_data для inline-кнопок и роутер нажатий.
+
+Каждый вид кнопки – CallbackType: номер (opcode) и целочисленные поля в формате struct.
+callback_data – base64url (без '=') от байтов
+
+    версия формата (1 байт) | opcode (1 байт) | поля (зашифрованы) | подпись (6 байт)
+
+Подпись – начало BLAKE2s с ключом (MAC) от заголовка и полей в открытом виде. Поля
+шифруются XOR с потоком BLAKE2s(ключ, заголовок + подпись): подпись служит и вектором
+инициализации, поэтому одинаковые кнопки дают одинаковые строки (карточки можно
+кэшировать), а разные – непохожие. Подделать нажатие или прочитать в callback_data правильный
+вариант теста без ключа нельзя. Ключ – CALLBACK_SECRET, по умолчанию выводится
+из TELEGRAM_TOKEN; после смены ключа кнопки старых сообщений отвечают «Кнопка устарела».
+
+Роутер находит обработчик по opcode в словаре – одно декодирование и один поиск вместо
+перебора префиксов. Кнопки старого текстового формата (play:слово, test_answer:id:i:j, menu
+и т.п.) в уже отправленных сообщениях разбираются таблицей LEGACY по префиксу. Старые
+test_answer не подписаны – их правильность может прислать сам клиент, поэтому они ведут
+на отдельные виды кнопок: ответ показывается, но в статистику и SRS не записывается.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import struct
+from config.settings import CALLBACK_SECRET, TELEGRAM_TOKEN
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<BB')
+SIGNATURE_SIZE = 6
+MAX_FIELDS_SIZE = 32    # длина потока шифрования – один выход BLAKE2s
+MAX_DATA_SIZE = 64      # ограничение Telegram на callback_data, байт
+
+
+class CallbackError(ValueError):
+    """callback_data не разобрана: чужой формат, другая версия или неверная подпись."""
+
+
+class CallbackType:
+    """Вид кнопки; data(*поля) – готовая строка для callback_data."""
+
+    __slots__ = ('registry', 'name', 'opcode', 'fields', 'struct', '_static')
+
+    def __init__(self, registry, name: str, opcode: int, fields: dict):
+        self.registry = registry
+        self.name = name
+        self.opcode = opcode
+        self.fields = tuple(fields)
+        self.struct = struct.Struct('<' + ''.join(fields.values()))
+        self._static = None
+
+    def data(self, *values) -> str:
+        if not self.fields:
+            # Кнопки без полей (меню) не меняются – кодируются один раз
+            if self._static is None:
+                self._static = self.registry.encode(self, ())
+            return self._static
+        return self.registry.encode(self, values)
+
+    def __repr__(self):
+        return f"CallbackType({self.name!r}, {self.opcode})"
+
+
+class CallbackRegistry:
+    """
+    Виды кнопок, их кодирование и обработчики. Обработчик вызывается как
+    handler(callback_query, *поля). Метрики: routed, legacy, rejected, unhandled – stats().
+    """
+
+    def __init__(self, secret: str):
+        key = hashlib.sha256(b"eesti_kell_bot callback_data\0" + secret.encode('utf-8')).digest()
+        # Заготовки с ключом копируются на каждый вызов: в несколько раз дешевле, чем hmac.digest
+        self._sign = hashlib.blake2s(key=key, person=b'sign')
+        self._stream = hashlib.blake2s(key=key, person=b'stream')
+        self._types = {}      # opcode -> CallbackType
+        self._handlers = {}   # opcode -> обработчик
+        self._legacy = {}     # префикс старого формата -> (CallbackType, разбор строки в поля)
+        # Метрики
+        self.routed = 0
+        self.legacy = 0
+        self.rejected = 0
+        self.unhandled = 0
+
+    def define(self, name: str, opcode: int, **fields) -> CallbackType:
+        """Новый вид кнопки; fields – имя поля -> формат struct ('I', 'B', '?')."""
+        if opcode in self._types:
+            raise ValueError(f"opcode {opcode} уже занят: {self._types[opcode]!r}")
+        callback_type = CallbackType(self, name, opcode, fields)
+        if callback_type.struct.size > MAX_FIELDS_SIZE:
+            raise ValueError(f"{name}: поля занимают больше {MAX_FIELDS_SIZE} байт")
+        self._types[opcode] = callback_type
+        return callback_type
+
+    def define_legacy(self, prefix: str, callback_type: CallbackType, parse=None):
+        """Кнопки старого формата «prefix[:...]»; parse(остаток строки) -> кортеж полей."""
+        self._legacy[prefix] = (callback_type, parse)
+
+    def register(self, callback_type: CallbackType, handler):
+        self._handlers[callback_type.opcode] = handler
+
+    def _signature(self, header: bytes, fields: bytes) -> bytes:
+        mac = self._sign.copy()
+        mac.update(header + fields)
+        return mac.digest()[:SIGNATURE_SIZE]
+
+    def _xor(self, header: bytes, signature: bytes, fields: bytes) -> bytes:
+        mac = self._stream.copy()
+        mac.update(header + signature)
+        stream = mac.digest()
+        size = len(fields)
+        return (int.from_bytes(fields, 'little') ^ int.from_bytes(stream[:size], 'little')).to_bytes(size, 'little')
+
+    def encode(self, callback_type: CallbackType, values) -> str:
+        header = HEADER.pack(FORMAT_VERSION, callback_type.opcode)
+        fields = callback_type.struct.pack(*values)
+        signature = self._signature(header, fields)
+        raw = header + self._xor(header, signature, fields) + signature
+        data = base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+        if len(data) > MAX_DATA_SIZE:
+            raise ValueError(f"{callback_type.name}: callback_data длиннее {MAX_DATA_SIZE} байт")
+        return data
+
+    def decode(self, data: str):
+        """(CallbackType, поля) для строки из encode(); иначе CallbackError."""
+        try:
+            raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+        except ValueError:
+            raise CallbackError("не base64") from None
+        if len(raw) < HEADER.size + SIGNATURE_SIZE:
+            raise CallbackError("слишком короткая строка")
+        version, opcode = HEADER.unpack_from(raw)
+        if version != FORMAT_VERSION:
+            raise CallbackError(f"версия формата {version}")
+        callback_type = self._types.get(opcode)
+        if callback_type is None or len(raw) != HEADER.size + callback_type.struct.size + SIGNATURE_SIZE:
+            raise CallbackError(f"неизвестный вид кнопки {opcode}")
+        header = raw[:HEADER.size]
+        signature = raw[-SIGNATURE_SIZE:]
+        fields = self._xor(header, signature, raw[HEADER.size:-SIGNATURE_SIZE])
+        if not hmac.compare_digest(signature, self._signature(header, fields)):
+            raise CallbackError("неверная подпись")
+        return callback_type, callback_type.struct.unpack(fields)
+
+    def decode_legacy(self, data: str):
+        """(CallbackType, поля) для кнопки старого текстового формата; иначе CallbackError."""
+        prefix, _, rest = data.partition(':')
+        entry = self._legacy.get(prefix)
+        if entry is None:
+            raise CallbackError(f"неизвестная кнопка {prefix!r}")
+        callback_type, parse = entry
+        try:
+            return callback_type, parse(rest) if parse is not None else ()
+        except (ValueError, LookupError) as e:
+            raise CallbackError(f"{prefix}: {e}") from None
+
+    def kind(self, data: str) -> str:
+        """Вид кнопки для метрик – по заголовку, без проверки подписи."""
+        try:
+            version, opcode = HEADER.unpack_from(base64.urlsafe_b64decode(data[:4]))
+        except (ValueError, struct.error):
+            version = opcode = None
+        if version == FORMAT_VERSION and opcode in self._types:
+            return self._types[opcode].name
+        prefix = data.partition(':')[0]
+        return prefix if prefix in self._legacy else 'unknown'
+
+    def stats(self) -> dict:
+        return {'routed': self.routed, 'legacy': self.legacy, 'rejected': self.rejected,
+                'unhandled': self.unhandled}
+
+    async def dispatch(self, callback_query):
+        """Единственный обработчик callback_query в диспетчере: разбор и поиск по opcode."""
+        data = callback_query.data or ''
+        try:
+            callback_type, values = self.decode(data)
+        except CallbackError:
+            try:
+                callback_type, values = self.decode_legacy(data)
+            except CallbackError as e:
+                self.rejected += 1
+                logger.debug(f"Кнопка отклонена: {e}")
+                await callback_query.answer("Кнопка устарела. Откройте меню: /start")
+                return
+            self.legacy += 1
+        handler = self._handlers.get(callback_type.opcode)
+        if handler is None:
+            self.unhandled += 1
+            await callback_query.answer()
+            return
+        self.routed += 1
+        await handler(callback_query, *values)
+
+
+callback_router = CallbackRegistry(CALLBACK_SECRET or TELEGRAM_TOKEN)
+
+# Номера видов кнопок записаны в callback_data отправленных сообщений – не меняйте их
+MENU = callback_router.define("menu", 1)
+HELP = callback_router.define("help", 2)
+SETTINGS = callback_router.define("settings", 3)
+START_MAILING = callback_router.define("startmailing", 4)
+RANDOM_WORD = callback_router.define("random_word", 5)
+RANDOM_TEST = callback_router.define("random_test", 6)
+PROGRESS = callback_router.define("progress", 7)
+TOGGLE_REPEAT = callback_router.define("toggle_repeat", 8, word_id='I')
+PLAY = callback_router.define("play", 9, word_id='I')
+# option – номер варианта: без него неверные варианты получили бы одинаковую строку
+TEST_ANSWER = callback_router.define("test_answer", 10, word_id='I', option='B', correct='?')
+TEST_ANSWER_REV = callback_router.define("test_answer_rev", 11, word_id='I', option='B', correct='?')
+# Только для неподписанных test_answer старого формата (LEGACY) – в новых сообщениях не выдаются
+LEGACY_TEST_ANSWER = callback_router.define("legacy_test_answer", 12, word_id='I', option='B', correct='?')
+LEGACY_TEST_ANSWER_REV = callback_router.define("legacy_test_answer_rev", 13, word_id='I', option='B', correct='?')
+
+
+def _legacy_test_answer(rest: str):
+    word_id, option, correct_index = rest.split(':')
+    return int(word_id), int(option), option == correct_index
+
+
+def _legacy_play(rest: str):
+    # В старых кнопках – само слово; такие сообщения редки, поэтому поиск перебором
+    from bot.catalog import word_catalog
+    for word in word_catalog.current:
+        if word.word_et == rest:
+            return (word.id,)
+    raise LookupError(f"слова {rest!r} нет в словаре")
+
+
+LEGACY = {
+    "menu": (MENU, None),
+    "help": (HELP, None),
+    "settings": (SETTINGS, None),
+    "startmailing": (START_MAILING, None),
+    "random_word": (RANDOM_WORD, None),
+    "random_test": (RANDOM_TEST, None),
+    "progress": (PROGRESS, None),
+    "toggle_repeat": (TOGGLE_REPEAT, lambda rest: (int(rest),)),
+    "play": (PLAY, _legacy_play),
+    "test_answer": (LEGACY_TEST_ANSWER, _legacy_test_answer),
+    "test_answer_rev": (LEGACY_TEST_ANSWER_REV, _legacy_test_answer),
+}
+for _prefix, (_callback_type, _parse) in LEGACY.items():
+    callback_router.define_legacy(_prefix, _callback_type, _parse)
@@ -0,0 +1,207 @@
+# bot/catalog.py
+import asyncio
+import logging
+import threading
+import uuid
+from sqlalchemy.sql import func
+from bot.database import SessionLocal, Word, CatalogMeta, run_db
+from bot.snapshot import open_snapshot, write_snapshot
+from config.settings import CATALOG_CHECK_SECONDS, CATALOG_SNAPSHOT_PATH
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'words_version'
+
+
+class WordRecord:
+    """Неизменяемая запись слова в каталоге (вместо ORM-объекта Word)."""
+    __slots__ = ('id', 'word_et', 'part_of_speech', 'translation', 'ai_generated_text', 'repeat_more')
+
+    def __init__(self, id, word_et, part_of_speech, translation, ai_generated_text, repeat_more):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'word_et', word_et)
+        object.__setattr__(self, 'part_of_speech', part_of_speech)
+        object.__setattr__(self, 'translation', translation)
+        object.__setattr__(self, 'ai_generated_text', ai_generated_text)
+        object.__setattr__(self, 'repeat_more', bool(repeat_more))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("WordRecord неизменяем")
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, WordRecord) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def for_user(self, repeat_more):
+        """Запись с флагом «повторять чаще» пользователя (user_word_status.repeat_more); None – флаг слова."""
+        if repeat_more is None or bool(repeat_more) == self.repeat_more:
+            return self
+        return self.replace(repeat_more=repeat_more)
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return WordRecord(**values)
+
+    def __repr__(self):
+        return f"WordRecord(id={self.id}, word_et={self.word_et!r})"
+
+
+class Catalog:
+    """
+    Снимок словаря: записи по id, общий список и слова с флагом repeat_more.
+    snapshot – двоичный снимок (bot/snapshot.py), из которого загружен каталог:
+    по нему find() ищет слово без отдельного индекса в памяти процесса. Сами записи
+    лежат в куче процесса и при загрузке из снимка – снимок только ускоряет старт.
+    """
+
+    def __init__(self, records, version: str, snapshot=None):
+        self.version = version
+        self.snapshot = snapshot
+        self.words = tuple(sorted(records, key=lambda record: record.id))
+        self.by_id = {record.id: record for record in self.words}
+        self.repeat_ids = frozenset(record.id for record in self.words if record.repeat_more)
+        self._by_key = None
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def get(self, word_id):
+        return self.by_id.get(word_id)
+
+    def find(self, word_et: str, part_of_speech: str):
+        """Слово по (word_et, part_of_speech); при повторе ключа – с меньшим id."""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            try:
+                row = snapshot.find(word_et, part_of_speech)
+            except ValueError:
+                # Каталог уже заменён и его снимок закрыт, а этот объект ещё держит читатель
+                pass
+            else:
+                return self.by_id.get(row[0]) if row else None
+        if self._by_key is None:
+            by_key = {}
+            for record in self.words:
+                by_key.setdefault((record.word_et, record.part_of_speech), record)
+            self._by_key = by_key
+        return self._by_key.get((word_et, part_of_speech))
+
+
+def bump_catalog_version(session):
+    """Помечает словарь изменённым – все процессы бота перечитают его при следующей проверке."""
+    value = uuid.uuid4().hex
+    meta = session.get(CatalogMeta, CATALOG_VERSION_KEY)
+    if meta is None:
+        session.add(CatalogMeta(key=CATALOG_VERSION_KEY, value=value))
+    else:
+        meta.value = value
+    return value
+
+
+def load_word_rows(session):
+    """Строки словаря для каталога и снимка: (id, word_et, part_of_speech, translation, ai_generated_text, repeat_more)."""
+    return session.query(Word.id, Word.word_et, Word.part_of_speech, Word.translation,
+                         Word.ai_generated_text, Word.repeat_more).all()
+
+
+def read_catalog_version(session) -> str:
+    """
+    Версия словаря: отметка из catalog_meta плюс число строк и максимальный id –
+    так замечается и импорт, который не обновил отметку.
+    """
+    meta = session.get(CatalogMeta, CATALOG_VERSION_KEY)
+    count, max_id = session.query(func.count(Word.id), func.max(Word.id)).one()
+    return f"{meta.value if meta else '-'}:{count}:{max_id}"
+
+
+class CatalogStore:
+    """
+    Каталог слов в памяти процесса. Читатели берут текущий снимок (current) без блокировок;
+    перезагрузка собирает новый Catalog и подменяет ссылку целиком. Подписчики (listeners)
+    получают новый снимок, чтобы перестроить свои индексы.
+
+    Если задан snapshot_path, каталог читается из двоичного снимка, когда его версия
+    совпадает с версией в БД; иначе – из БД, после чего снимок пересобирается.
+    """
+
+    def __init__(self, snapshot_path: str = CATALOG_SNAPSHOT_PATH):
+        self.snapshot_path = snapshot_path
+        self._catalog = None
+        self._listeners = []
+        self._lock = threading.RLock()
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+        if self._catalog is not None:
+            listener(self._catalog)
+
+    @property
+    def current(self) -> Catalog:
+        if self._catalog is None:
+            session = SessionLocal()
+            try:
+                self.load(session)
+            finally:
+                session.close()
+        return self._catalog
+
+    def load(self, session) -> Catalog:
+        version = read_catalog_version(session)
+        snapshot = open_snapshot(self.snapshot_path, version)
+        if snapshot is not None:
+            rows, source = snapshot.rows(), f"снимок {self.snapshot_path}"
+        else:
+            rows, source = load_word_rows(session), "БД"
+            if self.snapshot_path:
+                self._write_snapshot(rows, version)
+        catalog = Catalog([WordRecord(*row) for row in rows], version, snapshot)
+        self._publish(catalog)
+        logger.info(f"Каталог слов загружен ({source}): {len(catalog)} слов, версия {version}")
+        return catalog
+
+    def _write_snapshot(self, rows, version: str):
+        try:
+            write_snapshot(self.snapshot_path, rows, version)
+        except OSError as e:
+            logger.warning(f"Не удалось записать снимок словаря {self.snapshot_path}: {e}")
+
+    def refresh(self, session) -> bool:
+        """Перезагружает каталог, если версия в БД изменилась. Возвращает True при перезагрузке."""
+        if self._catalog is not None and read_catalog_version(session) == self._catalog.version:
+            return False
+        self.load(session)
+        return True
+
+    def _publish(self, catalog: Catalog):
+        with self._lock:
+            previous, self._catalog = self._catalog, catalog
+            # mmap прежнего снимка больше не нужен – иначе каждая перезагрузка оставляет открытый файл
+            if previous is not None and previous.snapshot is not None and previous.snapshot is not catalog.snapshot:
+                previous.snapshot.close()
+            for listener in self._listeners:
+                try:
+                    listener(catalog)
+                except Exception:
+                    logger.exception("Ошибка при обновлении индекса по каталогу")
+
+
+word_catalog = CatalogStore()
+
+
+async def watch_catalog(interval: int = CATALOG_CHECK_SECONDS):
+    """Фоновая проверка версии каталога: после импорта слов бот подхватывает их без рестарта."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_db(word_catalog.refresh)
+        except Exception:
+            logger.exception("Ошибка при проверке версии каталога")
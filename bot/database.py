@@ -1,7 +1,11 @@
 # bot/database.py
 import os
+import zlib
+import asyncio
+import contextvars
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, DateTime, Boolean, Float, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -13,9 +17,51 @@ logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///estonian_bot.db')
 logger.info(f"Используется база данных: {DATABASE_URL}")
 
+# Сколько потоков выполняют запросы к БД (см. run_db)
+DB_THREADS = int(os.getenv('DB_THREADS', '8'))
+
 # Создаем engine и sessionmaker
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
+if DATABASE_URL.startswith('sqlite'):
+    engine = create_engine(DATABASE_URL)
+else:
+    # Пул соединений не меньше числа потоков, иначе потоки будут ждать соединение
+    engine = create_engine(DATABASE_URL, pool_size=DB_THREADS, max_overflow=DB_THREADS, pool_pre_ping=True)
+# expire_on_commit=False: объекты, возвращённые из run_db, остаются читаемыми после закрытия сессии
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Выполняет fn(session, *args, **kwargs) в пуле потоков, чтобы запросы не блокировали
+    event loop. Для каждого вызова открывается своя сессия: при успехе – commit,
+    при ошибке – rollback; сессия всегда закрывается. Контекстные переменные вызывающего
+    (вид апдейта для метрик SQL, bot/metrics.py) видны и в потоке.
+    """
+    def call():
+        session = SessionLocal()
+        try:
+            result = fn(session, *args, **kwargs)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, context.run, call)
+
+def upsert_insert(session):
+    """insert() с поддержкой ON CONFLICT для PostgreSQL и SQLite; для остальных СУБД – None."""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
 
 Base = declarative_base()
 
@@ -23,32 +69,104 @@ class Word(Base):
     __tablename__ = 'words'
     id = Column(Integer, primary_key=True)
     word_et = Column(String, nullable=False)           # Эстонское слово
-    part_of_speech = Column(String, nullable=False)      # Часть речи
+    part_of_speech = Column(String, nullable=False, index=True)  # Часть речи
     translation = Column(String, nullable=False)         # Перевод
     ai_generated_text = Column(Text, nullable=True)      # Пример использования (опционально)
     correct_answers = Column(Integer, default=0)
     incorrect_answers = Column(Integer, default=0)
     repeat_more = Column(Boolean, default=False)         # Флаг для частого повторения
 
+def chat_hash(chat_id) -> int:
+    """crc32 от chat_id: по нему делятся партиции планировщиков (bot/leases.py)."""
+    return zlib.crc32(str(chat_id).encode())
+
+def _chat_hash_default(context):
+    return chat_hash(context.get_current_parameters()['chat_id'])
+
 class UserSettings(Base):
     __tablename__ = 'user_settings'
     id = Column(Integer, primary_key=True)
     chat_id = Column(String, nullable=False, unique=True)
+    # crc32(chat_id): партиция пользователя считается прямо в SQL как chat_hash % число партиций
+    chat_hash = Column(BigInteger, nullable=True, default=_chat_hash_default)
     words_per_hour = Column(Integer, default=5)           # Сколько слов отправлять за цикл
     interval_minutes = Column(Integer, default=60)        # Интервал отправки слов в минутах
     start_time = Column(String, default="09:00")           # Начало рассылки
     end_time = Column(String, default="23:00")             # Окончание рассылки
     test_interval_minutes = Column(Integer, default=90)    # Интервал отправки тестов в минутах (новый столбец)
     tests_per_batch = Column(Integer, default=1)           # Количество тестов за раз (новый столбец)
+    last_words_at = Column(DateTime, nullable=True)        # Время последней рассылки слов
+    last_test_at = Column(DateTime, nullable=True)         # Время последней рассылки тестов
+    next_words_at = Column(DateTime, nullable=True, index=True)  # Когда отправлять следующие слова
+    next_test_at = Column(DateTime, nullable=True, index=True)   # Когда отправлять следующие тесты
 
 class UserWordStatus(Base):
     __tablename__ = 'user_word_status'
+    # Одна строка на пару (пользователь, слово) – на этом держится upsert в bot/sent_log.py;
+    # этот же индекс обслуживает выборки по chat_id (непоказанные слова, прогресс)
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'word_id', name='uq_user_word_status_chat_word'),
+        # Очередь повторений пользователя: самые просроченные слова – одним диапазонным чтением
+        Index('ix_user_word_status_chat_due', 'chat_id', 'due_at'),
+    )
     id = Column(Integer, primary_key=True)
     chat_id = Column(String, nullable=False)
     word_id = Column(Integer, nullable=False)
     sent_count = Column(Integer, default=0)
     last_sent = Column(DateTime, nullable=True)
+    correct_answers = Column(Integer, default=0)     # Верных ответов в тестах по этому слову
+    incorrect_answers = Column(Integer, default=0)   # Неверных ответов
+    # Интервальное повторение (bot/srs.py)
+    srs_interval = Column(Integer, nullable=True)    # Текущий интервал, дней
+    srs_ease = Column(Float, nullable=True)          # Коэффициент лёгкости SM-2
+    srs_reps = Column(Integer, nullable=True)        # Верных ответов подряд
+    due_at = Column(DateTime, nullable=True)         # Когда слово пора повторить
+    repeat_more = Column(Boolean, nullable=True)     # «Повторять чаще» у пользователя; NULL – как у слова
+
+class UserSeenState(Base):
+    __tablename__ = 'user_seen_state'
+    # Версия показанных пользователю слов: растёт при каждой записи отметок об отправке
+    # (bot/sent_log.py), по ней выборщик (bot/word_sampler.py) замечает отправки других процессов
+    chat_id = Column(String, primary_key=True)
+    seen_version = Column(Integer, nullable=False, default=0)
+    # Начало текущего круга: слова, отправленные раньше, снова считаются непоказанными
+    cycle_started_at = Column(DateTime, nullable=True)
+
+class CatalogMeta(Base):
+    __tablename__ = 'catalog_meta'
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)   # Например, версия словаря (меняется при импорте слов)
+
+class AudioFile(Base):
+    __tablename__ = 'audio_files'
+    word_et = Column(String, primary_key=True)         # Слово (как в play:<слово>)
+    file_id = Column(String, nullable=False)           # file_id аудио, загруженного в Telegram
+    etag = Column(String, nullable=True)               # ETag исходного mp3 на момент загрузки
+    last_modified = Column(String, nullable=True)      # Last-Modified исходного mp3
+    checked_at = Column(DateTime, nullable=True)       # Когда исходный файл последний раз проверялся
+
+class SchedulerLease(Base):
+    __tablename__ = 'scheduler_leases'
+    partition = Column(Integer, primary_key=True, autoincrement=False)  # Номер партиции chat_id
+    owner = Column(String, nullable=True)                               # Воркер, который её обслуживает
+    expires_at = Column(DateTime, nullable=True)                        # До какого времени действует аренда
+
+class SchedulerWorker(Base):
+    __tablename__ = 'scheduler_workers'
+    worker_id = Column(String, primary_key=True)
+    heartbeat_at = Column(DateTime, nullable=False)
+
+class PendingTest(Base):
+    # Тесты с вводом ответа, которые ждут ответа пользователя (bot/pending_store.py, PENDING_STORE=db)
+    __tablename__ = 'pending_tests'
+    chat_id = Column(String, primary_key=True)
+    message_id = Column(BigInteger, primary_key=True, autoincrement=False)  # Сообщение с вопросом
+    word_id = Column(Integer, nullable=False)
+    expected = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 def init_db():
-    """Создает таблицы в БД, если их еще нет."""
+    """Создает таблицы в БД, если их еще нет, и применяет миграции (bot/migrations.py)."""
+    from bot.migrations import run_migrations
     Base.metadata.create_all(engine)
+    run_migrations()
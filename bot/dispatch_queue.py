@@ -0,0 +1,235 @@
+# bot/dispatch_queue.py
+"""
+Очередь апдейтов между приёмом (polling или webhook) и диспетчером aiogram.
+
+У каждого чата своя очередь: апдейты одного чата обрабатываются строго по очереди
+(второе быстрое нажатие – после первого), разные чаты – параллельно, но не больше
+чем workers обработчиков одновременно. Всего в очереди не больше max_pending апдейтов:
+при заполнении put() ждёт (polling перестаёт забирать апдейты, webhook отвечает 503),
+а чат, накидавший больше max_per_chat необработанных апдейтов, теряет новые (shed).
+
+Метрики: depth, active_chats, shed, processed, failed и время ожидания в очереди
+по видам апдейтов (команда, вид inline-кнопки, прочее) – stats().
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from aiogram import Bot, Dispatcher, types
+from bot.callbacks import callback_router
+from bot.metrics import current_operation
+from config.settings import DISPATCH_WORKERS, DISPATCH_QUEUE_SIZE, DISPATCH_CHAT_QUEUE
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update: types.Update):
+    """Чат, к которому относится апдейт; апдейты без чата не упорядочиваются между собой."""
+    for name in ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'my_chat_member', 'chat_member'):
+        event = getattr(update, name)
+        if event is not None:
+            return event.chat.id
+    if update.callback_query is not None:
+        query = update.callback_query
+        return query.message.chat.id if query.message is not None else query.from_user.id
+    return ('update', update.update_id)
+
+
+# Команды, на которые в диспетчере есть обработчики (заполняется в ChatDispatchQueue.start).
+# Вид апдейта – ключ stats() и метка метрик, поэтому произвольный текст со слэшем в него не попадает
+known_commands = set()
+
+
+def registered_commands(dp: Dispatcher) -> set:
+    """/команды из фильтров commands=[...] обработчиков сообщений диспетчера."""
+    commands = set()
+    for handler in dp.message_handlers.handlers:
+        for filter_obj in handler.filters or ():
+            commands.update(f"/{command.lower()}" for command in getattr(filter_obj.filter, 'commands', ()))
+    return commands
+
+
+def handler_key(update: types.Update) -> str:
+    """Вид апдейта для метрик: известная /команда, вид кнопки (bot/callbacks.py) или тип апдейта."""
+    if update.message is not None:
+        text = update.message.text or ''
+        if not text.startswith('/'):
+            return 'message'
+        command = text.split()[0].split('@')[0].lower()
+        return command if command in known_commands else 'other'
+    if update.callback_query is not None:
+        return 'callback:' + callback_router.kind(update.callback_query.data or '')
+    return 'other'
+
+
+class HandlerWait:
+    __slots__ = ('count', 'total_wait', 'max_wait', 'total_run')
+
+    def __init__(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+
+class ChatDispatchQueue:
+    """Очереди по chat_id и общий ограниченный пул обработчиков."""
+
+    def __init__(self, workers: int = DISPATCH_WORKERS, max_pending: int = DISPATCH_QUEUE_SIZE,
+                 max_per_chat: int = DISPATCH_CHAT_QUEUE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_chat = max_per_chat
+        self._dp = None
+        self._chats = {}      # chat -> deque([(update, время постановки, вид)])
+        self._ready = None    # чаты, у которых есть необработанный апдейт и нет апдейта в работе
+        self._space = None   # есть место в очереди (для put)
+        self._tasks = []
+        self._pending = 0
+        # Метрики
+        self.shed = 0
+        self.processed = 0
+        self.failed = 0
+        self.handlers = {}    # вид апдейта -> HandlerWait
+
+    def start(self, dp: Dispatcher):
+        self._dp = dp
+        known_commands.update(registered_commands(dp))
+        # Контекст диспетчера и бота наследуют обработчики – как при start_polling
+        Dispatcher.set_current(dp)
+        Bot.set_current(dp.bot)
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self, drain_timeout: float = 10):
+        """Дорабатывает поставленные апдейты (не дольше drain_timeout) и останавливает пул."""
+        deadline = time.monotonic() + drain_timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._pending:
+            logger.warning(f"Очередь апдейтов остановлена, не обработано: {self._pending}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._chats.clear()
+        self._pending = 0
+
+    @property
+    def depth(self) -> int:
+        return self._pending
+
+    @property
+    def full(self) -> bool:
+        return self._pending >= self.max_pending
+
+    async def put(self, update: types.Update, wait_chat: bool = False) -> bool:
+        """
+        Ставит апдейт в очередь чата; ждёт места, если очередь полна. False – апдейт отброшен.
+        wait_chat – ждать места и в очереди чата, а не отбрасывать апдейт (тогда всегда True).
+        """
+        key = chat_key(update)
+        while self.full or (wait_chat and self._chat_full(key)):
+            self._space.clear()
+            await self._space.wait()
+        return self._enqueue(update)
+
+    def _chat_full(self, key) -> bool:
+        queue = self._chats.get(key)
+        return queue is not None and len(queue) >= self.max_per_chat
+
+    def put_nowait(self, update: types.Update) -> bool:
+        """Как put(), но без ожидания; вызывающий сам проверяет full. False – апдейт отброшен."""
+        return self._enqueue(update)
+
+    def _enqueue(self, update: types.Update) -> bool:
+        key = chat_key(update)
+        if self._chat_full(key):
+            self.shed += 1
+            logger.debug(f"Чат {key}: больше {self.max_per_chat} необработанных апдейтов, "
+                         f"апдейт {update.update_id} отброшен")
+            return False
+        queue = self._chats.get(key)
+        if queue is None:
+            queue = self._chats[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append((update, time.monotonic(), handler_key(update)))
+        self._pending += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth, 'active_chats': len(self._chats), 'shed': self.shed,
+            'processed': self.processed, 'failed': self.failed,
+            'handlers': {
+                kind: {'count': item.count, 'avg_wait_ms': item.total_wait / item.count * 1000,
+                       'max_wait_ms': item.max_wait * 1000, 'avg_run_ms': item.total_run / item.count * 1000}
+                for kind, item in self.handlers.items() if item.count
+            },
+        }
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            update, enqueued_at, kind = queue[0]
+            started = time.monotonic()
+            # Вид апдейта – для метрик обработчиков и SQL (bot/metrics.py)
+            token = current_operation.set(kind)
+            try:
+                await self._dp.process_update(update)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Ошибка при обработке апдейта {kind}")
+            finally:
+                current_operation.reset(token)
+                finished = time.monotonic()
+                item = self.handlers.get(kind)
+                if item is None:
+                    item = self.handlers[kind] = HandlerWait()
+                item.count += 1
+                item.total_wait += started - enqueued_at
+                item.max_wait = max(item.max_wait, started - enqueued_at)
+                item.total_run += finished - started
+                queue.popleft()
+                self._pending -= 1
+                self._space.set()
+                # Следующий апдейт чата – в конец общей очереди: чаты не ждут одного «болтливого»
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+
+
+async def poll_updates(dp: Dispatcher, dispatch: ChatDispatchQueue, timeout: int = 20, error_sleep: int = 5):
+    """
+    Long polling с обратным давлением: следующий getUpdates – только когда все апдейты
+    предыдущего ответа поставлены в очередь. Пока очередь (общая или очередь чата) полна,
+    апдейты ждут на стороне Telegram: offset не сдвигается, и ничего не подтверждается
+    раньше, чем попало в очередь, – в отличие от webhook, отбрасывать здесь нечем.
+    """
+    bot = dp.bot
+    await bot.delete_webhook()
+    offset = None
+    logger.info("Start polling.")
+    while True:
+        try:
+            with bot.request_timeout(timeout + 10):
+                updates = await bot.get_updates(offset=offset, timeout=timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ошибка при получении апдейтов")
+            await asyncio.sleep(error_sleep)
+            continue
+        for update in updates:
+            await dispatch.put(update, wait_chat=True)
+            offset = update.update_id + 1
+
+
+dispatch_queue = ChatDispatchQueue()
@@ -0,0 +1,59 @@
+# bot/distractors.py
+import random
+import threading
+from bot.catalog import word_catalog
+
+
+class DistractorIndex:
+    """
+    Индекс слов по частям речи для тестов с вариантами ответа.
+    Строится по каталогу слов (bot/catalog.py) и отвечает из памяти: загаданное слово и три
+    неверных варианта той же части речи выбираются random.sample по готовым массивам.
+    Части речи, где меньше 4 слов, отсеиваются заранее – такие слова загадываются
+    только в тестах с вводом ответа.
+    """
+
+    def __init__(self):
+        self._words = []          # все слова
+        self._by_pos = {}         # часть речи -> слова
+        self._choice_words = []   # слова, для которых хватает вариантов ответа
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def on_catalog(self, catalog):
+        self.build(catalog.words)
+
+    def build(self, words):
+        by_pos = {}
+        for word in words:
+            by_pos.setdefault(word.part_of_speech, []).append(word)
+        choice_words = [word for word in words if len(by_pos[word.part_of_speech]) >= 4]
+        with self._lock:
+            # Подменяем ссылки целиком – читатели всегда видят согласованный индекс
+            self._words, self._by_pos, self._choice_words = list(words), by_pos, choice_words
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.build(word_catalog.current.words)
+
+    def pick(self, test_type: int):
+        """
+        Загаданное слово и три других слова той же части речи (для теста типа 3 – без вариантов).
+        Если для тестов с вариантами не хватает слов, варианты пустые и вызывающий
+        переходит к тесту типа 3.
+        """
+        self._ensure_loaded()
+        words, by_pos, choice_words = self._words, self._by_pos, self._choice_words
+        if not words:
+            return None, []
+        if test_type == 3 or not choice_words:
+            return random.choice(words), []
+        word = random.choice(choice_words)
+        candidates = random.sample(by_pos[word.part_of_speech], 4)
+        others = [other for other in candidates if other.id != word.id][:3]
+        return word, others
+
+
+distractor_index = DistractorIndex()
+word_catalog.subscribe(distractor_index.on_catalog)
@@ -0,0 +1,139 @@
+# bot/due_queue.py
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+
+def _parse_hhmm(value: str, day: datetime):
+    """Превращает строку "HH:MM" в datetime на дату day (или None, если формат неверный)."""
+    try:
+        parsed = datetime.strptime(value, "%H:%M")
+    except (TypeError, ValueError):
+        return None
+    return day.replace(hour=parsed.hour, minute=parsed.minute, second=0, microsecond=0)
+
+
+def next_due_time(candidate: datetime, start_time: str, end_time: str):
+    """
+    Сдвигает момент candidate в ближайшее окно рассылки пользователя.
+    Окно задаётся так же, как раньше проверялось в планировщике:
+    start_time <= HH:MM <= end_time. Если окно пустое или время задано неверно – None.
+    """
+    if not start_time or not end_time or start_time > end_time:
+        return None
+    start = _parse_hhmm(start_time, candidate)
+    if start is None or _parse_hhmm(end_time, candidate) is None:
+        return None
+    now_hhmm = candidate.strftime("%H:%M")
+    if now_hhmm < start_time:
+        return start
+    if now_hhmm > end_time:
+        return start + timedelta(days=1)
+    return candidate
+
+
+class DueQueue:
+    """
+    Очередь пользователей, упорядоченная по времени следующей рассылки (min-heap).
+    Для каждого chat_id хранится только актуальное время: устаревшие записи в куче
+    пропускаются при извлечении (ленивое удаление), поэтому перепланирование – O(log n).
+    Очередь меняется и из потоков run_db, поэтому операции защищены блокировкой.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._heap = []
+        self._due = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, chat_id):
+        return chat_id in self._due
+
+    def schedule(self, chat_id: str, due_at):
+        """Ставит (или переставляет) пользователя на время due_at; None – убирает из очереди."""
+        with self._lock:
+            if due_at is None:
+                self._due.pop(chat_id, None)
+                return
+            if self._due.get(chat_id) == due_at:
+                return
+            self._due[chat_id] = due_at
+            heapq.heappush(self._heap, (due_at, next(self._counter), chat_id))
+            # Если устаревших записей стало слишком много – перестраиваем кучу
+            if len(self._heap) > 2 * len(self._due) + 64:
+                self._compact()
+
+    def remove(self, chat_id: str):
+        with self._lock:
+            self._due.pop(chat_id, None)
+
+    def due_at(self, chat_id: str):
+        return self._due.get(chat_id)
+
+    def peek(self):
+        """Время ближайшей рассылки или None, если очередь пуста."""
+        with self._lock:
+            while self._heap:
+                due_at, _, chat_id = self._heap[0]
+                if self._due.get(chat_id) == due_at:
+                    return due_at
+                heapq.heappop(self._heap)
+            return None
+
+    def pop_due(self, now: datetime):
+        """Извлекает всех пользователей, у которых время рассылки уже наступило."""
+        with self._lock:
+            ready = []
+            while self._heap and self._heap[0][0] <= now:
+                due_at, _, chat_id = heapq.heappop(self._heap)
+                if self._due.get(chat_id) != due_at:
+                    continue
+                del self._due[chat_id]
+                ready.append(chat_id)
+            return ready
+
+    def remove_where(self, predicate):
+        """Убирает из очереди всех пользователей, для которых predicate(chat_id) истинно."""
+        with self._lock:
+            for chat_id in [chat_id for chat_id in self._due if predicate(chat_id)]:
+                del self._due[chat_id]
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+            self._due.clear()
+
+    def _compact(self):
+        self._heap = [(due_at, next(self._counter), chat_id) for chat_id, due_at in self._due.items()]
+        heapq.heapify(self._heap)
+
+
+# Очереди рассылки слов и тестов (общие для планировщика и обработчиков)
+words_queue = DueQueue("words")
+tests_queue = DueQueue("tests")
+
+
+def _next_after(last, interval_minutes, now):
+    if last is None:
+        return now
+    return max(now, last + timedelta(minutes=interval_minutes or 0))
+
+
+def schedule_user(user, now=None):
+    """
+    Пересчитывает время следующей рассылки пользователя (например, после /setsettings):
+    от времени последней отправки + интервал, с переносом за пределы «тихих часов».
+    Результат записывается в next_words_at/next_test_at (коммит – на стороне вызывающего).
+    """
+    now = now or datetime.now()
+    user.next_words_at = next_due_time(
+        _next_after(user.last_words_at, user.interval_minutes, now), user.start_time, user.end_time)
+    user.next_test_at = next_due_time(
+        _next_after(user.last_test_at, user.test_interval_minutes, now), user.start_time, user.end_time)
+    words_queue.schedule(user.chat_id, user.next_words_at)
+    tests_queue.schedule(user.chat_id, user.next_test_at)
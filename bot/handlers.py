@@ -1,67 +1,117 @@
 # bot/handlers.py
 import logging
 from aiogram import types, Dispatcher, Bot
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ForceReply
-from sqlalchemy.sql import func
-from datetime import datetime
-from bot.database import SessionLocal, Word, UserSettings, UserWordStatus
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from bot.database import UserSettings, UserWordStatus, run_db, upsert_insert
+from bot.catalog import word_catalog
+from bot.due_queue import schedule_user
+from bot.sender import message_sender, wait_sent
+from bot.word_sampler import word_sampler
+from bot.word_cards import word_cards
+from bot.sent_log import sent_log
+from bot.srs import pick_mailing_words, QUALITY_WRONG, QUALITY_CHOICE, QUALITY_TYPED
+from bot.answer_log import answer_log
+from bot.pending_store import pending_tests
+from bot.audio_prewarm import audio_prewarmer
+from bot.questions import question_pool
+from bot.callbacks import (callback_router, MENU, HELP, SETTINGS, START_MAILING, RANDOM_WORD, RANDOM_TEST, PROGRESS,
+                           TOGGLE_REPEAT, TEST_ANSWER, TEST_ANSWER_REV, LEGACY_TEST_ANSWER, LEGACY_TEST_ANSWER_REV)
 import random
 
 logger = logging.getLogger(__name__)
 
-# Глобальный словарь для ожидающих тестов с набором ответа
-pending_typing_tests = {}
 
-def mark_word_as_sent(session, chat_id: str, word_id: int):
-    user_word = session.query(UserWordStatus).filter_by(chat_id=chat_id, word_id=word_id).first()
-    if not user_word:
-        user_word = UserWordStatus(chat_id=chat_id, word_id=word_id, sent_count=1, last_sent=datetime.now())
-        session.add(user_word)
-    else:
-        user_word.sent_count += 1
-        user_word.last_sent = datetime.now()
-        session.add(user_word)
+def mark_word_as_sent(session, chat_id: str, word_id: int, flush: bool = True):
+    """
+    Отмечает слово отправленным. Запись идёт через пакетный upsert (bot/sent_log.py);
+    при flush=False отметка остаётся в буфере до sent_log.flush – так делает рассылка,
+    записывая весь тик одним запросом.
+    """
+    sent_log.add(session, chat_id, word_id)
+    word_sampler.mark_seen(chat_id, word_id)
+    if flush:
+        sent_log.flush(session)
 
-def get_word_message(word_obj):
-    text = (
-        f"🇪🇪 Sõna: <b>{word_obj.word_et}</b>\n"
-        f"🇷🇺 Перевод: <b>{word_obj.translation}</b>\n\n"
-        f"📖 Информация:\n{word_obj.ai_generated_text}\n"
-    )
-    keyboard = InlineKeyboardMarkup(row_width=1)
-    keyboard.add(InlineKeyboardButton("🎧 Послушать слово", callback_data=f"play:{word_obj.word_et}"))
-    if word_obj.repeat_more:
-        repeat_text = "Убрать из повторяющихся"
+# Функции доступа к БД: выполняются в пуле потоков через run_db(fn, ...)
+def get_or_create_settings(session, chat_id: str):
+    user = session.query(UserSettings).filter_by(chat_id=chat_id).first()
+    if not user:
+        # Создаем пользователя с настройками по умолчанию
+        user = UserSettings(
+            chat_id=chat_id,
+            words_per_hour=5,
+            interval_minutes=60,
+            start_time="09:00",
+            end_time="23:00",
+            test_interval_minutes=90,
+            tests_per_batch=1
+        )
+        schedule_user(user)
+        session.add(user)
+        session.commit()
+        logger.info(f"Создан новый пользователь {chat_id} с настройками по умолчанию.")
+    return user
+
+# Слова читаются из каталога в памяти (bot/catalog.py) – без обращений к БД
+def get_word(word_id: int):
+    return word_catalog.current.get(word_id)
+
+def get_random_word():
+    words = word_catalog.current.words
+    return random.choice(words) if words else None
+
+async def send_question(bot: Bot, chat_id: str, question):
+    """Отправляет готовый тест; тест с вводом ответа запоминается до ответа пользователя."""
+    sent = await bot.send_message(chat_id, question.text, parse_mode="HTML", reply_markup=question.reply_markup)
+    if question.needs_reply:
+        pending_tests.put(chat_id, sent.message_id, question.word_id, question.expected)
+    return sent
+
+def get_progress(session, chat_id: str):
+    total = len(word_catalog.current)
+    user_sent = session.query(UserWordStatus).filter_by(chat_id=chat_id).count()
+    return user_sent, total
+
+def show_word(session, chat_id: str, word):
+    """Отмечает слово отправленным; возвращает его с флагом «повторять чаще» этого пользователя."""
+    repeat_more = session.query(UserWordStatus.repeat_more).filter_by(chat_id=chat_id, word_id=word.id).scalar()
+    mark_word_as_sent(session, chat_id, word.id)
+    return word.for_user(repeat_more)
+
+def toggle_repeat(session, chat_id: str, word_id: int):
+    """
+    Переключает «повторять чаще» для слова у одного пользователя (user_word_status.repeat_more).
+    Словарь при этом не меняется – каталог в процессах перечитывать не нужно.
+    """
+    record = word_catalog.current.get(word_id)
+    if record is None:
+        return None
+    current = session.query(UserWordStatus.repeat_more).filter_by(chat_id=chat_id, word_id=word_id).scalar()
+    repeat_more = not (record.repeat_more if current is None else current)
+    insert = upsert_insert(session)
+    if insert is not None:
+        stmt = insert(UserWordStatus).values(chat_id=chat_id, word_id=word_id, sent_count=0, correct_answers=0,
+                                             incorrect_answers=0, repeat_more=repeat_more)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[UserWordStatus.chat_id, UserWordStatus.word_id],
+            set_={'repeat_more': repeat_more},
+        ))
     else:
-        repeat_text = "Повторять слово чаще"
-    keyboard.add(InlineKeyboardButton(repeat_text, callback_data=f"toggle_repeat:{word_obj.id}"))
-    keyboard.add(InlineKeyboardButton("Меню", callback_data="menu"))
-    return text, keyboard
+        status = session.query(UserWordStatus).filter_by(chat_id=chat_id, word_id=word_id).first()
+        if status is None:
+            session.add(UserWordStatus(chat_id=chat_id, word_id=word_id, sent_count=0, correct_answers=0,
+                                       incorrect_answers=0, repeat_more=repeat_more))
+        else:
+            status.repeat_more = repeat_more
+    return record.for_user(repeat_more)
 
 # ОБРАБОТЧИК ДЛЯ КОМАНДЫ /start
 async def start_handler(message: types.Message):
     chat_id = str(message.chat.id)
-    session = SessionLocal()
     try:
-        user = session.query(UserSettings).filter_by(chat_id=chat_id).first()
-        if not user:
-            # Создаем пользователя с настройками по умолчанию
-            user = UserSettings(
-                chat_id=chat_id,
-                words_per_hour=5,
-                interval_minutes=60,
-                start_time="09:00",
-                end_time="23:00",
-                test_interval_minutes=90,
-                tests_per_batch=1
-            )
-            session.add(user)
-            session.commit()
-            logger.info(f"Создан новый пользователь {chat_id} с настройками по умолчанию.")
+        await run_db(get_or_create_settings, chat_id)
     except Exception as e:
         logger.exception("Ошибка в start_handler")
-    finally:
-        session.close()
     text = (
         "Привет! Я бот для изучения эстонского языка на уровни A1–A2.\n"
         "В моей базе 1781 слово, которые полностью покрывают эти уровни.\n\n"
@@ -77,12 +127,12 @@ async def start_handler(message: types.Message):
     )
     keyboard = InlineKeyboardMarkup(row_width=2)
     keyboard.add(
-        InlineKeyboardButton("Начать рассылку", callback_data="startmailing"),
-        InlineKeyboardButton("Случайное слово", callback_data="random_word"),
-        InlineKeyboardButton("Случайный тест", callback_data="random_test"),
-        InlineKeyboardButton("Прогресс", callback_data="progress"),
-        InlineKeyboardButton("Настройки", callback_data="settings"),
-        InlineKeyboardButton("Помощь", callback_data="help")
+        InlineKeyboardButton("Начать рассылку", callback_data=START_MAILING.data()),
+        InlineKeyboardButton("Случайное слово", callback_data=RANDOM_WORD.data()),
+        InlineKeyboardButton("Случайный тест", callback_data=RANDOM_TEST.data()),
+        InlineKeyboardButton("Прогресс", callback_data=PROGRESS.data()),
+        InlineKeyboardButton("Настройки", callback_data=SETTINGS.data()),
+        InlineKeyboardButton("Помощь", callback_data=HELP.data())
     )
     await message.answer(text, parse_mode="HTML", reply_markup=keyboard)
 
@@ -113,79 +163,28 @@ async def help_handler(message: types.Message):
 
 # ОБРАБОТЧИК ДЛЯ /random_word
 async def random_word_handler(message: types.Message):
-    session = SessionLocal()
     try:
-        word_obj = session.query(Word).order_by(func.random()).first()
+        word_obj = get_random_word()
         if not word_obj:
             await message.answer("База слов пуста!", parse_mode="HTML")
             return
-        text, keyboard = get_word_message(word_obj)
-        await message.answer(text, parse_mode="HTML", reply_markup=keyboard)
-        mark_word_as_sent(session, str(message.chat.id), word_obj.id)
-        session.commit()
+        word_obj = await run_db(show_word, str(message.chat.id), word_obj)
+        await message.answer(**word_cards.get(word_obj))
     except Exception as e:
         logger.exception("Ошибка в random_word_handler")
-    finally:
-        session.close()
 
 # ОБРАБОТЧИК ДЛЯ /random_test
 async def random_test_handler(message: types.Message):
-    session = SessionLocal()
     try:
         chat_id = str(message.chat.id)
-        test_type = random.choices([1, 2, 3], weights=[40, 40, 20])[0]
-        word_obj = session.query(Word).order_by(func.random()).first()
-        if not word_obj:
+        question = question_pool.take(chat_id)
+        if question is None:
             await message.answer("База слов пуста!", parse_mode="HTML")
             return
-        if test_type == 1:
-            correct = word_obj.translation
-            options = [correct]
-            others = session.query(Word).filter(
-                Word.part_of_speech == word_obj.part_of_speech,
-                Word.id != word_obj.id
-            ).order_by(func.random()).limit(3).all()
-            if len(others) < 3:
-                test_type = 3
-            else:
-                for w in others:
-                    options.append(w.translation)
-                random.shuffle(options)
-                correct_index = options.index(correct)
-                keyboard = InlineKeyboardMarkup(row_width=2)
-                for idx, option in enumerate(options):
-                    keyboard.add(InlineKeyboardButton(option, callback_data=f"test_answer:{word_obj.id}:{idx}:{correct_index}"))
-                test_text = f"❓ Как переводится слово <b>{word_obj.word_et}</b>?"
-                await message.answer(test_text, parse_mode="HTML", reply_markup=keyboard)
-        elif test_type == 2:
-            correct = word_obj.word_et
-            options = [correct]
-            others = session.query(Word).filter(
-                Word.part_of_speech == word_obj.part_of_speech,
-                Word.id != word_obj.id
-            ).order_by(func.random()).limit(3).all()
-            if len(others) < 3:
-                test_type = 3
-            else:
-                for w in others:
-                    options.append(w.word_et)
-                random.shuffle(options)
-                correct_index = options.index(correct)
-                keyboard = InlineKeyboardMarkup(row_width=2)
-                for idx, option in enumerate(options):
-                    keyboard.add(InlineKeyboardButton(option, callback_data=f"test_answer_rev:{word_obj.id}:{idx}:{correct_index}"))
-                test_text = f"❓ Как по‑эстонски будет слово <b>{word_obj.translation}</b>?"
-                await message.answer(test_text, parse_mode="HTML", reply_markup=keyboard)
-        if test_type == 3:
-            test_text = f"❓ Введите перевод для слова <b>{word_obj.word_et}</b>:"
-            await message.answer(test_text, parse_mode="HTML", reply_markup=ForceReply(selective=True))
-            pending_typing_tests[str(message.chat.id)] = {'word_id': word_obj.id, 'expected': word_obj.translation}
-        mark_word_as_sent(session, str(message.chat.id), word_obj.id)
-        session.commit()
+        await send_question(message.bot, chat_id, question)
+        await run_db(mark_word_as_sent, chat_id, question.word_id)
     except Exception as e:
         logger.exception("Ошибка в random_test_handler")
-    finally:
-        session.close()
 
 # ОБРАБОТЧИК ДЛЯ /get5words
 async def get_five_words_handler(message: types.Message):
@@ -194,27 +193,12 @@ async def get_five_words_handler(message: types.Message):
 
 # ОБРАБОТЧИК ДЛЯ КОМАНДЫ /settings (Просмотр текущих настроек)
 async def settings_handler(message: types.Message):
-    session = SessionLocal()
     try:
         chat_id = str(message.chat.id)
-        user = session.query(UserSettings).filter_by(chat_id=chat_id).first()
-        if not user:
-            # Если записи нет, создаем её с настройками по умолчанию
-            user = UserSettings(
-                chat_id=chat_id,
-                words_per_hour=5,
-                interval_minutes=60,
-                start_time="09:00",
-                end_time="23:00",
-                test_interval_minutes=90,
-                tests_per_batch=1
-            )
-            session.add(user)
-            session.commit()
-            logger.info(f"/settings: создан новый пользователь {chat_id} с настройками по умолчанию.")
-        else:
-            logger.info(f"/settings для пользователя {chat_id}: words_per_hour={user.words_per_hour}, interval_minutes={user.interval_minutes}, "
-                        f"start_time={user.start_time}, end_time={user.end_time}, test_interval_minutes={user.test_interval_minutes}, tests_per_batch={user.tests_per_batch}")
+        # Если записи нет, создаем её с настройками по умолчанию
+        user = await run_db(get_or_create_settings, chat_id)
+        logger.info(f"/settings для пользователя {chat_id}: words_per_hour={user.words_per_hour}, interval_minutes={user.interval_minutes}, "
+                    f"start_time={user.start_time}, end_time={user.end_time}, test_interval_minutes={user.test_interval_minutes}, tests_per_batch={user.tests_per_batch}")
         text = (
             f"Ваши настройки рассылки:\n"
             f"Слов в час: <b>{user.words_per_hour}</b>\n"
@@ -232,126 +216,102 @@ async def settings_handler(message: types.Message):
     except Exception as e:
         logger.exception("Ошибка в settings_handler")
         await message.answer("Произошла ошибка при получении настроек.", parse_mode="HTML")
-    finally:
-        session.close()
+
+def update_settings(session, chat_id: str, values: dict):
+    user = session.query(UserSettings).filter_by(chat_id=chat_id).first()
+    if not user:
+        logger.info(f"/setsettings: для пользователя {chat_id} запись не найдена – создаём новую.")
+        user = UserSettings(chat_id=chat_id, **values)
+        session.add(user)
+    else:
+        logger.info(f"Обновление настроек для пользователя {chat_id}: " +
+                    ", ".join(f"{key}={value}" for key, value in values.items()))
+        for key, value in values.items():
+            setattr(user, key, value)
+    # Пересчитываем время следующей рассылки с учётом новых настроек
+    schedule_user(user)
 
 # ОБРАБОТЧИК ДЛЯ КОМАНДЫ /setsettings (Изменение настроек)
 async def set_settings_handler(message: types.Message):
-    session = SessionLocal()
     try:
         args = message.get_args().split()
         # Ожидается 6 параметров:
         # <words_per_hour> <interval_minutes> <start_time> <end_time> <test_interval_minutes> <tests_per_batch>
-        words_per_hour = int(args[0])
-        interval_minutes = int(args[1])
-        start_time = args[2]
-        end_time = args[3]
-        test_interval_minutes = int(args[4])
-        tests_per_batch = int(args[5])
+        values = dict(
+            words_per_hour=int(args[0]),
+            interval_minutes=int(args[1]),
+            start_time=args[2],
+            end_time=args[3],
+            test_interval_minutes=int(args[4]),
+            tests_per_batch=int(args[5])
+        )
     except Exception as e:
         logger.exception("Ошибка при разборе аргументов команды /setsettings")
         await message.answer("Неверный формат. Используйте: /setsettings <слова в час> <интервал слов (мин)> <начало> <окончание> <интервал тестов (мин)> <кол-во тестов>", parse_mode="HTML")
-        session.close()
         return
     try:
         chat_id = str(message.chat.id)
-        user = session.query(UserSettings).filter_by(chat_id=chat_id).first()
-        if not user:
-            logger.info(f"/setsettings: для пользователя {chat_id} запись не найдена – создаём новую.")
-            user = UserSettings(
-                chat_id=chat_id,
-                words_per_hour=words_per_hour,
-                interval_minutes=interval_minutes,
-                start_time=start_time,
-                end_time=end_time,
-                test_interval_minutes=test_interval_minutes,
-                tests_per_batch=tests_per_batch
-            )
-            session.add(user)
-        else:
-            logger.info(f"Обновление настроек для пользователя {chat_id}: words_per_hour={words_per_hour}, interval_minutes={interval_minutes}, "
-                        f"start_time={start_time}, end_time={end_time}, test_interval_minutes={test_interval_minutes}, tests_per_batch={tests_per_batch}")
-            user.words_per_hour = words_per_hour
-            user.interval_minutes = interval_minutes
-            user.start_time = start_time
-            user.end_time = end_time
-            user.test_interval_minutes = test_interval_minutes
-            user.tests_per_batch = tests_per_batch
-        session.commit()
+        await run_db(update_settings, chat_id, values)
         await message.answer("Настройки обновлены!", parse_mode="HTML")
     except Exception as e:
         logger.exception("Ошибка при обновлении настроек в /setsettings")
         await message.answer("Произошла ошибка при обновлении настроек.", parse_mode="HTML")
-    finally:
-        session.close()
 
 # ОБРАБОТЧИК ДЛЯ /progress
 async def progress_handler(message: types.Message):
-    session = SessionLocal()
     try:
         chat_id = str(message.chat.id)
-        total = session.query(Word).count()
-        user_sent = session.query(UserWordStatus).filter_by(chat_id=chat_id).count()
+        user_sent, total = await run_db(get_progress, chat_id)
         text = f"Прогресс:\nВыучено {user_sent} из {total} слов."
         await message.answer(text, parse_mode="HTML")
     except Exception as e:
         logger.exception("Ошибка в progress_handler")
-    finally:
-        session.close()
+
+def select_five_words(session, chat_id: str):
+    """Подбирает 5 слов (сначала те, что пора повторить, затем новые) и отмечает их отправленными."""
+    selected_words = pick_mailing_words(session, chat_id, 5)
+    for word in selected_words:
+        mark_word_as_sent(session, chat_id, word.id, flush=False)
+    sent_log.flush(session)
+    return selected_words
 
 # Функция отправки 5 слов
 async def send_five_words(chat_id: str, bot: Bot):
-    session = SessionLocal()
     try:
-        sent_word_ids = [uw.word_id for uw in session.query(UserWordStatus).filter_by(chat_id=chat_id).all()]
-        query = session.query(Word)
-        frequent_words = session.query(Word).filter(Word.repeat_more == True).all()
-        selected_words = []
-        for word in frequent_words:
-            user_word = session.query(UserWordStatus).filter_by(chat_id=chat_id, word_id=word.id).first()
-            if user_word is None or (user_word.last_sent and (datetime.now() - user_word.last_sent).total_seconds() > 86400):
-                selected_words.append(word)
-        remaining = 5 - len(selected_words)
-        if remaining > 0:
-            if sent_word_ids:
-                query = query.filter(~Word.id.in_(sent_word_ids))
-            additional_words = query.order_by(func.random()).limit(remaining).all()
-            selected_words.extend(additional_words)
-            if not additional_words:
-                session.query(UserWordStatus).filter_by(chat_id=chat_id).delete()
-                session.commit()
-                additional_words = session.query(Word).order_by(func.random()).limit(remaining).all()
-                selected_words.extend(additional_words)
+        selected_words = await run_db(select_five_words, chat_id)
+        audio_prewarmer.enqueue(word.word_et for word in selected_words)
+        sent = []
         for word in selected_words:
-            text, keyboard = get_word_message(word)
-            await bot.send_message(chat_id, text, parse_mode="HTML", reply_markup=keyboard)
-            mark_word_as_sent(session, chat_id, word.id)
-        session.commit()
+            sent.append(message_sender.send_message(chat_id, **word_cards.get(word)))
+        await wait_sent(sent, "send_five_words")
     except Exception as e:
         logger.exception("Ошибка в send_five_words")
-    finally:
-        session.close()
 
 # ОБРАБОТЧИК ДЛЯ теста с набором ответа
 async def typing_test_answer_handler(message: types.Message):
     try:
         chat_id = str(message.chat.id)
-        if chat_id not in pending_typing_tests:
+        # Ответ реплаем относится к своему вопросу, обычное сообщение – к последнему заданному
+        reply = message.reply_to_message
+        pending = pending_tests.take(chat_id, reply.message_id if reply else None)
+        if pending is None:
             return
-        expected = pending_typing_tests[chat_id]['expected']
-        word_id = pending_typing_tests[chat_id]['word_id']
+        expected = pending['expected']
+        word_id = pending['word_id']
         user_answer = message.text.strip().lower()
         if user_answer == expected.lower():
             response = "✅ Верно!"
+            quality = QUALITY_TYPED
         else:
             response = f"❌ Неверно. Правильный ответ: {expected}"
+            quality = QUALITY_WRONG
         keyboard = InlineKeyboardMarkup(row_width=2)
         keyboard.add(
-            InlineKeyboardButton("Следующий тест", callback_data="random_test"),
-            InlineKeyboardButton("Меню", callback_data="menu")
+            InlineKeyboardButton("Следующий тест", callback_data=RANDOM_TEST.data()),
+            InlineKeyboardButton("Меню", callback_data=MENU.data())
         )
         await message.answer(response, parse_mode="HTML", reply_markup=keyboard)
-        del pending_typing_tests[chat_id]
+        answer_log.record(chat_id, word_id, quality)
     except Exception as e:
         logger.exception("Ошибка в typing_test_answer_handler")
 
@@ -379,21 +339,7 @@ async def settings_inline_handler(callback_query: types.CallbackQuery):
     try:
         # Этот обработчик вызывается при нажатии кнопки «Настройки»
         chat_id = str(callback_query.message.chat.id)
-        session = SessionLocal()
-        user = session.query(UserSettings).filter_by(chat_id=chat_id).first()
-        if not user:
-            user = UserSettings(
-                chat_id=chat_id,
-                words_per_hour=5,
-                interval_minutes=60,
-                start_time="09:00",
-                end_time="23:00",
-                test_interval_minutes=90,
-                tests_per_batch=1
-            )
-            session.add(user)
-            session.commit()
-            logger.info(f"В settings_inline_handler: создан новый пользователь {chat_id} с настройками по умолчанию.")
+        user = await run_db(get_or_create_settings, chat_id)
         text = (
             f"Ваши настройки рассылки:\n"
             f"Слов в час: <b>{user.words_per_hour}</b>\n"
@@ -412,7 +358,6 @@ async def settings_inline_handler(callback_query: types.CallbackQuery):
         logger.exception("Ошибка в settings_inline_handler")
         await callback_query.message.edit_text("Ошибка при получении настроек.", parse_mode="HTML")
     finally:
-        session.close()
         await callback_query.answer()
 
 async def menu_inline_handler(callback_query: types.CallbackQuery):
@@ -431,203 +376,135 @@ async def menu_inline_handler(callback_query: types.CallbackQuery):
     )
     keyboard = InlineKeyboardMarkup(row_width=2)
     keyboard.add(
-        InlineKeyboardButton("Начать рассылку", callback_data="startmailing"),
-        InlineKeyboardButton("Случайное слово", callback_data="random_word"),
-        InlineKeyboardButton("Случайный тест", callback_data="random_test"),
-        InlineKeyboardButton("Прогресс", callback_data="progress"),
-        InlineKeyboardButton("Настройки", callback_data="settings"),
-        InlineKeyboardButton("Помощь", callback_data="help")
+        InlineKeyboardButton("Начать рассылку", callback_data=START_MAILING.data()),
+        InlineKeyboardButton("Случайное слово", callback_data=RANDOM_WORD.data()),
+        InlineKeyboardButton("Случайный тест", callback_data=RANDOM_TEST.data()),
+        InlineKeyboardButton("Прогресс", callback_data=PROGRESS.data()),
+        InlineKeyboardButton("Настройки", callback_data=SETTINGS.data()),
+        InlineKeyboardButton("Помощь", callback_data=HELP.data())
     )
     await callback_query.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
     await callback_query.answer()
 
-async def inline_button_handler(callback_query: types.CallbackQuery):
-    data = callback_query.data
+def _record_choice_answer(chat_id: str, word_id: int, correct: bool):
+    """Ответ в тесте с вариантами – в буфер записи ответов (bot/answer_log.py)."""
+    try:
+        answer_log.record(chat_id, word_id, QUALITY_CHOICE if correct else QUALITY_WRONG)
+    except Exception as e:
+        logger.exception("Ошибка при записи ответа в тесте")
+
+# Обработчики кнопок: callback_router (bot/callbacks.py) вызывает их с полями из callback_data
+async def toggle_repeat_callback(callback_query: types.CallbackQuery, word_id: int):
+    chat_id = str(callback_query.message.chat.id)
+    try:
+        word_obj = await run_db(toggle_repeat, chat_id, word_id)
+        if word_obj:
+            status = "помечено" if word_obj.repeat_more else "убрано из повторяющихся"
+            await callback_query.bot.send_message(chat_id, f"Слово {word_obj.word_et} теперь {status}.", parse_mode="HTML")
+    except Exception as e:
+        logger.exception("Ошибка в toggle_repeat_callback")
+    await callback_query.answer()
+
+def _next_test_keyboard():
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        InlineKeyboardButton("Следующий тест", callback_data=RANDOM_TEST.data()),
+        InlineKeyboardButton("Меню", callback_data=MENU.data())
+    )
+    return keyboard
+
+async def _reply_choice_answer(callback_query: types.CallbackQuery, word_id: int, correct: bool,
+                               reverse: bool, record: bool = True):
+    chat_id = str(callback_query.message.chat.id)
+    if record:
+        _record_choice_answer(chat_id, word_id, correct)
+    if correct:
+        response = "✅ Верно!"
+    else:
+        word_obj = get_word(word_id)
+        right = (word_obj.word_et if reverse else word_obj.translation) if word_obj else 'Неизвестно'
+        response = f"❌ Неверно. Правильный ответ: {right}"
+    await callback_query.bot.send_message(chat_id, response, parse_mode="HTML", reply_markup=_next_test_keyboard())
+    await callback_query.answer()
+
+async def test_answer_callback(callback_query: types.CallbackQuery, word_id: int, option: int, correct: bool):
+    await _reply_choice_answer(callback_query, word_id, correct, reverse=False)
+
+async def test_answer_rev_callback(callback_query: types.CallbackQuery, word_id: int, option: int, correct: bool):
+    await _reply_choice_answer(callback_query, word_id, correct, reverse=True)
+
+# Кнопки старого формата не подписаны: correct мог подставить клиент – ответ не записываем
+async def legacy_test_answer_callback(callback_query: types.CallbackQuery, word_id: int, option: int, correct: bool):
+    await _reply_choice_answer(callback_query, word_id, correct, reverse=False, record=False)
+
+async def legacy_test_answer_rev_callback(callback_query: types.CallbackQuery, word_id: int, option: int,
+                                          correct: bool):
+    await _reply_choice_answer(callback_query, word_id, correct, reverse=True, record=False)
+
+async def random_test_callback(callback_query: types.CallbackQuery):
     bot = callback_query.bot
     chat_id = str(callback_query.message.chat.id)
-    if data.startswith("toggle_repeat:"):
-        try:
-            _, word_id = data.split(":", 1)
-        except ValueError:
-            await callback_query.answer("Некорректные данные!")
-            return
-        session = SessionLocal()
-        try:
-            word_obj = session.query(Word).filter_by(id=int(word_id)).first()
-            if word_obj:
-                word_obj.repeat_more = not word_obj.repeat_more
-                session.commit()
-                status = "помечено" if word_obj.repeat_more else "убрано из повторяющихся"
-                await bot.send_message(chat_id, f"Слово {word_obj.word_et} теперь {status}.", parse_mode="HTML")
-        except Exception as e:
-            logger.exception("Ошибка в inline_button_handler (toggle_repeat)")
-        finally:
-            session.close()
-        await callback_query.answer()
-        return
-    if data.startswith("test_answer:"):
-        parts = data.split(":")
-        if len(parts) != 4:
-            await callback_query.answer("Некорректные данные теста.")
-            return
-        _, word_id, selected_index, correct_index = parts
-        if selected_index == correct_index:
-            response = "✅ Верно!"
-        else:
-            session = SessionLocal()
-            try:
-                word_obj = session.query(Word).filter_by(id=int(word_id)).first()
-                response = f"❌ Неверно. Правильный ответ: {word_obj.translation if word_obj else 'Неизвестно'}"
-            except Exception as e:
-                logger.exception("Ошибка в inline_button_handler (test_answer)")
-                response = "Ошибка"
-            finally:
-                session.close()
-        keyboard = InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            InlineKeyboardButton("Следующий тест", callback_data="random_test"),
-            InlineKeyboardButton("Меню", callback_data="menu")
-        )
-        await bot.send_message(chat_id, response, parse_mode="HTML", reply_markup=keyboard)
-        await callback_query.answer()
-        return
-    if data.startswith("test_answer_rev:"):
-        parts = data.split(":")
-        if len(parts) != 4:
-            await callback_query.answer("Некорректные данные теста.")
+    try:
+        # Готовый вопрос из пула (bot/questions.py) – без сборки, пока пользователь ждёт
+        question = question_pool.take(chat_id)
+        if question is None:
+            await bot.send_message(chat_id, "База слов пуста!", parse_mode="HTML")
             return
-        _, word_id, selected_index, correct_index = parts
-        session = SessionLocal()
-        try:
-            word_obj = session.query(Word).filter_by(id=int(word_id)).first()
-        except Exception as e:
-            logger.exception("Ошибка в inline_button_handler (test_answer_rev)")
-            word_obj = None
-        finally:
-            session.close()
-        if selected_index == correct_index:
-            response = "✅ Верно!"
-        else:
-            response = f"❌ Неверно. Правильный ответ: {word_obj.word_et if word_obj else 'Неизвестно'}"
-        keyboard = InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            InlineKeyboardButton("Следующий тест", callback_data="random_test"),
-            InlineKeyboardButton("Меню", callback_data="menu")
-        )
-        await bot.send_message(chat_id, response, parse_mode="HTML", reply_markup=keyboard)
-        await callback_query.answer()
-        return
-    if data == "random_test":
-        session = SessionLocal()
-        try:
-            test_type = random.choices([1, 2, 3], weights=[40, 40, 20])[0]
-            word_obj = session.query(Word).order_by(func.random()).first()
-            if not word_obj:
-                await bot.send_message(chat_id, "База слов пуста!", parse_mode="HTML")
-                return
-            if test_type == 1:
-                correct = word_obj.translation
-                options = [correct]
-                others = session.query(Word).filter(
-                    Word.part_of_speech == word_obj.part_of_speech,
-                    Word.id != word_obj.id
-                ).order_by(func.random()).limit(3).all()
-                if len(others) < 3:
-                    test_type = 3
-                else:
-                    for w in others:
-                        options.append(w.translation)
-                    random.shuffle(options)
-                    correct_index = options.index(correct)
-                    keyboard = InlineKeyboardMarkup(row_width=2)
-                    for idx, option in enumerate(options):
-                        keyboard.add(InlineKeyboardButton(option, callback_data=f"test_answer:{word_obj.id}:{idx}:{correct_index}"))
-                    test_text = f"❓ Как переводится слово <b>{word_obj.word_et}</b>?"
-                    await bot.send_message(chat_id, test_text, parse_mode="HTML", reply_markup=keyboard)
-            elif test_type == 2:
-                correct = word_obj.word_et
-                options = [correct]
-                others = session.query(Word).filter(
-                    Word.part_of_speech == word_obj.part_of_speech,
-                    Word.id != word_obj.id
-                ).order_by(func.random()).limit(3).all()
-                if len(others) < 3:
-                    test_type = 3
-                else:
-                    for w in others:
-                        options.append(w.word_et)
-                    random.shuffle(options)
-                    correct_index = options.index(correct)
-                    keyboard = InlineKeyboardMarkup(row_width=2)
-                    for idx, option in enumerate(options):
-                        keyboard.add(InlineKeyboardButton(option, callback_data=f"test_answer_rev:{word_obj.id}:{idx}:{correct_index}"))
-                    test_text = f"❓ Как по‑эстонски будет слово <b>{word_obj.translation}</b>?"
-                    await bot.send_message(chat_id, test_text, parse_mode="HTML", reply_markup=keyboard)
-            if test_type == 3:
-                test_text = f"❓ Введите перевод для слова <b>{word_obj.word_et}</b>:"
-                await bot.send_message(chat_id, test_text, parse_mode="HTML", reply_markup=ForceReply(selective=True))
-                pending_typing_tests[chat_id] = {'word_id': word_obj.id, 'expected': word_obj.translation}
-            session.commit()
-        except Exception as e:
-            logger.exception("Ошибка в inline_button_handler при отправке random_test")
-        finally:
-            session.close()
-        await callback_query.answer("Тест отправлен!")
-        return
-    if data == "startmailing":
-        await send_five_words(chat_id, bot)
-        await callback_query.answer("Рассылка запущена!")
-        return
-    if data == "random_word":
-        session = SessionLocal()
-        try:
-            word_obj = session.query(Word).order_by(func.random()).first()
-            if word_obj:
-                text, keyboard = get_word_message(word_obj)
-                await bot.send_message(chat_id, text, parse_mode="HTML", reply_markup=keyboard)
-                mark_word_as_sent(session, chat_id, word_obj.id)
-            session.commit()
-        except Exception as e:
-            logger.exception("Ошибка в inline_button_handler для random_word")
-        finally:
-            session.close()
-        await callback_query.answer("Случайное слово!")
-        return
-    if data == "progress":
-        session = SessionLocal()
-        try:
-            total = session.query(Word).count()
-            user_sent = session.query(UserWordStatus).filter_by(chat_id=chat_id).count()
-            text = f"Прогресс:\nВыучено {user_sent} из {total} слов."
-            await bot.send_message(chat_id, text, parse_mode="HTML")
-        except Exception as e:
-            logger.exception("Ошибка в inline_button_handler для progress")
-        finally:
-            session.close()
-        await callback_query.answer()
-        return
+        await send_question(bot, chat_id, question)
+    except Exception as e:
+        logger.exception("Ошибка в random_test_callback")
+    await callback_query.answer("Тест отправлен!")
+
+async def startmailing_callback(callback_query: types.CallbackQuery):
+    await send_five_words(str(callback_query.message.chat.id), callback_query.bot)
+    await callback_query.answer("Рассылка запущена!")
+
+async def random_word_callback(callback_query: types.CallbackQuery):
+    chat_id = str(callback_query.message.chat.id)
+    try:
+        word_obj = get_random_word()
+        if word_obj:
+            word_obj = await run_db(show_word, chat_id, word_obj)
+            await callback_query.bot.send_message(chat_id, **word_cards.get(word_obj))
+    except Exception as e:
+        logger.exception("Ошибка в random_word_callback")
+    await callback_query.answer("Случайное слово!")
+
+async def progress_callback(callback_query: types.CallbackQuery):
+    chat_id = str(callback_query.message.chat.id)
+    try:
+        user_sent, total = await run_db(get_progress, chat_id)
+        text = f"Прогресс:\nВыучено {user_sent} из {total} слов."
+        await callback_query.bot.send_message(chat_id, text, parse_mode="HTML")
+    except Exception as e:
+        logger.exception("Ошибка в progress_callback")
     await callback_query.answer()
 
 # ОБРАБОТЧИК ДЛЯ ответов в тесте с набором текста
 async def typing_test_answer_handler(message: types.Message):
     try:
         chat_id = str(message.chat.id)
-        if chat_id not in pending_typing_tests:
+        # Ответ реплаем относится к своему вопросу, обычное сообщение – к последнему заданному
+        reply = message.reply_to_message
+        pending = pending_tests.take(chat_id, reply.message_id if reply else None)
+        if pending is None:
             return
-        expected = pending_typing_tests[chat_id]['expected']
-        word_id = pending_typing_tests[chat_id]['word_id']
+        expected = pending['expected']
+        word_id = pending['word_id']
         user_answer = message.text.strip().lower()
         if user_answer == expected.lower():
             response = "✅ Верно!"
+            quality = QUALITY_TYPED
         else:
             response = f"❌ Неверно. Правильный ответ: {expected}"
+            quality = QUALITY_WRONG
         keyboard = InlineKeyboardMarkup(row_width=2)
         keyboard.add(
-            InlineKeyboardButton("Следующий тест", callback_data="random_test"),
-            InlineKeyboardButton("Меню", callback_data="menu")
+            InlineKeyboardButton("Следующий тест", callback_data=RANDOM_TEST.data()),
+            InlineKeyboardButton("Меню", callback_data=MENU.data())
         )
         await message.answer(response, parse_mode="HTML", reply_markup=keyboard)
-        del pending_typing_tests[chat_id]
+        answer_log.record(chat_id, word_id, quality)
     except Exception as e:
         logger.exception("Ошибка в typing_test_answer_handler")
 
@@ -643,11 +520,18 @@ def register_handlers(dp: Dispatcher):
     dp.register_message_handler(random_test_handler, commands=["random_test"])
     dp.register_message_handler(get_five_words_handler, commands=["get5words"])
     dp.register_message_handler(progress_handler, commands=["progress"])
-    dp.register_callback_query_handler(help_inline_handler, lambda c: c.data == "help")
-    dp.register_callback_query_handler(settings_inline_handler, lambda c: c.data == "settings")
-    dp.register_callback_query_handler(menu_inline_handler, lambda c: c.data == "menu")
-    dp.register_callback_query_handler(
-        inline_button_handler,
-        lambda c: c.data is not None and not c.data.startswith("play:")
-    )
+    # Все нажатия inline-кнопок идут через один роутер: обработчик выбирается по opcode
+    callback_router.register(HELP, help_inline_handler)
+    callback_router.register(SETTINGS, settings_inline_handler)
+    callback_router.register(MENU, menu_inline_handler)
+    callback_router.register(TOGGLE_REPEAT, toggle_repeat_callback)
+    callback_router.register(TEST_ANSWER, test_answer_callback)
+    callback_router.register(TEST_ANSWER_REV, test_answer_rev_callback)
+    callback_router.register(LEGACY_TEST_ANSWER, legacy_test_answer_callback)
+    callback_router.register(LEGACY_TEST_ANSWER_REV, legacy_test_answer_rev_callback)
+    callback_router.register(RANDOM_TEST, random_test_callback)
+    callback_router.register(START_MAILING, startmailing_callback)
+    callback_router.register(RANDOM_WORD, random_word_callback)
+    callback_router.register(PROGRESS, progress_callback)
+    dp.register_callback_query_handler(callback_router.dispatch)
     dp.register_message_handler(typing_test_answer_handler)
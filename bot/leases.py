@@ -0,0 +1,117 @@
+# bot/leases.py
+import logging
+import math
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from bot.database import SchedulerLease, SchedulerWorker, UserSettings, chat_hash
+from config.settings import SCHEDULER_PARTITIONS, SCHEDULER_LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def partition_of(chat_id: str, partitions: int = SCHEDULER_PARTITIONS) -> int:
+    """Номер партиции chat_id. crc32, а не hash(): результат одинаков во всех процессах."""
+    return chat_hash(chat_id) % partitions
+
+
+def in_partitions(partitions: int, owned):
+    """Условие SQL «пользователь в одной из партиций owned» – то же, что partition_of в Python."""
+    return (UserSettings.chat_hash % partitions).in_(sorted(owned))
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class PartitionLease:
+    """
+    Аренда партиций chat_id в таблице scheduler_leases.
+    Каждый воркер на heartbeat продлевает свои партиции, отдаёт лишние сверх честной доли
+    и забирает свободные или просроченные (например, у упавшего воркера).
+    Захват – условный UPDATE, поэтому одну партицию не могут взять два воркера сразу.
+    """
+
+    def __init__(self, worker_id: str = None, partitions: int = SCHEDULER_PARTITIONS,
+                 lease_seconds: int = SCHEDULER_LEASE_SECONDS):
+        self.worker_id = worker_id or default_worker_id()
+        self.partitions = partitions
+        self.lease_seconds = lease_seconds
+        self.owned = set()
+
+    def _ensure_rows(self, session):
+        existing = {row.partition for row in session.query(SchedulerLease.partition).all()}
+        missing = [p for p in range(self.partitions) if p not in existing]
+        if not missing:
+            return
+        try:
+            session.add_all([SchedulerLease(partition=p) for p in missing])
+            session.commit()
+        except IntegrityError:
+            # Строки уже создал другой воркер
+            session.rollback()
+
+    def heartbeat(self, session, now: datetime = None) -> set:
+        """Обновляет аренду и возвращает множество партиций, которыми владеет этот воркер."""
+        now = now or datetime.now()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        self._ensure_rows(session)
+
+        worker = session.get(SchedulerWorker, self.worker_id)
+        if worker is None:
+            session.add(SchedulerWorker(worker_id=self.worker_id, heartbeat_at=now))
+        else:
+            worker.heartbeat_at = now
+        alive_since = now - timedelta(seconds=self.lease_seconds)
+        session.query(SchedulerWorker).filter(
+            SchedulerWorker.heartbeat_at < now - timedelta(seconds=self.lease_seconds * 10)
+        ).delete(synchronize_session=False)
+        session.commit()
+        alive = session.query(SchedulerWorker).filter(SchedulerWorker.heartbeat_at >= alive_since).count()
+        fair_share = math.ceil(self.partitions / max(alive, 1))
+
+        # Продлеваем свои партиции
+        session.query(SchedulerLease).filter(SchedulerLease.owner == self.worker_id).update(
+            {SchedulerLease.expires_at: expires_at}, synchronize_session=False)
+        session.commit()
+        owned = sorted(row.partition for row in
+                       session.query(SchedulerLease.partition).filter(SchedulerLease.owner == self.worker_id).all())
+
+        # Лишние партиции отдаём, чтобы новый воркер мог их забрать
+        for partition in owned[fair_share:]:
+            session.query(SchedulerLease).filter(
+                SchedulerLease.partition == partition, SchedulerLease.owner == self.worker_id
+            ).update({SchedulerLease.owner: None, SchedulerLease.expires_at: now}, synchronize_session=False)
+        owned = set(owned[:fair_share])
+
+        # Забираем свободные и просроченные партиции
+        if len(owned) < fair_share:
+            free = session.query(SchedulerLease.partition).filter(
+                (SchedulerLease.owner.is_(None)) | (SchedulerLease.expires_at < now)
+            ).all()
+            for (partition,) in free:
+                if len(owned) >= fair_share:
+                    break
+                claimed = session.query(SchedulerLease).filter(
+                    SchedulerLease.partition == partition,
+                    (SchedulerLease.owner.is_(None)) | (SchedulerLease.expires_at < now)
+                ).update({SchedulerLease.owner: self.worker_id, SchedulerLease.expires_at: expires_at},
+                         synchronize_session=False)
+                if claimed:
+                    owned.add(partition)
+        session.commit()
+
+        if owned != self.owned:
+            logger.info(f"Воркер {self.worker_id}: партиции {sorted(owned)} (живых воркеров: {alive})")
+        self.owned = owned
+        return owned
+
+    def release_all(self, session):
+        """Освобождает партиции при штатной остановке, чтобы их сразу подхватили другие."""
+        session.query(SchedulerLease).filter(SchedulerLease.owner == self.worker_id).update(
+            {SchedulerLease.owner: None, SchedulerLease.expires_at: None}, synchronize_session=False)
+        session.query(SchedulerWorker).filter(SchedulerWorker.worker_id == self.worker_id).delete(
+            synchronize_session=False)
+        session.commit()
+        self.owned = set()
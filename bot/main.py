@@ -1,22 +1,155 @@
 # bot/main.py
 import asyncio
-from aiogram import Bot, Dispatcher
-from config.settings import TELEGRAM_TOKEN
+import logging
+import multiprocessing
+import signal
+from aiogram import Dispatcher
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+from config.settings import (TELEGRAM_TOKEN, TELEGRAM_API_URL, BOT_CONNECTIONS_LIMIT, SCHEDULER_WORKERS, BOT_MODE,
+                             WEBHOOK_PROCESSES, METRICS_HOST, METRICS_PORT)
 from bot import handlers, scheduler
-from bot.database import init_db
+from bot.database import init_db, run_db, engine
+from bot.catalog import word_catalog, watch_catalog
+from bot.sent_log import sent_log
+from bot.answer_log import answer_log
 from bot.audio_handlers import register_audio_handlers
+from bot.audio_fetch import audio_fetcher
+from bot.audio_prewarm import audio_prewarmer
+from bot.sender import message_sender
+from bot.webhook import start_webhook, webhook_processes
+from bot.dispatch_queue import dispatch_queue, poll_updates, handler_key
+from bot.callbacks import callback_router
+from bot.questions import question_pool
+from bot.pending_store import pending_tests
+from bot.audio_cache import audio_cache
+from bot.metrics import metrics, MetricsBot, MetricsServer, HandlerMetricsMiddleware, instrument_engine
 
-async def main():
+logger = logging.getLogger(__name__)
+
+async def wait_for_stop(task: asyncio.Task = None):
+    """
+    Ждёт SIGTERM/SIGINT (или завершения task, например polling), чтобы main() дошёл до
+    штатной остановки в finally и записал буферы ответов и отправок.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    signals = (signal.SIGTERM, signal.SIGINT)
+    for sig in signals:
+        loop.add_signal_handler(sig, stop.set)
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait([stopped] if task is None else [stopped, task], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stopped.cancel()
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+    if task is not None and task.done():
+        # Ошибка polling – наружу, после остановки в finally
+        task.result()
+
+async def flush_buffers():
+    """Записывает накопленные отметки об отправке и ответы в тестах; ошибка одного не мешает другому."""
+    try:
+        await run_db(sent_log.flush)
+    except Exception:
+        logger.exception("Ошибка при записи отметок об отправке при остановке")
+    try:
+        await answer_log.close()
+    except Exception:
+        logger.exception("Ошибка при записи ответов в тестах при остановке")
+
+def register_stats():
+    """stats() компонентов процесса бота – в /metrics."""
+    for name, stats in (("dispatch", dispatch_queue.stats), ("sender", message_sender.stats),
+                        ("callbacks", callback_router.stats), ("questions", question_pool.stats),
+                        ("pending_tests", pending_tests.stats), ("answer_log", answer_log.stats),
+                        ("sent_log", sent_log.stats), ("audio_fetch", audio_fetcher.stats),
+                        ("audio_cache", audio_cache.stats), ("audio_prewarm", audio_prewarmer.stats)):
+        metrics.add_stats(name, stats)
+
+async def main(process_index: int = 0):
     init_db()
-    bot = Bot(token=TELEGRAM_TOKEN)
+    instrument_engine(engine)
+    server = TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION
+    # MetricsBot замеряет каждый вызов Bot API (bot/metrics.py)
+    bot = MetricsBot(token=TELEGRAM_TOKEN, connections_limit=BOT_CONNECTIONS_LIMIT, server=server)
     dp = Dispatcher(bot)
+    dp.middleware.setup(HandlerMetricsMiddleware(handler_key))
     handlers.register_handlers(dp)
     register_audio_handlers(dp)
-    scheduler.start_scheduler(dp)
+    register_stats()
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer()
+        await metrics_server.start(METRICS_HOST, METRICS_PORT + process_index)
+    message_sender.start(bot)
+    answer_log.start()
+    audio_prewarmer.start(bot)
+    # Каталог слов загружается до первого апдейта и дальше обновляется по версии в БД
+    await run_db(word_catalog.load)
+    catalog_watcher = asyncio.create_task(watch_catalog())
+    # Тесты собираются заранее, в фоне (bot/questions.py)
+    question_pool.start()
+    # При SCHEDULER_WORKERS > 0 рассылки ведут отдельные процессы (python -m bot.worker);
+    # из нескольких процессов webhook планировщик запускает только первый
+    if SCHEDULER_WORKERS == 0 and process_index == 0:
+        scheduler.start_scheduler(dp)
+    # Апдейты одного чата обрабатываются по порядку, разных чатов – параллельно
+    dispatch_queue.start(dp)
+    webhook = None
+    polling = None
     try:
-        await dp.start_polling()
+        if BOT_MODE == 'webhook':
+            webhook = await start_webhook(dp, dispatch_queue, register=process_index == 0)
+            metrics.add_stats("webhook", webhook.stats)
+            await wait_for_stop()
+        else:
+            polling = asyncio.create_task(poll_updates(dp, dispatch_queue))
+            await wait_for_stop(polling)
     finally:
+        if polling is not None:
+            polling.cancel()
+            await asyncio.gather(polling, return_exceptions=True)
+        if webhook is not None:
+            await webhook.close()
+        await dispatch_queue.close()
+        logger.info(f"Очередь апдейтов: {dispatch_queue.stats()}, кнопки: {callback_router.stats()}, "
+                    f"тесты: {question_pool.stats()}")
+        catalog_watcher.cancel()
+        await question_pool.close()
+        scheduler.stop_scheduler()
+        # Не теряем отметки об отправке и ответы, накопленные в буферах
+        await flush_buffers()
+        await audio_prewarmer.close()
+        await message_sender.close()
+        await audio_fetcher.close()
+        if metrics_server is not None:
+            await metrics_server.close()
         await bot.session.close()
 
+def _process_main(index: int):
+    logger.info(f"Запуск процесса webhook #{index}")
+    asyncio.run(main(index))
+
+def run_webhook_processes(count: int):
+    """Несколько процессов бота на одном порту (SO_REUSEPORT)."""
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_process_main, args=(i,), name=f"webhook-{i}") for i in range(count)]
+    for process in processes:
+        process.start()
+
+    def _stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    for process in processes:
+        process.join()
+
 if __name__ == '__main__':
-    asyncio.run(main())
+    if BOT_MODE == 'webhook' and webhook_processes() > 1:
+        run_webhook_processes(WEBHOOK_PROCESSES)
+    else:
+        asyncio.run(main())
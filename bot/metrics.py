@@ -0,0 +1,377 @@
+# bot/metrics.py
+"""
+Метрики бота в текстовом формате Prometheus (0.0.4) на HTTP /metrics.
+
+    bot_handler_seconds{handler}           время обработчиков апдейтов (гистограмма)
+    bot_handler_errors_total{handler}      обработчики, завершившиеся исключением
+    bot_sql_seconds{operation}             время SQL-запросов (гистограмма; _count – число запросов)
+    bot_api_seconds{method, outcome}       вызовы Bot API: sendMessage, sendAudio, answerCallbackQuery, …
+    bot_scheduler_tick_seconds{job}        длительность последнего тика рассылки
+    bot_scheduler_lag_seconds{job}         насколько позже расписания начался последний тик
+    bot_mailing_overdue_seconds{queue}     сколько ждал самый «просроченный» пользователь тика
+    bot_<компонент>_<поле>                 значения stats() компонентов (очередь апдейтов, отправка, …)
+
+operation (и handler) – вид апдейта, как в bot/dispatch_queue.py (/команда, callback:вид кнопки),
+или имя задачи планировщика; SQL из run_db относится к тому, кто его вызвал (контекст
+копируется в поток). Запись события – поиск серии в словаре и bisect по границам корзин под
+короткой блокировкой; текст собирается только при запросе /metrics. Число серий у метрики
+ограничено: новые значения меток сверх лимита попадают в серию "other".
+"""
+import bisect
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+from aiogram import Bot, types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.utils.exceptions import RetryAfter
+from aiohttp import web
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+MAX_SERIES = 200
+# Long polling висит до таймаута – в задержку Bot API не входит
+UNTIMED_METHODS = {'getUpdates'}
+
+# Кто сейчас выполняется: вид апдейта или задача планировщика
+current_operation = contextvars.ContextVar('current_operation', default='other')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(int(value))
+
+
+def _format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """Метрика с сериями по значениям меток; значения меток передаются позиционно."""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels=(), max_series: int = MAX_SERIES):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.max_series = max_series
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, values: tuple) -> tuple:
+        # Вызывается под блокировкой, только для ещё не встречавшихся значений меток
+        if len(self._series) < self.max_series:
+            return values
+        return ('other',) * len(values)
+
+    def render(self, lines: list):
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} {self.type}")
+        with self._lock:
+            series = [(values, self._copy(value)) for values, value in self._series.items()]
+        for values, value in series:
+            self._render_series(lines, values, value)
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def _render_series(self, lines: list, values: tuple, value):
+        lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}")
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *values, amount: float = 1):
+        with self._lock:
+            if values not in self._series:
+                values = self._key(values)
+            self._series[values] = self._series.get(values, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, *values):
+        with self._lock:
+            if values not in self._series:
+                values = self._key(values)
+            self._series[values] = value
+
+
+class Histogram(Metric):
+    """Серия – счётчики по корзинам (последняя – +Inf) и сумма наблюдений."""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS,
+                 max_series: int = MAX_SERIES):
+        super().__init__(name, documentation, labels, max_series)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series.setdefault(self._key(values), [0] * (len(self.buckets) + 1) + [0.0])
+            series[index] += 1
+            series[-1] += value
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+    def _render_series(self, lines: list, values: tuple, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), value):
+            cumulative += count
+            le = 'le="' + _format_value(float(bound)) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+        labels = _format_labels(self.labels, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(value[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+
+
+class MetricsRegistry:
+    """
+    Все метрики процесса. Кроме собственных метрик сюда подключаются stats() компонентов
+    (add_stats): числа становятся метриками bot_<имя>_<поле>, словари чисел – метрикой
+    с меткой key; вложенные словари словарей пропускаются.
+    """
+
+    def __init__(self, prefix: str = 'bot'):
+        self.prefix = prefix
+        self._metrics = []
+        self._stats = {}    # имя -> функция stats()
+
+    def _add(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self._add(Counter(f"{self.prefix}_{name}", documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels=()) -> Gauge:
+        return self._add(Gauge(f"{self.prefix}_{name}", documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(f"{self.prefix}_{name}", documentation, labels, buckets))
+
+    def add_stats(self, name: str, stats):
+        """Подключает stats() компонента; повторный вызов с тем же именем заменяет источник."""
+        self._stats[name] = stats
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            metric.render(lines)
+        for name, stats in list(self._stats.items()):
+            try:
+                values = stats()
+            except Exception:
+                logger.exception(f"Ошибка при сборе метрик {name}")
+                continue
+            self._render_stats(lines, f"{self.prefix}_{name}", values)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_stats(lines: list, prefix: str, values: dict):
+        for field, value in values.items():
+            name = f"{prefix}_{field}"
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE {name} untyped")
+                lines.append(f"{name} {_format_value(value)}")
+            elif isinstance(value, dict) and value and all(isinstance(v, (int, float)) for v in value.values()):
+                lines.append(f"# TYPE {name} untyped")
+                for key, item in value.items():
+                    lines.append(f"{name}{{key=\"{_escape(key)}\"}} {_format_value(item)}")
+
+
+metrics = MetricsRegistry()
+
+handler_seconds = metrics.histogram("handler_seconds", "Время обработки апдейта", ("handler",))
+handler_errors = metrics.counter("handler_errors_total", "Апдейты, обработчик которых упал", ("handler",))
+sql_seconds = metrics.histogram("sql_seconds", "Время SQL-запроса", ("operation",), SQL_BUCKETS)
+api_seconds = metrics.histogram("api_seconds", "Время вызова Bot API", ("method", "outcome"))
+scheduler_tick_seconds = metrics.gauge("scheduler_tick_seconds", "Длительность последнего тика", ("job",))
+scheduler_lag_seconds = metrics.gauge("scheduler_lag_seconds", "Опоздание начала тика относительно расписания",
+                                      ("job",))
+scheduler_ticks = metrics.counter("scheduler_ticks_total", "Выполненные тики", ("job", "outcome"))
+mailing_overdue_seconds = metrics.gauge("mailing_overdue_seconds",
+                                        "Сколько ждал самый просроченный пользователь на начало тика", ("queue",))
+
+
+# Обработчики апдейтов
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время обработки сообщений и нажатий по видам. Обработчики вызываются из
+    ChatDispatchQueue через dp.process_update, поэтому хуки – на уровне message
+    и callback_query (post_process вызывается и после исключения в обработчике).
+    Вид апдейта очередь уже определила при постановке и выставила в current_operation;
+    kind_of вызывается, только если апдейт пришёл в диспетчер мимо очереди.
+    Метка handler – только зарегистрированные команды и виды кнопок: handler_key сводит
+    прочий текст со слэшем в 'other', и мусорные команды не вытесняют настоящие из MAX_SERIES рядов.
+    """
+
+    def __init__(self, kind_of):
+        super().__init__()
+        self._kind_of = kind_of    # апдейт -> вид (bot.dispatch_queue.handler_key)
+        self._started = contextvars.ContextVar('handler_started', default=None)
+
+    def _kind(self, update) -> str:
+        kind = current_operation.get()
+        return kind if kind != 'other' else self._kind_of(update)
+
+    def _begin(self):
+        kind = current_operation.get()
+        token = None
+        if kind == 'other':
+            kind = self._kind_of(types.Update.get_current())
+            token = current_operation.set(kind)
+        self._started.set((kind, time.perf_counter(), token))
+
+    def _end(self):
+        started = self._started.get()
+        if started is None:
+            return
+        kind, at, token = started
+        handler_seconds.observe(time.perf_counter() - at, kind)
+        if token is not None:
+            current_operation.reset(token)
+
+    async def on_pre_process_message(self, message, data):
+        self._begin()
+
+    async def on_post_process_message(self, message, results, data):
+        self._end()
+
+    async def on_pre_process_callback_query(self, callback_query, data):
+        self._begin()
+
+    async def on_post_process_callback_query(self, callback_query, results, data):
+        self._end()
+
+    async def on_pre_process_error(self, update, exception, data):
+        handler_errors.inc(self._kind(update))
+
+
+# SQL
+
+def instrument_engine(engine):
+    """
+    Число и время SQL-запросов по операциям (события движка SQLAlchemy). Запросы,
+    завершившиеся ошибкой, не учитываются. С любым обработчиком событий SQLAlchemy идёт
+    по более медленному пути выполнения – около 15 мкс на запрос (python bench.py metrics).
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'metrics_started', None)
+        if started is not None:
+            sql_seconds.observe(time.perf_counter() - started, current_operation.get())
+
+
+# Bot API
+
+class MetricsBot(Bot):
+    """Bot, который замеряет каждый вызов Bot API (send_message, send_audio, answer_callback_query, …)."""
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if method in UNTIMED_METHODS:
+            return await super().request(method, data, files, **kwargs)
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except RetryAfter:
+            outcome = 'retry_after'
+            raise
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            api_seconds.observe(time.perf_counter() - started, method, outcome)
+
+
+# Планировщик
+
+def timed_job(job_name: str):
+    """Декоратор задачи планировщика: длительность тика, исход и SQL под именем задачи."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = current_operation.set(job_name)
+            started = time.monotonic()
+            outcome = 'error'
+            try:
+                result = await fn(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                scheduler_tick_seconds.set(time.monotonic() - started, job_name)
+                scheduler_ticks.inc(job_name, outcome)
+                current_operation.reset(token)
+        return wrapper
+    return decorator
+
+
+def on_job_submitted(event):
+    """Слушатель APScheduler (EVENT_JOB_SUBMITTED): опоздание запуска задачи."""
+    if not event.scheduled_run_times:
+        return
+    scheduled = event.scheduled_run_times[-1]
+    lag = (datetime.now(scheduled.tzinfo) - scheduled).total_seconds()
+    scheduler_lag_seconds.set(max(lag, 0.0), event.job_id)
+
+
+# HTTP
+
+class MetricsServer:
+    """aiohttp-сервер с единственным GET /metrics."""
+
+    def __init__(self, registry: MetricsRegistry = metrics):
+        self.registry = registry
+        self._runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    async def start(self, host: str, port: int):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Метрики: http://{host}:{port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,219 @@
+# bot/migrations.py
+"""
+Версионные миграции схемы для SQLite и PostgreSQL.
+
+    python -m bot.migrations            # применить недостающие миграции (то же делает init_db)
+    python -m bot.migrations status     # какие миграции применены
+    python -m bot.migrations check      # планы горячих запросов: ошибка, если где-то полный скан
+
+create_all создаёт только отсутствующие таблицы; всё, что меняет уже существующие
+(столбцы, индексы, ограничения), оформляется миграцией в MIGRATIONS. Применённые
+версии записываются в schema_version. Миграции идемпотентны: на новой базе, где
+create_all уже создал всё по моделям, они ничего не меняют.
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime
+from sqlalchemy import inspect, text, func, select, update, delete
+from bot.database import engine, Base, UserSettings, UserWordStatus, chat_hash
+
+logger = logging.getLogger(__name__)
+
+
+def _add_missing_columns(conn):
+    """Добавляет в существующие таблицы новые nullable-столбцы (create_all этого не делает)."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+            logger.info(f"Добавлен столбец {table.name}.{column.name}")
+
+
+def _user_word_unique(conn):
+    """Склеивает дубли (chat_id, word_id) и создаёт уникальный индекс под upsert в bot/sent_log.py."""
+    inspector = inspect(conn)
+    name = 'uq_user_word_status_chat_word'
+    if any(c['name'] == name for c in inspector.get_unique_constraints('user_word_status')) or \
+            any(i['name'] == name for i in inspector.get_indexes('user_word_status')):
+        return
+    uws = UserWordStatus.__table__
+    duplicates = conn.execute(
+        select(uws.c.chat_id, uws.c.word_id, func.min(uws.c.id),
+               func.sum(uws.c.sent_count), func.max(uws.c.last_sent),
+               func.sum(uws.c.correct_answers), func.sum(uws.c.incorrect_answers))
+        .group_by(uws.c.chat_id, uws.c.word_id)
+        .having(func.count(uws.c.id) > 1)
+    ).all()
+    for chat_id, word_id, keep_id, sent_count, last_sent, correct, incorrect in duplicates:
+        conn.execute(update(uws).where(uws.c.id == keep_id).values(
+            sent_count=sent_count, last_sent=last_sent,
+            correct_answers=correct or 0, incorrect_answers=incorrect or 0))
+        conn.execute(delete(uws).where(uws.c.chat_id == chat_id, uws.c.word_id == word_id,
+                                       uws.c.id != keep_id))
+    conn.execute(text(f'CREATE UNIQUE INDEX {name} ON user_word_status (chat_id, word_id)'))
+    logger.info(f"Создан уникальный индекс {name}, склеено дублей: {len(duplicates)}")
+
+
+def _create_model_indexes(conn):
+    """Создаёт индексы, объявленные в моделях (__table_args__, index=True), которых ещё нет в базе."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            index.create(conn)
+            logger.info(f"Создан индекс {index.name}")
+
+
+def _user_chat_hash(conn):
+    """Столбец user_settings.chat_hash и его заполнение: crc32 в SQL не везде есть, поэтому в Python."""
+    _add_missing_columns(conn)
+    users = UserSettings.__table__
+    rows = conn.execute(select(users.c.id, users.c.chat_id).where(users.c.chat_hash.is_(None))).all()
+    for user_id, chat_id in rows:
+        conn.execute(update(users).where(users.c.id == user_id).values(chat_hash=chat_hash(chat_id)))
+    logger.info(f"Заполнен chat_hash у {len(rows)} пользователей")
+
+
+def _srs_columns(conn):
+    _add_missing_columns(conn)
+    _create_model_indexes(conn)
+
+
+# (версия, описание, функция(conn)); новые миграции добавляются в конец
+MIGRATIONS = [
+    (1, "nullable-столбцы, добавленные после первого релиза", _add_missing_columns),
+    (2, "уникальность user_word_status (chat_id, word_id)", _user_word_unique),
+    (3, "индексы горячих запросов", _create_model_indexes),
+    (4, "интервальное повторение: столбцы и индекс (chat_id, due_at)", _srs_columns),
+    (5, "начало круга слов пользователя (user_seen_state.cycle_started_at)", _add_missing_columns),
+    (6, "флаг «повторять чаще» у каждого пользователя (user_word_status.repeat_more)", _add_missing_columns),
+    (7, "crc32 chat_id для выборки партиций планировщика в SQL (user_settings.chat_hash)", _user_chat_hash),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)'
+    ))
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_version'))}
+
+
+def run_migrations():
+    """Применяет миграции, которых нет в schema_version; каждая – в своей транзакции."""
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                migrate(conn)
+                conn.execute(text('INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)'),
+                             {'v': version, 'n': name, 't': datetime.now()})
+        except Exception:
+            # Бот и планировщики стартуют одновременно – миграцию мог применить соседний процесс
+            with engine.begin() as conn:
+                if version in applied_versions(conn):
+                    continue
+            raise
+        logger.info(f"Применена миграция {version}: {name}")
+        applied.append(version)
+    return applied
+
+
+# Горячие запросы: (название, SQL, параметры). Должны идти по индексу, а не полным сканом.
+HOT_QUERIES = [
+    ("непоказанные слова пользователя",
+     "SELECT word_id FROM user_word_status WHERE chat_id = :chat_id AND last_sent >= :since",
+     {'chat_id': '1', 'since': datetime(2000, 1, 1)}),
+    ("прогресс пользователя",
+     "SELECT count(id) FROM user_word_status WHERE chat_id = :chat_id", {'chat_id': '1'}),
+    ("настройки пользователя",
+     "SELECT * FROM user_settings WHERE chat_id = :chat_id", {'chat_id': '1'}),
+    ("пользователи с близкой рассылкой",
+     "SELECT * FROM user_settings WHERE next_words_at <= :horizon OR next_test_at <= :horizon "
+     "OR next_words_at IS NULL OR next_test_at IS NULL", {'horizon': datetime(2000, 1, 1)}),
+    ("слова на повторение",
+     "SELECT word_id FROM user_word_status WHERE chat_id = :chat_id AND due_at <= :now "
+     "AND (last_sent IS NULL OR last_sent < due_at OR last_sent <= :shown) ORDER BY due_at LIMIT 5",
+     {'chat_id': '1', 'now': datetime(2000, 1, 2), 'shown': datetime(2000, 1, 1)}),
+    ("слова по части речи",
+     "SELECT id FROM words WHERE part_of_speech = :pos", {'pos': 'nimisõna'}),
+]
+
+
+def _plan(conn, sql, params):
+    if conn.dialect.name == 'sqlite':
+        return [row[3] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'), params)]
+    if conn.dialect.name == 'postgresql':
+        # На маленьких таблицах планировщик и так выберет seq scan – запрещаем его,
+        # чтобы проверить, что подходящий индекс вообще есть
+        conn.execute(text('SET LOCAL enable_seqscan = off'))
+        return [row[0] for row in conn.execute(text(f'EXPLAIN {sql}'), params)]
+    return []
+
+
+def _is_full_scan(step: str) -> bool:
+    return step.startswith('SCAN ') or 'Seq Scan' in step
+
+
+def check_query_plans():
+    """Возвращает [(название, план)] горячих запросов, которые читают таблицу целиком."""
+    failures = []
+    with engine.connect() as conn:
+        for name, sql, params in HOT_QUERIES:
+            try:
+                with conn.begin():
+                    plan = _plan(conn, sql, params)
+            except Exception as e:
+                # Например, нет столбца – миграции ещё не применены
+                failures.append((name, [f"ошибка: {e.__class__.__name__}: {e.orig if hasattr(e, 'orig') else e}"]))
+                continue
+            if any(_is_full_scan(step) for step in plan):
+                failures.append((name, plan))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status", "check"])
+    args = parser.parse_args()
+    if args.command == "upgrade":
+        Base.metadata.create_all(engine)
+        applied = run_migrations()
+        print(f"Применено миграций: {len(applied)}")
+    elif args.command == "status":
+        with engine.begin() as conn:
+            done = applied_versions(conn)
+        for version, name, _ in MIGRATIONS:
+            print(f"{'+' if version in done else '-'} {version:>3} {name}")
+    else:
+        failures = check_query_plans()
+        for name, plan in failures:
+            print(f"ПОЛНЫЙ СКАН ИЛИ ОШИБКА: {name}")
+            for step in plan:
+                print(f"    {step}")
+        if failures:
+            sys.exit(1)
+        print(f"Все {len(HOT_QUERIES)} горячих запросов идут по индексам")
+
+
+if __name__ == '__main__':
+    main()
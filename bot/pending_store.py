@@ -0,0 +1,242 @@
+# bot/pending_store.py
+"""
+Хранилище тестов с вводом ответа, которые ждут ответа пользователя.
+
+Ключ – (chat_id, message_id вопроса): у пользователя может быть несколько открытых
+вопросов (tests_per_batch > 1). Ответ реплаем находит свой вопрос; обычное сообщение
+отвечает на последний заданный. Записи живут ttl секунд, всего их не больше max_size –
+лишние вытесняются, начиная с самых старых.
+
+    memory – OrderedDict в процессе бота, вытеснение и истечение за O(1);
+    db     – таблица pending_tests в DATABASE_URL, общая для бота и процессов-планировщиков
+             (python -m bot.worker) на любых машинах;
+    sqlite – файл, общий только для процессов одной машины.
+"""
+import logging
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func
+from bot.database import engine, PendingTest
+from config.settings import PENDING_STORE, PENDING_SQLITE_PATH, PENDING_TTL_SECONDS, PENDING_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class PendingStore(ABC):
+    """Общая часть: параметры и счётчики (hits / misses / expired / evicted)."""
+
+    def __init__(self, ttl: int, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @abstractmethod
+    def __len__(self):
+        """Сколько вопросов ждёт ответа."""
+
+    @abstractmethod
+    def put(self, chat_id: str, message_id: int, word_id: int, expected: str):
+        """Запоминает заданный вопрос."""
+
+    @abstractmethod
+    def take(self, chat_id: str, message_id: int = None):
+        """Забирает вопрос (по message_id или последний в чате); None, если ждать нечего."""
+
+    def stats(self) -> dict:
+        return {'size': len(self), 'hits': self.hits, 'misses': self.misses,
+                'expired': self.expired, 'evicted': self.evicted}
+
+
+class MemoryPendingStore(PendingStore):
+    """
+    Записи лежат в OrderedDict в порядке добавления. TTL у всех одинаковый, поэтому
+    первыми истекают и вытесняются записи из начала – и то и другое за O(1).
+    """
+
+    def __init__(self, ttl: int = PENDING_TTL_SECONDS, max_size: int = PENDING_MAX_SIZE):
+        super().__init__(ttl, max_size)
+        self._items = OrderedDict()  # (chat_id, message_id) -> (expires_at, {'word_id', 'expected'})
+        self._by_chat = {}           # chat_id -> {message_id: None} в порядке добавления
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _drop(self, key):
+        chat_id, message_id = key
+        _, value = self._items.pop(key)
+        questions = self._by_chat[chat_id]
+        del questions[message_id]
+        if not questions:
+            del self._by_chat[chat_id]
+        return value
+
+    def _purge(self, now: float):
+        while self._items:
+            key, (expires_at, _) = next(iter(self._items.items()))
+            if expires_at > now:
+                break
+            self._drop(key)
+            self.expired += 1
+
+    def put(self, chat_id: str, message_id: int, word_id: int, expected: str):
+        key = (chat_id, message_id)
+        now = time.monotonic()
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = (now + self.ttl, {'word_id': word_id, 'expected': expected})
+            self._by_chat.setdefault(chat_id, {})[message_id] = None
+            self._purge(now)
+            while len(self._items) > self.max_size:
+                self._drop(next(iter(self._items)))
+                self.evicted += 1
+
+    def take(self, chat_id: str, message_id: int = None):
+        with self._lock:
+            self._purge(time.monotonic())
+            questions = self._by_chat.get(chat_id)
+            if questions and message_id is None:
+                message_id = next(reversed(questions))
+            key = (chat_id, message_id)
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._drop(key)
+
+
+class SqlitePendingStore(PendingStore):
+    """
+    Записи в отдельном SQLite-файле (WAL), чтобы вопрос, отправленный процессом-планировщиком,
+    нашёл обработчик в процессе бота. Истёкшие записи удаляются при добавлении новых,
+    размер проверяется раз в CAP_CHECK_EVERY добавлений.
+    """
+    CAP_CHECK_EVERY = 100
+
+    def __init__(self, path: str = PENDING_SQLITE_PATH, ttl: int = PENDING_TTL_SECONDS,
+                 max_size: int = PENDING_MAX_SIZE):
+        super().__init__(ttl, max_size)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending_tests ('
+            'chat_id TEXT NOT NULL, message_id INTEGER NOT NULL, word_id INTEGER NOT NULL, '
+            'expected TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (chat_id, message_id))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_pending_tests_expires ON pending_tests (expires_at)')
+        self._lock = threading.Lock()
+        self._puts = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT count(*) FROM pending_tests').fetchone()[0]
+
+    def put(self, chat_id: str, message_id: int, word_id: int, expected: str):
+        # Время стены, а не monotonic: файл читают разные процессы
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO pending_tests VALUES (?, ?, ?, ?, ?)',
+                               (chat_id, message_id, word_id, expected, now + self.ttl))
+            self.expired += self._conn.execute('DELETE FROM pending_tests WHERE expires_at <= ?', (now,)).rowcount
+            self._puts += 1
+            if self._puts % self.CAP_CHECK_EVERY == 0:
+                size = self._conn.execute('SELECT count(*) FROM pending_tests').fetchone()[0]
+                if size > self.max_size:
+                    self.evicted += self._conn.execute(
+                        'DELETE FROM pending_tests WHERE rowid IN '
+                        '(SELECT rowid FROM pending_tests ORDER BY expires_at LIMIT ?)',
+                        (size - self.max_size,)).rowcount
+
+    def take(self, chat_id: str, message_id: int = None):
+        where, params = 'chat_id = ? AND expires_at > ?', [chat_id, time.time()]
+        if message_id is not None:
+            where += ' AND message_id = ?'
+            params.append(message_id)
+        with self._lock:
+            # DELETE ... RETURNING забирает запись атомарно: ответ не засчитается дважды,
+            # даже если его увидят два процесса
+            row = self._conn.execute(
+                'DELETE FROM pending_tests WHERE rowid = (SELECT rowid FROM pending_tests '
+                f'WHERE {where} ORDER BY message_id DESC LIMIT 1) RETURNING word_id, expected',
+                params).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {'word_id': row[0], 'expected': row[1]}
+
+
+class DbPendingStore(PendingStore):
+    """
+    Записи в таблице pending_tests основной БД: вопрос, отправленный планировщиком на одном
+    dyno/машине, находит обработчик бота на другом. Как и в SqlitePendingStore, истёкшие
+    записи удаляются при добавлении новых, размер проверяется раз в CAP_CHECK_EVERY добавлений.
+    """
+    CAP_CHECK_EVERY = 100
+
+    def __init__(self, ttl: int = PENDING_TTL_SECONDS, max_size: int = PENDING_MAX_SIZE):
+        super().__init__(ttl, max_size)
+        self._table = PendingTest.__table__
+        self._lock = threading.Lock()
+        self._puts = 0
+
+    def __len__(self):
+        with engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(self._table)).scalar()
+
+    def put(self, chat_id: str, message_id: int, word_id: int, expected: str):
+        table = self._table
+        now = datetime.now()
+        with self._lock:
+            self._puts += 1
+            check_size = self._puts % self.CAP_CHECK_EVERY == 0
+        with engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.chat_id == chat_id, table.c.message_id == message_id))
+            conn.execute(table.insert().values(chat_id=chat_id, message_id=message_id, word_id=word_id,
+                                               expected=expected, expires_at=now + timedelta(seconds=self.ttl)))
+            self.expired += conn.execute(delete(table).where(table.c.expires_at <= now)).rowcount
+            if check_size:
+                size = conn.execute(select(func.count()).select_from(table)).scalar()
+                if size > self.max_size:
+                    oldest = select(table.c.expires_at).order_by(table.c.expires_at) \
+                        .offset(size - self.max_size - 1).limit(1).scalar_subquery()
+                    self.evicted += conn.execute(delete(table).where(table.c.expires_at <= oldest)).rowcount
+
+    def take(self, chat_id: str, message_id: int = None):
+        table = self._table
+        query = select(table.c.message_id, table.c.word_id, table.c.expected).where(
+            table.c.chat_id == chat_id, table.c.expires_at > datetime.now())
+        if message_id is not None:
+            query = query.where(table.c.message_id == message_id)
+        with engine.begin() as conn:
+            row = conn.execute(query.order_by(table.c.message_id.desc()).limit(1)).first()
+            # Забирает запись тот, чей DELETE её удалил: ответ не засчитается дважды,
+            # даже если его увидят два процесса
+            if row is None or not conn.execute(delete(table).where(
+                    table.c.chat_id == chat_id, table.c.message_id == row.message_id)).rowcount:
+                self.misses += 1
+                return None
+        self.hits += 1
+        return {'word_id': row.word_id, 'expected': row.expected}
+
+
+def create_pending_store(kind: str = PENDING_STORE) -> PendingStore:
+    if kind == 'db':
+        logger.info("Ожидающие тесты хранятся в таблице pending_tests основной БД")
+        return DbPendingStore()
+    if kind == 'sqlite':
+        logger.info(f"Ожидающие тесты хранятся в {PENDING_SQLITE_PATH}")
+        return SqlitePendingStore()
+    return MemoryPendingStore()
+
+
+pending_tests = create_pending_store()
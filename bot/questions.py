@@ -0,0 +1,241 @@
+# bot/questions.py
+import asyncio
+import json
+import logging
+import random
+import threading
+from collections import OrderedDict, deque
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ForceReply
+from bot.callbacks import TEST_ANSWER, TEST_ANSWER_REV
+from bot.catalog import word_catalog
+from bot.distractors import distractor_index
+from config.settings import QUESTION_POOL_SIZE, QUESTION_POOL_BATCH, QUESTION_NO_REPEAT, SAMPLER_MAX_USERS
+
+logger = logging.getLogger(__name__)
+
+# Типы тестов: 1 – выбрать перевод, 2 – выбрать эстонское слово, 3 – ввести перевод
+TEST_TYPES = (1, 2, 3)
+TEST_WEIGHTS = (40, 40, 20)
+# Сколько вопросов из начала пула просматривать в поисках слова, которого пользователь не видел недавно
+SCAN_LIMIT = 8
+
+FORCE_REPLY = json.dumps(ForceReply(selective=True).to_python())
+
+
+class Question:
+    """
+    Готовый к отправке тест: текст, reply_markup уже сериализован в JSON-строку
+    (как карточки в bot/word_cards.py). Ответ на тест с вариантами зашифрован в
+    callback_data кнопок; для теста с вводом expected – ожидаемый перевод.
+    words – записи каталога, из которых собран вопрос (загаданное слово и варианты).
+    """
+
+    __slots__ = ('test_type', 'word_id', 'text', 'reply_markup', 'expected', 'words')
+
+    def __init__(self, test_type: int, word_id: int, text: str, reply_markup: str, expected: str, words):
+        self.test_type = test_type
+        self.word_id = word_id
+        self.text = text
+        self.reply_markup = reply_markup
+        self.expected = expected
+        self.words = words
+
+    @property
+    def needs_reply(self) -> bool:
+        """Ответ приходит сообщением: вопрос нужно запомнить в pending_tests после отправки."""
+        return self.test_type == 3
+
+
+def build_question(test_type: int, exclude=(), attempts: int = 4):
+    """
+    Собирает тест заданного типа по каталогу в памяти; слова из exclude по возможности
+    не загадываются. Если для вариантов ответа не хватает слов – тест с вводом ответа.
+    None – словарь пуст.
+    """
+    for attempt in range(attempts):
+        word, others = distractor_index.pick(test_type)
+        if word is None:
+            return None
+        if word.id not in exclude:
+            break
+    if test_type != 3 and len(others) < 3:
+        test_type = 3
+    if test_type == 3:
+        return Question(3, word.id, f"❓ Введите перевод для слова <b>{word.word_et}</b>:", FORCE_REPLY,
+                        word.translation, (word,))
+    if test_type == 1:
+        correct = word.translation
+        options = [correct] + [w.translation for w in others]
+        callback_type = TEST_ANSWER
+        text = f"❓ Как переводится слово <b>{word.word_et}</b>?"
+    else:
+        correct = word.word_et
+        options = [correct] + [w.word_et for w in others]
+        callback_type = TEST_ANSWER_REV
+        text = f"❓ Как по‑эстонски будет слово <b>{word.translation}</b>?"
+    random.shuffle(options)
+    correct_index = options.index(correct)
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    for idx, option in enumerate(options):
+        keyboard.add(InlineKeyboardButton(option, callback_data=callback_type.data(word.id, idx, idx == correct_index)))
+    return Question(test_type, word.id, text, json.dumps(keyboard.to_python(), ensure_ascii=False), None,
+                    (word, *others))
+
+
+class QuestionPool:
+    """
+    Пул заранее собранных тестов каждого типа. Фоновая задача дособирает пул пачками
+    по batch, когда в нём остаётся меньше половины size, – «Следующий тест» и рассылка
+    берут готовый вопрос без сборки. Пользователю не загадывается слово из его последних
+    no_repeat тестов: такой вопрос остаётся в пуле для других. Если подходящего готового
+    вопроса нет (пул пуст, словарь только что обновился), вопрос собирается на месте.
+    При обновлении словаря выбрасываются только вопросы с изменившимися словами.
+
+    take() можно вызывать и из потоков run_db (рассылка тестов планировщиком).
+    Метрики: served, pool_hits, built_inline, repeats_skipped, produced – stats().
+    """
+
+    def __init__(self, size: int = QUESTION_POOL_SIZE, batch: int = QUESTION_POOL_BATCH,
+                 no_repeat: int = QUESTION_NO_REPEAT, max_users: int = SAMPLER_MAX_USERS):
+        self.size = size
+        self.batch = batch
+        self.no_repeat = no_repeat
+        self.max_users = max_users
+        self._pools = {test_type: deque() for test_type in TEST_TYPES}
+        self._recent = OrderedDict()   # chat_id -> deque последних загаданных word_id
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        # Метрики
+        self.served = 0
+        self.pool_hits = 0
+        self.built_inline = 0
+        self.repeats_skipped = 0
+        self.produced = 0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._task = asyncio.create_task(self._producer())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._loop = None
+
+    def on_catalog(self, catalog):
+        # Вызывается и из потоков run_db (правка слова), пока take() забирает вопросы:
+        # tuple(pool) копирует очередь целиком, без переключения потоков посреди обхода
+        self._pools = {
+            test_type: deque(question for question in tuple(pool)
+                             if all(catalog.get(word.id) == word for word in question.words))
+            for test_type, pool in self._pools.items()
+        }
+        self._wake()
+
+    @property
+    def depth(self) -> int:
+        return sum(len(pool) for pool in self._pools.values())
+
+    def stats(self) -> dict:
+        return {'depth': {test_type: len(pool) for test_type, pool in self._pools.items()},
+                'served': self.served, 'pool_hits': self.pool_hits, 'built_inline': self.built_inline,
+                'repeats_skipped': self.repeats_skipped, 'produced': self.produced}
+
+    def _wake(self):
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wakeup.set()
+        else:
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _recent_words(self, chat_id: str) -> deque:
+        with self._lock:
+            recent = self._recent.get(chat_id)
+            if recent is None:
+                recent = self._recent[chat_id] = deque(maxlen=self.no_repeat)
+                while len(self._recent) > self.max_users:
+                    self._recent.popitem(last=False)
+            else:
+                self._recent.move_to_end(chat_id)
+            return recent
+
+    def _pop(self, pool: deque, recent):
+        for _ in range(min(len(pool), SCAN_LIMIT)):
+            try:
+                question = pool.popleft()
+            except IndexError:
+                return None
+            if question.word_id not in recent:
+                return question
+            # Слово пользователь видел недавно – вопрос достанется кому-нибудь другому
+            self.repeats_skipped += 1
+            pool.append(question)
+        return None
+
+    def take(self, chat_id: str, test_type: int = None):
+        """Тест для пользователя (тип – случайно по TEST_WEIGHTS); None – словарь пуст."""
+        if test_type is None:
+            test_type = random.choices(TEST_TYPES, weights=TEST_WEIGHTS)[0]
+        recent = self._recent_words(chat_id)
+        pool = self._pools[test_type]
+        question = self._pop(pool, recent)
+        if question is not None:
+            self.pool_hits += 1
+        else:
+            question = build_question(test_type, recent)
+            if question is None:
+                return None
+            self.built_inline += 1
+        if len(pool) < self.size // 2:
+            self._wake()
+        recent.append(question.word_id)
+        self.served += 1
+        return question
+
+    def fill(self, test_type: int, count: int) -> int:
+        """Дособирает до count вопросов типа test_type; возвращает число собранных."""
+        pool = self._pools[test_type]
+        added = 0
+        for _ in range(count):
+            question = build_question(test_type)
+            if question is None:
+                break
+            # Для вариантов ответа не хватило слов – вопрос другого типа в этот пул не кладём
+            if question.test_type == test_type:
+                pool.append(question)
+                added += 1
+        self.produced += added
+        return added
+
+    async def _producer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                for test_type in TEST_TYPES:
+                    # Пачками: между ними event loop успевает обработать апдейты
+                    while len(self._pools[test_type]) < self.size:
+                        count = min(self.batch, self.size - len(self._pools[test_type]))
+                        if not self.fill(test_type, count):
+                            break
+                        await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка при подготовке тестов")
+                await asyncio.sleep(1)
+
+
+question_pool = QuestionPool()
+word_catalog.subscribe(question_pool.on_catalog)
@@ -1,126 +1,333 @@
 # bot/scheduler.py
 import asyncio
-from datetime import datetime
+import functools
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from bot.database import SessionLocal, Word, UserSettings, UserWordStatus
+from bot.database import SessionLocal, UserSettings, UserWordStatus, run_db
 from aiogram import Dispatcher
 from sqlalchemy.sql import func
-import random
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ForceReply
-from bot.handlers import get_word_message, mark_word_as_sent, pending_typing_tests
+from bot.handlers import mark_word_as_sent
+from bot.questions import question_pool
+from bot.pending_store import pending_tests
+from bot.due_queue import words_queue, tests_queue, next_due_time, schedule_user
+from bot.sender import message_sender, wait_sent
+from bot.srs import pick_mailing_words
+from bot.catalog import word_catalog
+from bot.word_cards import word_cards
+from bot.sent_log import sent_log
+from bot.audio_prewarm import audio_prewarmer
+from bot.leases import PartitionLease, partition_of, in_partitions
+from bot.metrics import timed_job, on_job_submitted, mailing_overdue_seconds
+from config.settings import (MAILING_TICK_SECONDS as TICK_SECONDS, SCHEDULER_HEARTBEAT_SECONDS,
+                             STATS_SPREAD_MINUTES, STATS_BATCH)
 
 scheduler = AsyncIOScheduler()
+logger = logging.getLogger(__name__)
 
-# Глобальные словари для фиксации времени последней рассылки для каждого пользователя
-last_mailing_time = {}
-last_test_time = {}
+# Сколько chat_id подгружать одним запросом при обработке тика
+USERS_CHUNK = 500
+# Статистика по тикам планировщика
+tick_durations = {}
+tick_overruns = {}
+# Аренда партиций chat_id: планировщик обслуживает только своих пользователей
+lease = None
 
-async def send_new_words(dp: Dispatcher):
+def _report_tick(job_name: str, started: float):
+    """Запоминает длительность тика и сообщает, если он не уложился в свой период."""
+    duration = time.monotonic() - started
+    tick_durations[job_name] = duration
+    if duration > TICK_SECONDS:
+        tick_overruns[job_name] = tick_overruns.get(job_name, 0) + 1
+        logger.warning(f"Тик {job_name} занял {duration:.1f} с при периоде {TICK_SECONDS} с "
+                       f"(превышений: {tick_overruns[job_name]})")
+
+def _report_overdue(queue, now):
+    """Сколько ждёт самый просроченный пользователь очереди к началу тика."""
+    oldest = queue.peek()
+    overdue = (now - oldest).total_seconds() if oldest is not None and oldest <= now else 0.0
+    mailing_overdue_seconds.set(overdue, queue.name)
+
+def _on_job_max_instances(event):
+    # APScheduler пропускает запуск, если предыдущий тик ещё не закончился
+    tick_overruns[event.job_id] = tick_overruns.get(event.job_id, 0) + 1
+    logger.warning(f"Пропущен тик {event.job_id}: предыдущий ещё выполняется")
+
+def _owns(chat_id: str) -> bool:
+    return lease is None or partition_of(chat_id, lease.partitions) in lease.owned
+
+def _owned_users(query, partitions=None):
+    """Оставляет в запросе только пользователей партиций воркера (или partitions) – условием в SQL."""
+    if lease is None:
+        return query
+    return query.filter(in_partitions(lease.partitions, lease.owned if partitions is None else partitions))
+
+def _load_users(session, chat_ids):
+    for i in range(0, len(chat_ids), USERS_CHUNK):
+        chunk = chat_ids[i:i + USERS_CHUNK]
+        yield from session.query(UserSettings).filter(UserSettings.chat_id.in_(chunk)).all()
+
+def _enqueue_user(user, now):
+    if user.next_words_at is None or user.next_test_at is None:
+        schedule_user(user, now)
+    else:
+        words_queue.schedule(user.chat_id, user.next_words_at)
+        tests_queue.schedule(user.chat_id, user.next_test_at)
+
+def load_due_queues(partitions=None):
+    """
+    Заполняет очереди рассылки из сохранённых next_words_at/next_test_at (например, после рестарта).
+    partitions – загрузить только пользователей этих партиций (None – всех).
+    """
     session = SessionLocal()
-    users = session.query(UserSettings).all()
+    try:
+        now = datetime.now()
+        if partitions is None:
+            words_queue.clear()
+            tests_queue.clear()
+        query = session.query(UserSettings)
+        if partitions is not None:
+            query = _owned_users(query, partitions)
+        for user in query.yield_per(1000):
+            _enqueue_user(user, now)
+        session.commit()
+        logger.info(f"Очереди рассылки загружены: слов – {len(words_queue)}, тестов – {len(tests_queue)}")
+    finally:
+        session.close()
+
+def _sync_due_from_db(session, now):
+    """
+    Подтягивает времена рассылки, изменённые другими процессами (/setsettings, новые пользователи):
+    берутся только пользователи, у которых рассылка в ближайшие пару heartbeat.
+    """
+    horizon = now + timedelta(seconds=SCHEDULER_HEARTBEAT_SECONDS * 2)
+    rows = _owned_users(session.query(UserSettings).filter(
+        (UserSettings.next_words_at <= horizon) | (UserSettings.next_test_at <= horizon)
+        | UserSettings.next_words_at.is_(None) | UserSettings.next_test_at.is_(None)
+    )).all()
+    for user in rows:
+        _enqueue_user(user, now)
+    session.commit()
+
+def _refresh_partitions(session, now):
+    before = set(lease.owned)
+    owned = lease.heartbeat(session, now)
+    lost = before - owned
+    if lost:
+        for queue in (words_queue, tests_queue):
+            queue.remove_where(lambda chat_id: partition_of(chat_id, lease.partitions) in lost)
+    gained = owned - before
+    if gained:
+        load_due_queues(gained)
+    _sync_due_from_db(session, now)
+
+async def refresh_partitions():
+    """Heartbeat аренды: продлевает партиции, подхватывает чужие при падении воркера."""
+    try:
+        await run_db(_refresh_partitions, datetime.now())
+    except Exception as e:
+        logger.exception("Ошибка при обновлении аренды партиций")
+
+def _flush_sent_log(session):
+    """Отметки об отправке за весь тик – одним upsert; при ошибке они остаются в буфере."""
+    try:
+        sent_log.flush(session)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.exception("Ошибка при записи отметок об отправке слов")
+
+def _prepare_new_words(session, chat_ids, now):
+    """Подбирает слова пользователям, у которых подошло время рассылки; возвращает сообщения для отправки."""
+    messages = []
+    for user in _load_users(session, chat_ids):
+        chat_id = user.chat_id
+        try:
+            # Рассылку уже отложил другой процесс (например, прежний владелец партиции)
+            if user.next_words_at is not None and user.next_words_at > now:
+                words_queue.schedule(chat_id, user.next_words_at)
+                continue
+            # Настройки могли измениться после постановки в очередь – проверяем окно ещё раз
+            if next_due_time(now, user.start_time, user.end_time) != now:
+                schedule_user(user, now)
+                session.commit()
+                continue
+            user.last_words_at = now
+            user.next_words_at = next_due_time(now + timedelta(minutes=user.interval_minutes),
+                                               user.start_time, user.end_time)
+            words_queue.schedule(chat_id, user.next_words_at)
+            for word in pick_mailing_words(session, chat_id, user.words_per_hour, now):
+                messages.append((chat_id, word_cards.get(word), word.word_et))
+                mark_word_as_sent(session, chat_id, word.id, flush=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.exception(f"Ошибка при рассылке слов пользователю {chat_id}")
+    _flush_sent_log(session)
+    return messages
+
+@timed_job("send_new_words")
+async def send_new_words(dp: Dispatcher):
+    started = time.monotonic()
     now = datetime.now()
-    for user in users:
-        if user.start_time <= now.strftime("%H:%M") <= user.end_time:
-            last_time = last_mailing_time.get(user.chat_id)
-            if last_time is None or (now - last_time).total_seconds() >= user.interval_minutes * 60:
-                last_mailing_time[user.chat_id] = now
-                bot = dp.bot
-                chat_id = user.chat_id
-                sent_word_ids = [uw.word_id for uw in session.query(UserWordStatus).filter_by(chat_id=chat_id).all()]
-                query = session.query(Word)
-                if sent_word_ids:
-                    query = query.filter(~Word.id.in_(sent_word_ids))
-                words = query.order_by(func.random()).limit(user.words_per_hour).all()
-                if not words:
-                    session.query(UserWordStatus).filter_by(chat_id=chat_id).delete()
-                    session.commit()
-                    words = session.query(Word).order_by(func.random()).limit(user.words_per_hour).all()
-                for word in words:
-                    text, keyboard = get_word_message(word)
-                    await bot.send_message(chat_id, text, parse_mode="HTML", reply_markup=keyboard)
-                    mark_word_as_sent(session, chat_id, word.id)
+    _report_overdue(words_queue, now)
+    chat_ids = [chat_id for chat_id in words_queue.pop_due(now) if _owns(chat_id)]
+    if not chat_ids:
+        return
+    messages = await run_db(_prepare_new_words, chat_ids, now)
+    # Аудио слов готовится параллельно с рассылкой карточек – к нажатию «Послушать»
+    audio_prewarmer.enqueue(dict.fromkeys(word for _, _, word in messages))
+    sent = [message_sender.send_message(chat_id, **card) for chat_id, card, _ in messages]
+    await wait_sent(sent, "send_new_words")
+    _report_tick("send_new_words", started)
+
+def _prepare_test_questions(session, chat_ids, now):
+    """Готовит тесты пользователям, у которых подошло время; возвращает сообщения для отправки."""
+    messages = []
+    for user in _load_users(session, chat_ids):
+        chat_id = user.chat_id
+        try:
+            if user.next_test_at is not None and user.next_test_at > now:
+                tests_queue.schedule(chat_id, user.next_test_at)
+                continue
+            if next_due_time(now, user.start_time, user.end_time) != now:
+                schedule_user(user, now)
                 session.commit()
-    session.close()
+                continue
+            user.last_test_at = now
+            user.next_test_at = next_due_time(now + timedelta(minutes=user.test_interval_minutes),
+                                              user.start_time, user.end_time)
+            tests_queue.schedule(chat_id, user.next_test_at)
+            # Отправляем заданное количество тестов за раз
+            for _ in range(user.tests_per_batch):
+                # Готовые вопросы из пула (bot/questions.py); слово не повторяется подряд
+                question = question_pool.take(chat_id)
+                if question is None:
+                    continue
+                # Тест с вводом ответа запоминается после отправки – нужен message_id
+                pending = (question.word_id, question.expected) if question.needs_reply else None
+                messages.append((chat_id, question.text, question.reply_markup, pending))
+                mark_word_as_sent(session, chat_id, question.word_id, flush=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.exception(f"Ошибка при рассылке тестов пользователю {chat_id}")
+    _flush_sent_log(session)
+    return messages
+
+def _remember_pending(chat_id: str, pending, future):
+    # Сразу после доставки, не дожидаясь остальных сообщений тика: пользователь может ответить быстро
+    if future.cancelled() or future.exception() is not None:
+        return
+    word_id, expected = pending
+    pending_tests.put(chat_id, future.result().message_id, word_id, expected)
 
+@timed_job("send_test_question")
 async def send_test_question(dp: Dispatcher):
-    session = SessionLocal()
-    users = session.query(UserSettings).all()
+    started = time.monotonic()
     now = datetime.now()
-    for user in users:
-        if user.start_time <= now.strftime("%H:%M") <= user.end_time:
-            last_time = last_test_time.get(user.chat_id)
-            if last_time is None or (now - last_time).total_seconds() >= user.test_interval_minutes * 60:
-                last_test_time[user.chat_id] = now
-                bot = dp.bot
-                chat_id = user.chat_id
-                # Отправляем заданное количество тестов за раз
-                for _ in range(user.tests_per_batch):
-                    test_type = random.choices([1, 2, 3], weights=[40, 40, 20])[0]
-                    word = session.query(Word).order_by(func.random()).first()
-                    if not word:
-                        continue
-                    if test_type == 1:
-                        correct = word.translation
-                        options = [correct]
-                        others = session.query(Word).filter(
-                            Word.part_of_speech == word.part_of_speech,
-                            Word.id != word.id
-                        ).order_by(func.random()).limit(3).all()
-                        if len(others) < 3:
-                            continue
-                        for w in others:
-                            options.append(w.translation)
-                        random.shuffle(options)
-                        correct_index = options.index(correct)
-                        keyboard = InlineKeyboardMarkup(row_width=2)
-                        for idx, option in enumerate(options):
-                            keyboard.add(InlineKeyboardButton(option, callback_data=f"test_answer:{word.id}:{idx}:{correct_index}"))
-                        question_text = f"❓ Как переводится слово <b>{word.word_et}</b>?"
-                        await bot.send_message(chat_id, question_text, parse_mode="HTML", reply_markup=keyboard)
-                    elif test_type == 2:
-                        correct = word.word_et
-                        options = [correct]
-                        others = session.query(Word).filter(
-                            Word.part_of_speech == word.part_of_speech,
-                            Word.id != word.id
-                        ).order_by(func.random()).limit(3).all()
-                        if len(others) < 3:
-                            continue
-                        for w in others:
-                            options.append(w.word_et)
-                        random.shuffle(options)
-                        correct_index = options.index(correct)
-                        keyboard = InlineKeyboardMarkup(row_width=2)
-                        for idx, option in enumerate(options):
-                            keyboard.add(InlineKeyboardButton(option, callback_data=f"test_answer_rev:{word.id}:{idx}:{correct_index}"))
-                        question_text = f"❓ Как по‑эстонски будет слово <b>{word.translation}</b>?"
-                        await bot.send_message(chat_id, question_text, parse_mode="HTML", reply_markup=keyboard)
-                    else:
-                        question_text = f"❓ Введите перевод для слова <b>{word.word_et}</b>:"
-                        await bot.send_message(chat_id, question_text, parse_mode="HTML", reply_markup=ForceReply(selective=True))
-                        pending_typing_tests[chat_id] = {'word_id': word.id, 'expected': word.translation}
-                    mark_word_as_sent(session, chat_id, word.id)
-                session.commit()
-    session.close()
+    _report_overdue(tests_queue, now)
+    chat_ids = [chat_id for chat_id in tests_queue.pop_due(now) if _owns(chat_id)]
+    if not chat_ids:
+        return
+    messages = await run_db(_prepare_test_questions, chat_ids, now)
+    sent = []
+    for chat_id, text, reply_markup, pending in messages:
+        future = message_sender.send_message(chat_id, text, parse_mode="HTML", reply_markup=reply_markup)
+        if pending is not None:
+            future.add_done_callback(functools.partial(_remember_pending, chat_id, pending))
+        sent.append(future)
+    await wait_sent(sent, "send_test_question")
+    _report_tick("send_test_question", started)
+
+def render_daily_statistics(total_words: int, seen: int, sent_total: int, correct: int, incorrect: int) -> str:
+    if seen < total_words:
+        stat_text = (f"Доброе утро!\nПоздравляем – вы уже ознакомились с <b>{seen}</b> слов из <b>{total_words}</b>.\n"
+                     "Продолжайте в том же духе!")
+    else:
+        stat_text = (f"Поздравляем!\nВы прошли всю базу из <b>{total_words}</b> слов.\n"
+                     f"Всего отправлено (с учётом повторов): <b>{sent_total}</b> слов.")
+    answers = correct + incorrect
+    if answers:
+        stat_text += f"\nПравильных ответов в тестах: <b>{round(100 * correct / answers)}%</b> ({correct} из {answers})."
+    return stat_text
+
+def _daily_statistics_rows(session):
+    """
+    Статистика пользователей партиций этого воркера одним агрегирующим запросом:
+    (chat_id, просмотрено слов, отправлено с повторами, верных ответов, неверных ответов).
+    Чужие партиции отсекаются в SQL, yield_per читает результат порциями
+    (на PostgreSQL – серверным курсором).
+    """
+    return _owned_users(session.query(
+        UserSettings.chat_id,
+        func.count(UserWordStatus.id),
+        func.coalesce(func.sum(UserWordStatus.sent_count), 0),
+        func.coalesce(func.sum(UserWordStatus.correct_answers), 0),
+        func.coalesce(func.sum(UserWordStatus.incorrect_answers), 0),
+    ).outerjoin(
+        UserWordStatus, UserWordStatus.chat_id == UserSettings.chat_id
+    )).group_by(UserSettings.chat_id).yield_per(STATS_BATCH)
+
+def _collect_daily_statistics(session):
+    messages = []
+    total_words = len(word_catalog.current)
+    spread = STATS_SPREAD_MINUTES * 60
+    for chat_id, seen, sent_total, correct, incorrect in _daily_statistics_rows(session):
+        # Смещение отправки внутри окна STATS_SPREAD_MINUTES – стабильное для каждого пользователя
+        offset = zlib.crc32(chat_id.encode()) % spread if spread else 0
+        messages.append((offset, chat_id, render_daily_statistics(total_words, seen, sent_total, correct, incorrect)))
+    messages.sort()
+    return messages
 
+@timed_job("send_daily_statistics")
 async def send_daily_statistics(dp: Dispatcher):
+    started = time.monotonic()
+    messages = await run_db(_collect_daily_statistics)
+    sent = []
+    for offset, chat_id, stat_text in messages:
+        delay = started + offset - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent.append(message_sender.send_message(chat_id, stat_text, parse_mode="HTML"))
+    await wait_sent(sent, "send_daily_statistics")
+    logger.info(f"Утренняя статистика: {len(sent)} сообщений за {time.monotonic() - started:.1f} с")
+
+def start_scheduler(dp: Dispatcher, worker_id: str = None):
+    """
+    Запускает задачи рассылки. Пользователи делятся по партициям chat_id между всеми
+    запущенными планировщиками (см. bot/leases.py), поэтому одновременно работающие
+    процессы не отправляют одному пользователю одно и то же дважды.
+    """
+    global lease
+    lease = PartitionLease(worker_id)
     session = SessionLocal()
-    users = session.query(UserSettings).all()
-    total_words = session.query(Word).count()
-    for user in users:
-        chat_id = user.chat_id
-        user_sent = session.query(UserWordStatus).filter_by(chat_id=chat_id).count()
-        if user_sent < total_words:
-            stat_text = (f"Доброе утро!\nПоздравляем – вы уже ознакомились с <b>{user_sent}</b> слов из <b>{total_words}</b>.\n"
-                         "Продолжайте в том же духе!")
-        else:
-            stat_text = (f"Поздравляем!\nВы прошли всю базу из <b>{total_words}</b> слов.\n"
-                         f"Всего отправлено (с учётом повторов): <b>{user_sent}</b> слов.")
-        await dp.bot.send_message(chat_id, stat_text, parse_mode="HTML")
-    session.close()
-
-def start_scheduler(dp: Dispatcher):
-    scheduler.add_job(send_new_words, 'interval', minutes=1, args=[dp])
-    scheduler.add_job(send_test_question, 'interval', minutes=1, args=[dp])
-    scheduler.add_job(send_daily_statistics, 'cron', hour=9, minute=0, args=[dp])
+    try:
+        lease.heartbeat(session)
+    finally:
+        session.close()
+    load_due_queues(lease.owned)
+    scheduler.add_job(refresh_partitions, 'interval', seconds=SCHEDULER_HEARTBEAT_SECONDS, id="refresh_partitions")
+    scheduler.add_listener(_on_job_max_instances, EVENT_JOB_MAX_INSTANCES)
+    # Опоздание запуска задач – в метриках (bot/metrics.py)
+    scheduler.add_listener(on_job_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_job(send_new_words, 'interval', seconds=TICK_SECONDS, args=[dp],
+                      id="send_new_words", coalesce=True)
+    scheduler.add_job(send_test_question, 'interval', seconds=TICK_SECONDS, args=[dp],
+                      id="send_test_question", coalesce=True)
+    scheduler.add_job(send_daily_statistics, 'cron', hour=9, minute=0, args=[dp], id="send_daily_statistics")
     scheduler.start()
+
+def stop_scheduler():
+    """Останавливает задачи и освобождает партиции, чтобы их сразу забрали другие воркеры."""
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    if lease is not None:
+        session = SessionLocal()
+        try:
+            lease.release_all(session)
+        finally:
+            session.close()
@@ -0,0 +1,190 @@
+# bot/sender.py
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter, NetworkError
+from config.settings import SENDER_GLOBAL_RATE, SENDER_CHAT_INTERVAL, SENDER_WORKERS, SENDER_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ограничитель скорости: не больше rate операций в секунду, всплеск до capacity."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов (например, после flood control от Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        # Токены снова копятся только с конца паузы: иначе сразу после неё ушёл бы полный всплеск
+        self._updated = self._paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class FanoutSender:
+    """
+    Параллельная отправка сообщений во многие чаты.
+    Общий поток ограничен TokenBucket (лимит Telegram ~30 сообщений/с), в один чат –
+    не чаще раза в chat_interval секунд. Сообщения одного чата уходят строго по очереди:
+    у чата есть своя очередь, и в работе всегда не больше одного его сообщения.
+    """
+
+    def __init__(self, global_rate: float = SENDER_GLOBAL_RATE, chat_interval: float = SENDER_CHAT_INTERVAL,
+                 workers: int = SENDER_WORKERS, max_retries: int = SENDER_MAX_RETRIES):
+        self.chat_interval = chat_interval
+        self.workers = workers
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(global_rate)
+        self._bot = None
+        self._chats = {}           # chat_id -> deque([method, args, kwargs, future, attempts])
+        self._next_allowed = {}    # chat_id -> monotonic-время, раньше которого писать в чат нельзя
+        self._ready = None         # (ready_at, seq, chat_id): чаты, у которых есть что отправить
+        self._counter = itertools.count()
+        self._tasks = []
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        self._ready = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queue in self._chats.values():
+            for item in queue:
+                if not item[3].done():
+                    item[3].cancel()
+        self._chats.clear()
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._chats.values())
+
+    def stats(self) -> dict:
+        return {'pending': self.pending, 'chats': len(self._chats), 'sent': self.sent, 'failed': self.failed,
+                'retries': self.retries}
+
+    def submit(self, method, chat_id, *args, **kwargs) -> asyncio.Future:
+        """
+        Ставит вызов bot.<method>(chat_id, ...) в очередь чата и возвращает future с результатом.
+        method – имя метода бота или async-функция (chat_id, ...): она вызывается заново на каждую
+        попытку, поэтому может, например, собрать InputFile, который нельзя отправить второй раз.
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = deque()
+            ready_at = max(time.monotonic(), self._next_allowed.pop(chat_id, 0.0))
+            self._ready.put_nowait((ready_at, next(self._counter), chat_id))
+        queue.append([method, args, kwargs, future, 0])
+        return future
+
+    def send_message(self, chat_id, text: str, **kwargs) -> asyncio.Future:
+        return self.submit("send_message", chat_id, text, **kwargs)
+
+    async def _worker(self):
+        while True:
+            ready_at, _, chat_id = await self._ready.get()
+            delay = ready_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            queue = self._chats[chat_id]
+            item = queue[0]
+            method, args, kwargs, future, attempts = item
+            retry_at = 0.0
+            await self._bucket.acquire()
+            try:
+                call = method if callable(method) else getattr(self._bot, method)
+                result = await call(chat_id, *args, **kwargs)
+            except RetryAfter as e:
+                # Flood control касается всего бота – притормаживаем общий поток
+                logger.warning(f"Flood control: пауза {e.timeout} с")
+                self._bucket.pause(e.timeout)
+                # Повторы после flood control тоже считаются: чат, который упирается в него снова
+                # и снова, не должен повторяться бесконечно
+                if attempts < self.max_retries:
+                    item[4] = attempts + 1
+                    retry_at = time.monotonic() + e.timeout
+                    self.retries += 1
+                else:
+                    self._finish(queue, future, exception=e)
+            except NetworkError as e:
+                if attempts < self.max_retries:
+                    item[4] = attempts + 1
+                    retry_at = time.monotonic() + min(2 ** attempts, 30)
+                    self.retries += 1
+                else:
+                    self._finish(queue, future, exception=e)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._finish(queue, future, exception=e)
+            else:
+                self._finish(queue, future, result=result)
+            self._next_allowed[chat_id] = time.monotonic() + self.chat_interval
+            if queue:
+                ready_at = max(self._next_allowed.pop(chat_id), retry_at)
+                self._ready.put_nowait((ready_at, next(self._counter), chat_id))
+            else:
+                del self._chats[chat_id]
+                self._prune_next_allowed()
+
+    def _finish(self, queue, future, result=None, exception=None):
+        queue.popleft()
+        if exception is not None:
+            self.failed += 1
+            logger.warning(f"Не удалось отправить сообщение: {exception}")
+            if not future.done():
+                future.set_exception(exception)
+        else:
+            self.sent += 1
+            if not future.done():
+                future.set_result(result)
+
+    def _prune_next_allowed(self):
+        if len(self._next_allowed) < 10000:
+            return
+        now = time.monotonic()
+        self._next_allowed = {chat_id: t for chat_id, t in self._next_allowed.items() if t > now}
+
+
+async def wait_sent(futures, job_name: str):
+    """Дожидается отправки поставленных в очередь сообщений; ошибки только логируются."""
+    if not futures:
+        return
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    errors = sum(1 for r in results if isinstance(r, BaseException))
+    if errors:
+        logger.warning(f"{job_name}: не доставлено {errors} из {len(results)} сообщений")
+
+
+# Общий отправитель для планировщика и обработчиков (запускается в bot/main.py)
+message_sender = FanoutSender()
@@ -0,0 +1,149 @@
+# bot/sent_log.py
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy.sql import func
+from bot.database import UserWordStatus, UserSeenState, upsert_insert
+from config.settings import SENT_LOG_FLUSH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _upsert_statement(insert, rows):
+    """INSERT ... ON CONFLICT (chat_id, word_id) DO UPDATE для PostgreSQL и SQLite."""
+    stmt = insert(UserWordStatus).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[UserWordStatus.chat_id, UserWordStatus.word_id],
+        set_={
+            'sent_count': func.coalesce(UserWordStatus.sent_count, 0) + stmt.excluded.sent_count,
+            'last_sent': stmt.excluded.last_sent,
+            # due_at не трогаем: срок повторения задают только ответы в тестах (bot/answer_log.py)
+        },
+    )
+
+
+def _bump_statement(insert, chat_ids):
+    """+1 к версии показанных слов каждого пользователя из chat_ids (строка создаётся с версией 1)."""
+    stmt = insert(UserSeenState).values([{'chat_id': chat_id, 'seen_version': 1} for chat_id in chat_ids])
+    return stmt.on_conflict_do_update(
+        index_elements=[UserSeenState.chat_id],
+        set_={'seen_version': UserSeenState.seen_version + 1},
+    )
+
+
+class SentWordLog:
+    """
+    Отметки об отправленных словах копятся в памяти и записываются одним
+    INSERT ... ON CONFLICT DO UPDATE вместо SELECT + INSERT/UPDATE на каждое слово.
+    Повторы одной пары (chat_id, word_id) схлопываются: sent_count складывается,
+    last_sent берётся последний. Буфер сбрасывается при flush_size записях,
+    в конце тика рассылки и при остановке бота.
+
+    Каждая запись увеличивает версию показанных слов (user_seen_state) затронутых
+    пользователей; подписчики (subscribe) получают их chat_id – так выборщик слов
+    отличает свои записи от записей других процессов.
+    """
+
+    def __init__(self, flush_size: int = SENT_LOG_FLUSH_SIZE):
+        self.flush_size = flush_size
+        self._pending = {}  # (chat_id, word_id) -> [sent_count, last_sent]
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.flushed_rows = 0
+        self.flushes = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        return {'depth': len(self), 'flushed_rows': self.flushed_rows, 'flushes': self.flushes}
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def add(self, session, chat_id: str, word_id: int, sent_at: datetime = None):
+        sent_at = sent_at or datetime.now()
+        with self._lock:
+            entry = self._pending.get((chat_id, word_id))
+            if entry is None:
+                self._pending[(chat_id, word_id)] = [1, sent_at]
+            else:
+                entry[0] += 1
+                entry[1] = max(entry[1], sent_at)
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self.flush(session)
+
+    def flush(self, session) -> int:
+        """Записывает накопленные отметки в сессию; commit делает вызывающий (или run_db)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [
+            {'chat_id': chat_id, 'word_id': word_id, 'sent_count': count, 'last_sent': last_sent,
+             'correct_answers': 0, 'incorrect_answers': 0}
+            for (chat_id, word_id), (count, last_sent) in pending.items()
+        ]
+        chat_ids = sorted({chat_id for chat_id, _ in pending})
+        try:
+            insert = upsert_insert(session)
+            for start in range(0, len(rows), self.flush_size):
+                chunk = rows[start:start + self.flush_size]
+                if insert is not None:
+                    session.execute(_upsert_statement(insert, chunk))
+                else:
+                    self._merge_rows(session, chunk)
+            for start in range(0, len(chat_ids), self.flush_size):
+                chunk = chat_ids[start:start + self.flush_size]
+                if insert is not None:
+                    session.execute(_bump_statement(insert, chunk))
+                else:
+                    self._bump_versions(session, chunk)
+            session.flush()
+        except Exception:
+            # Не теряем отметки: вернём их в буфер до следующей попытки
+            self._restore(pending)
+            raise
+        self.flushed_rows += len(rows)
+        self.flushes += 1
+        for listener in self._listeners:
+            try:
+                listener(chat_ids)
+            except Exception:
+                logger.exception("Ошибка при оповещении о записи отметок")
+        return len(rows)
+
+    def _merge_rows(self, session, rows):
+        # Запасной путь для СУБД без ON CONFLICT: построчно, как раньше
+        for row in rows:
+            user_word = session.query(UserWordStatus).filter_by(
+                chat_id=row['chat_id'], word_id=row['word_id']).first()
+            if user_word is None:
+                session.add(UserWordStatus(**row))
+            else:
+                user_word.sent_count = (user_word.sent_count or 0) + row['sent_count']
+                user_word.last_sent = row['last_sent']
+
+    def _bump_versions(self, session, chat_ids):
+        states = {state.chat_id: state for state in
+                  session.query(UserSeenState).filter(UserSeenState.chat_id.in_(chat_ids))}
+        for chat_id in chat_ids:
+            state = states.get(chat_id)
+            if state is None:
+                session.add(UserSeenState(chat_id=chat_id, seen_version=1))
+            else:
+                state.seen_version += 1
+
+    def _restore(self, pending):
+        with self._lock:
+            for key, (count, last_sent) in pending.items():
+                entry = self._pending.get(key)
+                if entry is None:
+                    self._pending[key] = [count, last_sent]
+                else:
+                    entry[0] += count
+                    entry[1] = max(entry[1], last_sent)
+
+
+sent_log = SentWordLog()
@@ -0,0 +1,272 @@
+# bot/snapshot.py
+"""
+Двоичный снимок словаря для быстрого старта.
+
+    python -m bot.snapshot build      # собрать из таблицы words (CATALOG_SNAPSHOT_PATH)
+    python -m bot.snapshot info       # заголовок, проверка контрольной суммы и версии
+
+Файл открывается через mmap только на чтение: процессы бота и планировщики читают
+одни и те же страницы из page cache, ORM при старте не нужен. Формат (little-endian):
+
+    заголовок  HEADER: magic, версия формата, число слов, число слотов хэш-таблиц,
+               длина версии каталога, длина блока строк, crc32 всего, что после заголовка
+    версия     версия каталога (read_catalog_version) в UTF-8
+    записи     RECORD фиксированной ширины, по возрастанию id: id, repeat_more,
+               смещение строк слова в блоке строк в байтах и в символах, длины четырёх
+               строк в байтах и в символах (строки слова лежат подряд)
+    по id      хэш-таблица с открытой адресацией: номер записи + 1 (0 – пусто)
+    по ключу   то же для (word_et, part_of_speech)
+    строки     UTF-8 всех строк подряд
+
+Поиск по id и по (word_et, part_of_speech) – O(1). Если контрольная сумма не сошлась
+или версия каталога в БД другая, каталог читается из БД, а снимок пересобирается.
+
+Снимок ускоряет старт (нет SQL и ORM), но память процессов не экономит: CatalogStore
+декодирует rows() целиком в WordRecord, и каждый процесс держит весь словарь в своей куче.
+Из mmap без копии в кучу читается только find() по (word_et, part_of_speech).
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EKWS'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHxxIIIII')
+RECORD = struct.Struct('<IB3xII4I4I')
+SLOT = struct.Struct('<I')
+NULL_LENGTH = 0xFFFFFFFF  # длина строки None
+STRING_FIELDS = 4         # word_et, part_of_speech, translation, ai_generated_text
+
+
+class SnapshotError(Exception):
+    """Снимок повреждён или записан в другом формате."""
+
+
+def _id_slot(word_id: int, mask: int) -> int:
+    return (word_id * 2654435761) & mask
+
+
+def _key_hash(word_et: str, part_of_speech: str) -> int:
+    return zlib.crc32(f"{word_et}\0{part_of_speech}".encode('utf-8'))
+
+
+def _slot_count(count: int) -> int:
+    # Степень двойки не меньше 2 * count: заполнение хэш-таблиц не выше 50%
+    slots = 1
+    while slots < 2 * max(count, 1):
+        slots *= 2
+    return slots
+
+
+def write_snapshot(path: str, rows, version: str) -> int:
+    """
+    Записывает снимок из строк (id, word_et, part_of_speech, translation,
+    ai_generated_text, repeat_more). Файл подменяется атомарно. Возвращает число слов.
+    """
+    rows = sorted(rows, key=lambda row: row[0])
+    slots = _slot_count(len(rows))
+    mask = slots - 1
+    records = bytearray()
+    blob = bytearray()
+    chars = 0
+    by_id = [0] * slots
+    by_key = [0] * slots
+    for index, (word_id, word_et, part_of_speech, translation, ai_generated_text, repeat_more) in enumerate(rows):
+        byte_offset, char_offset = len(blob), chars
+        byte_lengths, char_lengths = [], []
+        for value in (word_et, part_of_speech, translation, ai_generated_text):
+            if value is None:
+                byte_lengths.append(NULL_LENGTH)
+                char_lengths.append(0)
+                continue
+            encoded = value.encode('utf-8')
+            blob += encoded
+            chars += len(value)
+            byte_lengths.append(len(encoded))
+            char_lengths.append(len(value))
+        records += RECORD.pack(word_id, bool(repeat_more), byte_offset, char_offset, *byte_lengths, *char_lengths)
+        slot = _id_slot(word_id, mask)
+        while by_id[slot]:
+            slot = (slot + 1) & mask
+        by_id[slot] = index + 1
+        # При повторе ключа в словаре находится слово с меньшим id
+        slot = _key_hash(word_et, part_of_speech) & mask
+        while by_key[slot]:
+            other = rows[by_key[slot] - 1]
+            if (other[1], other[2]) == (word_et, part_of_speech):
+                break
+            slot = (slot + 1) & mask
+        else:
+            by_key[slot] = index + 1
+    version_bytes = version.encode('utf-8')
+    body = b''.join([
+        version_bytes, bytes(records),
+        struct.pack(f'<{slots}I', *by_id), struct.pack(f'<{slots}I', *by_key), bytes(blob),
+    ])
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(rows), slots, len(version_bytes), len(blob),
+                         zlib.crc32(body))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+class CatalogSnapshot:
+    """Открытый снимок словаря; строки декодируются из mmap при обращении."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse()
+        except Exception:
+            self._mm.close()
+            raise
+
+    def _parse(self):
+        mm = self._mm
+        if len(mm) < HEADER.size:
+            raise SnapshotError(f"{self.path}: файл обрезан")
+        magic, fmt, count, slots, version_len, blob_len, checksum = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise SnapshotError(f"{self.path}: не снимок словаря или другой формат ({magic!r}, {fmt})")
+        self.count = count
+        self._mask = slots - 1
+        self._records = HEADER.size + version_len
+        self._by_id = self._records + count * RECORD.size
+        self._by_key = self._by_id + slots * SLOT.size
+        self._blob = self._by_key + slots * SLOT.size
+        if len(mm) != self._blob + blob_len:
+            raise SnapshotError(f"{self.path}: размер файла не совпадает с заголовком")
+        with memoryview(mm) as view:
+            if zlib.crc32(view[HEADER.size:]) != checksum:
+                raise SnapshotError(f"{self.path}: контрольная сумма не сходится")
+        self.version = mm[HEADER.size:self._records].decode('utf-8')
+
+    def close(self):
+        self._mm.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._mm.closed
+
+    def __len__(self):
+        return self.count
+
+    def _row(self, index: int):
+        word_id, repeat_more, offset, _, *lengths = RECORD.unpack_from(self._mm, self._records + index * RECORD.size)
+        start = self._blob + offset
+        strings = []
+        for length in lengths[:STRING_FIELDS]:
+            if length == NULL_LENGTH:
+                strings.append(None)
+                continue
+            strings.append(self._mm[start:start + length].decode('utf-8'))
+            start += length
+        return (word_id, *strings, bool(repeat_more))
+
+    def _record_id(self, index: int) -> int:
+        return RECORD.unpack_from(self._mm, self._records + index * RECORD.size)[0]
+
+    def rows(self):
+        """Все слова по возрастанию id: [(id, word_et, part_of_speech, translation, ai_generated_text, repeat_more)]."""
+        # Блок строк декодируется целиком один раз, дальше – срезы по смещениям в символах:
+        # заметно быстрее, чем декодировать каждую строку отдельно
+        text = self._mm[self._blob:].decode('utf-8')
+        null = NULL_LENGTH
+        rows = []
+        with memoryview(self._mm) as view:
+            records = view[self._records:self._by_id]
+            try:
+                for word_id, repeat_more, _, at, b1, b2, b3, b4, c1, c2, c3, c4 in RECORD.iter_unpack(records):
+                    word_et = text[at:at + c1]
+                    at += c1
+                    part_of_speech = text[at:at + c2]
+                    at += c2
+                    translation = None if b3 == null else text[at:at + c3]
+                    at += c3
+                    ai_generated_text = None if b4 == null else text[at:at + c4]
+                    rows.append((word_id, word_et, part_of_speech, translation, ai_generated_text, bool(repeat_more)))
+            finally:
+                records.release()
+        return rows
+
+    def get(self, word_id: int):
+        slot = _id_slot(word_id, self._mask)
+        while True:
+            (entry,) = SLOT.unpack_from(self._mm, self._by_id + slot * SLOT.size)
+            if not entry:
+                return None
+            if self._record_id(entry - 1) == word_id:
+                return self._row(entry - 1)
+            slot = (slot + 1) & self._mask
+
+    def find(self, word_et: str, part_of_speech: str):
+        slot = _key_hash(word_et, part_of_speech) & self._mask
+        while True:
+            (entry,) = SLOT.unpack_from(self._mm, self._by_key + slot * SLOT.size)
+            if not entry:
+                return None
+            row = self._row(entry - 1)
+            if row[1] == word_et and row[2] == part_of_speech:
+                return row
+            slot = (slot + 1) & self._mask
+
+
+def open_snapshot(path: str, version: str = None):
+    """
+    Снимок, если файл есть, цел и (при заданной version) совпадает с версией каталога
+    в БД; иначе None – каталог нужно читать из БД.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = CatalogSnapshot(path)
+    except (OSError, ValueError, struct.error, SnapshotError) as e:
+        logger.warning(f"Снимок словаря не прочитан: {e}")
+        return None
+    if version is not None and snapshot.version != version:
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def main():
+    # Зависимость от БД нужна только командам; формат снимка от неё не зависит
+    from bot.database import SessionLocal, init_db
+    from bot.catalog import read_catalog_version, load_word_rows
+    from config.settings import CATALOG_SNAPSHOT_PATH
+
+    parser = argparse.ArgumentParser(description="Двоичный снимок словаря")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--path", default=CATALOG_SNAPSHOT_PATH or "catalog.snapshot")
+    args = parser.parse_args()
+    init_db()
+    session = SessionLocal()
+    try:
+        version = read_catalog_version(session)
+        if args.command == "build":
+            count = write_snapshot(args.path, load_word_rows(session), version)
+            print(f"{args.path}: {count} слов, {os.path.getsize(args.path)} байт, версия {version}")
+            return
+        snapshot = open_snapshot(args.path)
+        if snapshot is None:
+            print(f"{args.path}: снимка нет или он повреждён")
+            return
+        state = "актуален" if snapshot.version == version else f"устарел (в БД {version})"
+        print(f"{args.path}: {len(snapshot)} слов, версия {snapshot.version} – {state}")
+        snapshot.close()
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# bot/srs.py
+"""
+Интервальное повторение по схеме SM-2 для каждой пары (пользователь, слово).
+
+Ответы в тестах (через bot/answer_log.py) меняют интервал и лёгкость слова;
+срок следующего повторения хранится в user_word_status.due_at, а индекс
+(chat_id, due_at) даёт самые просроченные слова пользователя одним диапазонным чтением.
+Простой показ карточки (рассылка, /random_word) ответ не оценивает и due_at не меняет
+(bot/sent_log.py): слово, которое только показывали, на повторение не попадает, а слово,
+показанное уже после наступления срока, снова предлагается не раньше чем через SHOWN_REVIEW_GAP.
+"""
+import math
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from bot.catalog import word_catalog
+from bot.database import UserWordStatus
+from bot.word_sampler import pick_new_words
+from config.settings import SRS_REVIEW_SHARE
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+
+# Оценка ответа по шкале SM-2 (0–5)
+QUALITY_WRONG = 1
+QUALITY_CHOICE = 4   # верно выбран вариант
+QUALITY_TYPED = 5    # верно введён перевод
+
+# Через сколько снова повторять слово, показанное после наступления срока, но не проверенное тестом
+SHOWN_REVIEW_GAP = timedelta(days=1)
+
+
+def next_review(interval, ease, reps, quality: int, repeat_more: bool = False):
+    """Новые (интервал в днях, лёгкость, повторений подряд) после ответа с оценкой quality."""
+    ease = ease or DEFAULT_EASE
+    reps = reps or 0
+    if quality < 3:
+        reps, interval = 0, 0
+    else:
+        if reps == 0:
+            interval = 1
+        elif reps == 1:
+            interval = 6
+        else:
+            interval = max(1, round((interval or 1) * ease))
+        reps += 1
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if repeat_more:
+        # Слова, помеченные «повторять чаще», возвращаются не реже раза в день
+        interval = min(interval, 1)
+    return interval, ease, reps
+
+
+def apply_answers(interval, ease, reps, answers, repeat_more: bool = False):
+    """
+    Применяет ответы [(оценка, время ответа)] по порядку; возвращает
+    (интервал, лёгкость, повторений подряд, срок повторения).
+    """
+    due_at = None
+    for quality, answered_at in answers:
+        interval, ease, reps = next_review(interval, ease, reps, quality, repeat_more)
+        # Неверный ответ – слово снова в очереди уже со следующей рассылкой
+        due_at = answered_at + timedelta(days=interval)
+    return interval, ease, reps, due_at
+
+
+def due_words(session, chat_id: str, limit: int, now: datetime = None):
+    """
+    До limit самых просроченных слов пользователя (по индексу (chat_id, due_at)):
+    [(id слова, флаг «повторять чаще» пользователя)].
+    """
+    if limit <= 0:
+        return []
+    now = now or datetime.now()
+    return (session.query(UserWordStatus.word_id, UserWordStatus.repeat_more)
+            .filter(UserWordStatus.chat_id == chat_id, UserWordStatus.due_at <= now,
+                    or_(UserWordStatus.last_sent.is_(None), UserWordStatus.last_sent < UserWordStatus.due_at,
+                        UserWordStatus.last_sent <= now - SHOWN_REVIEW_GAP))
+            .order_by(UserWordStatus.due_at)
+            .limit(limit)
+            .all())
+
+
+def due_word_ids(session, chat_id: str, limit: int, now: datetime = None):
+    """id до limit самых просроченных слов пользователя."""
+    return [word_id for word_id, _ in due_words(session, chat_id, limit, now)]
+
+
+def pick_mailing_words(session, chat_id: str, count: int, now: datetime = None):
+    """
+    Слова для рассылки: до SRS_REVIEW_SHARE от count – повторение слов, у которых подошёл
+    срок, остальное – новые слова. Если повторять нечего, все места отдаются новым словам.
+    """
+    if count <= 0:
+        return []
+    catalog = word_catalog.current
+    reviews = [catalog.get(word_id).for_user(repeat_more)
+               for word_id, repeat_more in due_words(session, chat_id, math.ceil(count * SRS_REVIEW_SHARE), now)
+               if catalog.get(word_id) is not None]
+    new_words = pick_new_words(session, chat_id, count - len(reviews), exclude=[word.id for word in reviews])
+    return reviews + new_words
@@ -0,0 +1,105 @@
+# bot/webhook.py
+"""
+Приём апдейтов через webhook (BOT_MODE=webhook) вместо long polling.
+
+aiohttp-сервер принимает POST от Telegram, сразу отвечает 200 и кладёт апдейт
+в очередь по чатам (bot/dispatch_queue.py), откуда его берут обработчики диспетчера.
+Если очередь полна, сервер отвечает 503 с Retry-After – Telegram повторит доставку
+позже, а бот не копит в памяти больше DISPATCH_QUEUE_SIZE апдейтов. Если переполнена
+очередь одного чата, ответ – 429 с Retry-After: апдейт тоже не теряется.
+
+При WEBHOOK_PROCESSES > 1 несколько процессов слушают один порт (SO_REUSEPORT),
+ядро распределяет между ними соединения. Процессы ничего не знают друг о друге:
+апдейты одного чата могут попасть в разные процессы и обработаться не по порядку
+(поэтому такой запуск требует явного WEBHOOK_UNORDERED=1), а ожидающие тесты с вводом
+ответа должны храниться в общем хранилище (PENDING_STORE=db).
+"""
+import logging
+from aiogram import Dispatcher, types
+from aiohttp import web
+from bot.dispatch_queue import ChatDispatchQueue
+from config.settings import (WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+                             WEBHOOK_PROCESSES, WEBHOOK_UNORDERED, PENDING_STORE)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    """
+    HTTP-приём апдейтов. Метрики: received, rejected (ответ 503), throttled (ответ 429);
+    очередь и время ожидания апдейтов – в ChatDispatchQueue.stats().
+    """
+
+    def __init__(self, dispatch: ChatDispatchQueue, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET):
+        self.dispatch = dispatch
+        self.path = path
+        self.secret = secret
+        self._runner = None
+        # Метрики
+        self.received = 0
+        self.rejected = 0
+        self.throttled = 0
+
+    def stats(self) -> dict:
+        return {'received': self.received, 'rejected': self.rejected, 'throttled': self.throttled}
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            return web.Response(status=403)
+        if self.dispatch.full:
+            # Telegram повторит доставку; апдейт не теряется
+            self.rejected += 1
+            return web.Response(status=503, headers={'Retry-After': '1'})
+        try:
+            update = types.Update(**await request.json())
+        except (ValueError, TypeError):
+            return web.Response(status=400)
+        if not self.dispatch.put_nowait(update):
+            # Чат прислал больше DISPATCH_CHAT_QUEUE необработанных апдейтов – пусть Telegram повторит позже
+            self.throttled += 1
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        self.received += 1
+        return web.Response()
+
+    async def start(self, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, reuse_port: bool = False):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port, reuse_port=reuse_port or None).start()
+        logger.info(f"Webhook слушает {host}:{port}{self.path}")
+
+    async def close(self):
+        """Перестаёт принимать запросы; поставленные апдейты дорабатывает ChatDispatchQueue.close()."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def webhook_processes() -> int:
+    """Сколько процессов webhook запускать; несколько – только если порядок апдейтов чата не важен."""
+    if WEBHOOK_PROCESSES > 1 and not WEBHOOK_UNORDERED:
+        raise RuntimeError(f"WEBHOOK_PROCESSES={WEBHOOK_PROCESSES}: апдейты одного чата попадут в разные процессы "
+                           "и обработаются не по порядку; задайте WEBHOOK_PROCESSES=1 или WEBHOOK_UNORDERED=1")
+    return WEBHOOK_PROCESSES
+
+
+async def start_webhook(dp: Dispatcher, dispatch: ChatDispatchQueue, register: bool = True) -> WebhookServer:
+    """
+    Запускает сервер; register – сообщить Telegram адрес webhook (делает один процесс).
+    """
+    if WEBHOOK_PROCESSES > 1 and PENDING_STORE == 'memory':
+        logger.warning("Несколько процессов webhook с PENDING_STORE=memory: ответ на тест "
+                       "может прийти в процесс, который вопрос не задавал")
+    server = WebhookServer(dispatch)
+    await server.start(reuse_port=WEBHOOK_PROCESSES > 1)
+    if register:
+        if not WEBHOOK_URL:
+            raise RuntimeError("BOT_MODE=webhook: не задан WEBHOOK_URL")
+        await dp.bot.set_webhook(WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None)
+    return server
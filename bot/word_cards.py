@@ -0,0 +1,79 @@
+# bot/word_cards.py
+import json
+import threading
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from bot.catalog import word_catalog
+from bot.callbacks import MENU, PLAY, TOGGLE_REPEAT
+
+
+def get_word_message(word_obj):
+    text = (
+        f"🇪🇪 Sõna: <b>{word_obj.word_et}</b>\n"
+        f"🇷🇺 Перевод: <b>{word_obj.translation}</b>\n\n"
+        f"📖 Информация:\n{word_obj.ai_generated_text}\n"
+    )
+    keyboard = InlineKeyboardMarkup(row_width=1)
+    keyboard.add(InlineKeyboardButton("🎧 Послушать слово", callback_data=PLAY.data(word_obj.id)))
+    if word_obj.repeat_more:
+        repeat_text = "Убрать из повторяющихся"
+    else:
+        repeat_text = "Повторять слово чаще"
+    keyboard.add(InlineKeyboardButton(repeat_text, callback_data=TOGGLE_REPEAT.data(word_obj.id)))
+    keyboard.add(InlineKeyboardButton("Меню", callback_data=MENU.data()))
+    return text, keyboard
+
+
+def render_card(word_obj) -> dict:
+    """
+    Готовые параметры send_message для карточки слова. reply_markup уже сериализован
+    в JSON-строку – aiogram передаёт строки как есть и не собирает клавиатуру заново.
+    """
+    text, keyboard = get_word_message(word_obj)
+    return {
+        'text': text,
+        'parse_mode': "HTML",
+        'reply_markup': json.dumps(keyboard.to_python(), ensure_ascii=False),
+    }
+
+
+class CardCache:
+    """
+    Кэш отрисованных карточек по (id слова, repeat_more): флаг у каждого пользователя
+    свой (WordRecord.for_user), поэтому у слова бывает две карточки. Запись хранится вместе
+    со словом, из которого она собрана: при перезагрузке каталога карточки изменившихся
+    слов выбрасываются, остальные переживают обновление.
+    """
+
+    def __init__(self):
+        self._cards = {}  # (word_id, repeat_more) -> (WordRecord, payload)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, word) -> dict:
+        key = (word.id, word.repeat_more)
+        cached = self._cards.get(key)
+        if cached is not None and cached[0] == word:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        payload = render_card(word)
+        with self._lock:
+            self._cards[key] = (word, payload)
+        return payload
+
+    def on_catalog(self, catalog):
+        with self._lock:
+            self._cards = {key: cached for key, cached in self._cards.items()
+                           if catalog.get(key[0]) == cached[0]}
+
+    def clear(self):
+        with self._lock:
+            self._cards = {}
+
+    def __len__(self):
+        return len(self._cards)
+
+
+word_cards = CardCache()
+word_catalog.subscribe(word_cards.on_catalog)
@@ -0,0 +1,169 @@
+# bot/word_sampler.py
+import random
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from bot.catalog import word_catalog
+from bot.database import UserWordStatus, UserSeenState, upsert_insert
+from bot.sent_log import sent_log
+from config.settings import SAMPLER_MAX_USERS
+
+
+class _UnseenSet:
+    """
+    Непоказанные пользователю слова: массив индексов слов + обратный индекс позиций.
+    Удаление – перестановкой с последним элементом (O(1)), выборка k слов – O(k).
+    version – версия показанных слов (user_seen_state), которой соответствует множество.
+    """
+    __slots__ = ('items', 'pos', 'missing', 'version')
+
+    def __init__(self, size: int, seen_indexes, version: int = 0):
+        self.version = version
+        typecode = 'H' if size < 0xFFFF else 'I'
+        self.missing = 0xFFFF if typecode == 'H' else 0xFFFFFFFF
+        self.items = array(typecode, (i for i in range(size) if i not in seen_indexes))
+        self.pos = array(typecode, [self.missing]) * size
+        for position, index in enumerate(self.items):
+            self.pos[index] = position
+
+    def __len__(self):
+        return len(self.items)
+
+    def discard(self, index: int):
+        position = self.pos[index]
+        if position == self.missing:
+            return
+        last = self.items.pop()
+        if last != index:
+            self.items[position] = last
+            self.pos[last] = position
+        self.pos[index] = self.missing
+
+    def sample(self, k: int):
+        return [self.items[i] for i in random.sample(range(len(self.items)), min(k, len(self.items)))]
+
+
+class WordSampler:
+    """
+    Выбор случайных непоказанных слов без NOT IN (...) и ORDER BY random().
+    Множество непоказанных слов пользователя строится из БД при первом обращении,
+    а затем поддерживается при каждой отправке (mark_seen). Перед выборкой версия
+    показанных слов из user_seen_state сверяется с ожидаемой: свои записи sent_log
+    учитываются в on_flushed, а если версия разошлась – слова отправлял другой процесс
+    (бот, планировщик) и множество строится заново. Новый круг (reset) записывается
+    в user_seen_state.cycle_started_at, поэтому переживает перезапуск и виден всем
+    процессам: показанными считаются только слова, отправленные после его начала. Хранится не больше
+    max_users пользователей – давно не активные вытесняются (LRU) и при следующем
+    обращении строятся заново. Список слов берётся из каталога (bot/catalog.py).
+    """
+
+    def __init__(self, max_users: int = SAMPLER_MAX_USERS):
+        self.max_users = max_users
+        self._word_ids = []          # индекс -> id слова
+        self._index = {}             # id слова -> индекс
+        self._users = OrderedDict()  # chat_id -> _UnseenSet
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def on_catalog(self, catalog):
+        """Новый снимок каталога; если набор слов изменился, кэш пользователей сбрасывается."""
+        word_ids = [word.id for word in catalog.words]
+        with self._lock:
+            if self._loaded and word_ids == self._word_ids:
+                return
+            self._word_ids = word_ids
+            self._index = {word_id: i for i, word_id in enumerate(word_ids)}
+            self._users.clear()
+            self._loaded = True
+
+    def _ensure_loaded(self, session):
+        if not self._loaded:
+            self.on_catalog(word_catalog.current)
+
+    def _unseen(self, session, chat_id: str) -> _UnseenSet:
+        state = session.query(UserSeenState.seen_version, UserSeenState.cycle_started_at) \
+            .filter_by(chat_id=chat_id).first()
+        version, cycle_started_at = state if state else (0, None)
+        unseen = self._users.get(chat_id)
+        if unseen is not None and unseen.version == version:
+            self._users.move_to_end(chat_id)
+            return unseen
+        query = session.query(UserWordStatus.word_id).filter(UserWordStatus.chat_id == chat_id)
+        if cycle_started_at is not None:
+            query = query.filter(UserWordStatus.last_sent >= cycle_started_at)
+        seen = {self._index[word_id] for (word_id,) in query.all() if word_id in self._index}
+        unseen = _UnseenSet(len(self._word_ids), seen, version)
+        self._users[chat_id] = unseen
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return unseen
+
+    def sample_unseen(self, session, chat_id: str, k: int):
+        """id до k случайных слов, которые пользователь ещё не видел."""
+        with self._lock:
+            self._ensure_loaded(session)
+            return [self._word_ids[i] for i in self._unseen(session, chat_id).sample(k)]
+
+    def mark_seen(self, chat_id: str, word_id: int):
+        with self._lock:
+            unseen = self._users.get(chat_id)
+            index = self._index.get(word_id)
+            if unseen is not None and index is not None:
+                unseen.discard(index)
+
+    def on_flushed(self, chat_ids):
+        """sent_log этого процесса записал отметки: версия каждого из chat_ids выросла на 1."""
+        with self._lock:
+            for chat_id in chat_ids:
+                unseen = self._users.get(chat_id)
+                if unseen is not None:
+                    unseen.version += 1
+
+    def reset(self, session, chat_id: str):
+        """Новый круг: все слова снова считаются непоказанными (commit делает вызывающий)."""
+        started_at = datetime.now()
+        insert = upsert_insert(session)
+        if insert is not None:
+            stmt = insert(UserSeenState).values(chat_id=chat_id, seen_version=1, cycle_started_at=started_at)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=[UserSeenState.chat_id],
+                set_={'seen_version': UserSeenState.seen_version + 1, 'cycle_started_at': started_at},
+            ))
+        else:
+            state = session.get(UserSeenState, chat_id)
+            if state is None:
+                session.add(UserSeenState(chat_id=chat_id, seen_version=1, cycle_started_at=started_at))
+            else:
+                state.seen_version += 1
+                state.cycle_started_at = started_at
+        session.flush()
+        with self._lock:
+            unseen = self._users.get(chat_id)
+            self._users[chat_id] = _UnseenSet(len(self._word_ids), (), unseen.version + 1 if unseen else 1)
+            self._users.move_to_end(chat_id)
+
+
+word_sampler = WordSampler()
+word_catalog.subscribe(word_sampler.on_catalog)
+sent_log.subscribe(word_sampler.on_flushed)
+
+
+def pick_new_words(session, chat_id: str, count: int, exclude=()):
+    """
+    Случайные непоказанные слова пользователя (кроме exclude). Если всё уже показано –
+    начинается новый круг: слова снова выбираются из всей базы. Строки user_word_status
+    при этом сохраняются – в них история интервального повторения (bot/srs.py).
+    """
+    exclude = set(exclude)
+
+    def sample():
+        word_ids = word_sampler.sample_unseen(session, chat_id, count + len(exclude))
+        return [word_id for word_id in word_ids if word_id not in exclude][:count]
+
+    word_ids = sample()
+    if not word_ids and count > 0:
+        word_sampler.reset(session, chat_id)
+        word_ids = sample()
+    catalog = word_catalog.current
+    return [catalog.get(word_id) for word_id in word_ids if catalog.get(word_id) is not None]
@@ -0,0 +1,122 @@
+# bot/worker.py
+"""
+Отдельные процессы-планировщики рассылок.
+
+    python -m bot.worker              # SCHEDULER_WORKERS процессов (минимум один)
+    python -m bot.worker --workers 4
+
+Каждый процесс арендует часть партиций chat_id (bot/leases.py) и рассылает слова,
+тесты и статистику только своим пользователям. Если процесс падает, его партиции
+после SCHEDULER_LEASE_SECONDS забирают оставшиеся.
+
+По умолчанию (Procfile: только worker: python -m bot.main) рассылки ведёт сам бот.
+Отдельные планировщики включаются явно: SCHEDULER_WORKERS > 0 задаётся и боту, и
+планировщикам (на Heroku – heroku config:set SCHEDULER_WORKERS=1), в Procfile добавляется
+scheduler: python -m bot.worker и этот тип процесса масштабируется (heroku ps:scale scheduler=1).
+Бот тогда сам рассылки не ведёт, а тесты с вводом ответа, отправленные планировщиком,
+находит в таблице основной БД (PENDING_STORE=db).
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+from aiogram import Dispatcher
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+from config.settings import (TELEGRAM_TOKEN, TELEGRAM_API_URL, BOT_CONNECTIONS_LIMIT, SCHEDULER_WORKERS,
+                             AUDIO_CACHE_CHAT_ID, METRICS_HOST, SCHEDULER_METRICS_PORT, PENDING_STORE)
+from bot import scheduler
+from bot.database import init_db, run_db, engine
+from bot.catalog import word_catalog, watch_catalog
+from bot.sent_log import sent_log
+from bot.leases import default_worker_id
+from bot.sender import message_sender
+from bot.audio_fetch import audio_fetcher
+from bot.audio_prewarm import audio_prewarmer
+from bot.questions import question_pool
+from bot.metrics import metrics, MetricsBot, MetricsServer, instrument_engine
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(worker_id: str, index: int = 0):
+    instrument_engine(engine)
+    server = TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION
+    bot = MetricsBot(token=TELEGRAM_TOKEN, connections_limit=BOT_CONNECTIONS_LIMIT, server=server)
+    dp = Dispatcher(bot)
+    for name, stats in (("sender", message_sender.stats), ("questions", question_pool.stats),
+                        ("sent_log", sent_log.stats), ("audio_prewarm", audio_prewarmer.stats)):
+        metrics.add_stats(name, stats)
+    metrics_server = None
+    if SCHEDULER_METRICS_PORT:
+        metrics_server = MetricsServer()
+        await metrics_server.start(METRICS_HOST, SCHEDULER_METRICS_PORT + index)
+    message_sender.start(bot)
+    # Как и в боте (bot/main.py): без AUDIO_CACHE_CHAT_ID прогрев только скачивает mp3
+    audio_prewarmer.start(bot)
+    await run_db(word_catalog.load)
+    catalog_watcher = asyncio.create_task(watch_catalog())
+    question_pool.start()
+    scheduler.start_scheduler(dp, worker_id)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        catalog_watcher.cancel()
+        scheduler.stop_scheduler()
+        await question_pool.close()
+        # Не теряем отметки об отправке, накопленные в буфере
+        await run_db(sent_log.flush)
+        await audio_prewarmer.close()
+        await message_sender.close()
+        await audio_fetcher.close()
+        if metrics_server is not None:
+            await metrics_server.close()
+        await (await bot.get_session()).close()
+
+
+def _process_main(index: int):
+    worker_id = f"{default_worker_id()}#{index}"
+    logger.info(f"Запуск планировщика {worker_id}")
+    asyncio.run(run_worker(worker_id, index))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процессы-планировщики рассылок")
+    parser.add_argument("--workers", type=int, default=max(SCHEDULER_WORKERS, 1))
+    args = parser.parse_args()
+    if SCHEDULER_WORKERS == 0:
+        logger.warning("SCHEDULER_WORKERS=0: бот тоже запустит рассылки у себя – задайте SCHEDULER_WORKERS > 0 "
+                       "и боту, и планировщику")
+    if PENDING_STORE != 'db':
+        logger.warning(f"PENDING_STORE={PENDING_STORE}: ответы на тесты с вводом, отправленные планировщиком, "
+                       "бот на другой машине не найдёт – нужен PENDING_STORE=db")
+    if not AUDIO_CACHE_CHAT_ID:
+        logger.warning("AUDIO_CACHE_CHAT_ID не задан: планировщик прогревает аудио только в своей памяти, "
+                       "и нажатия «Послушать слово» в процессе бота будут ждать загрузки mp3")
+    init_db()
+    if args.workers == 1:
+        _process_main(0)
+        return
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_process_main, args=(i,), name=f"scheduler-{i}") for i in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    def _stop(signum, frame):
+        # Дочерние процессы сами освобождают партиции по SIGTERM
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
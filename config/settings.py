@@ -3,7 +3,97 @@ import os
 
 # Задайте ваш Telegram Token
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN', '8032455890:AAElHeT5g6m11o0OVpmNaReEHuhThPYQcXI')
+# Адрес Bot API (локальный telegram-bot-api или фейковый сервер нагрузочного теста); пусто – api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
 
 # Если понадобятся глобальные настройки рассылки (используются в планировщике по умолчанию)
 START_HOUR = 9
-END_HOUR = 23
\ No newline at end of file
+END_HOUR = 23
+# Период тика планировщика рассылок (секунды)
+MAILING_TICK_SECONDS = int(os.getenv('MAILING_TICK_SECONDS', '60'))
+# Сколько отдельных процессов-планировщиков запускать (0 – планировщик работает в процессе бота).
+# Отдельные планировщики включаются явно (см. bot/worker.py): значение > 0 нужно задать и боту,
+# и python -m bot.worker – тогда бот сам рассылки не ведёт, а ожидающие тесты хранятся в общей БД
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '0'))
+# На сколько партиций делятся chat_id; число должно совпадать у всех воркеров
+SCHEDULER_PARTITIONS = int(os.getenv('SCHEDULER_PARTITIONS', '16'))
+SCHEDULER_HEARTBEAT_SECONDS = int(os.getenv('SCHEDULER_HEARTBEAT_SECONDS', '15'))
+SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', '60'))
+# Утренняя статистика: за сколько минут после 09:00 распределить отправку (0 – сразу всем)
+STATS_SPREAD_MINUTES = int(os.getenv('STATS_SPREAD_MINUTES', '0'))
+# Сколько строк агрегата читать из БД за раз
+STATS_BATCH = int(os.getenv('STATS_BATCH', '1000'))
+
+# Параллельная отправка сообщений (bot/sender.py)
+SENDER_GLOBAL_RATE = float(os.getenv('SENDER_GLOBAL_RATE', '30'))      # сообщений в секунду на весь бот
+SENDER_CHAT_INTERVAL = float(os.getenv('SENDER_CHAT_INTERVAL', '1'))   # секунд между сообщениями в один чат
+SENDER_WORKERS = int(os.getenv('SENDER_WORKERS', '32'))
+SENDER_MAX_RETRIES = int(os.getenv('SENDER_MAX_RETRIES', '3'))
+# Размер пула соединений aiohttp для Bot API
+BOT_CONNECTIONS_LIMIT = int(os.getenv('BOT_CONNECTIONS_LIMIT', '64'))
+
+# Ключ подписи callback_data inline-кнопок (bot/callbacks.py); пусто – выводится из TELEGRAM_TOKEN
+CALLBACK_SECRET = os.getenv('CALLBACK_SECRET', '')
+
+# Получение апдейтов: polling или webhook (bot/webhook.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')            # публичный https-адрес бота, без пути
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')      # сверяется с X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_PROCESSES = int(os.getenv('WEBHOOK_PROCESSES', '1'))
+# Процессы webhook делят соединения через SO_REUSEPORT без учёта чата, и апдейты одного чата
+# могут обработаться не по порядку; WEBHOOK_PROCESSES > 1 запускается только с WEBHOOK_UNORDERED=1
+WEBHOOK_UNORDERED = os.getenv('WEBHOOK_UNORDERED', '0') == '1'
+# Очередь апдейтов по чатам (bot/dispatch_queue.py): обработчиков одновременно,
+# апдейтов в очереди всего и необработанных апдейтов одного чата (лишние отбрасываются)
+DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', '64'))
+DISPATCH_QUEUE_SIZE = int(os.getenv('DISPATCH_QUEUE_SIZE', '1000'))
+DISPATCH_CHAT_QUEUE = int(os.getenv('DISPATCH_CHAT_QUEUE', '20'))
+# Метрики Prometheus (bot/metrics.py) на http://METRICS_HOST:порт/metrics; 0 – не запускать.
+# Процесс бота номер i слушает METRICS_PORT + i, процесс-планировщик – SCHEDULER_METRICS_PORT + i
+METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+SCHEDULER_METRICS_PORT = int(os.getenv('SCHEDULER_METRICS_PORT', '0'))
+
+# Сколько пользователей держать в памяти выборщика непоказанных слов (bot/word_sampler.py)
+SAMPLER_MAX_USERS = int(os.getenv('SAMPLER_MAX_USERS', '10000'))
+# Пул заранее собранных тестов (bot/questions.py): вопросов каждого типа, сколько собирать за раз
+# и из скольких последних тестов пользователя не повторять слово
+QUESTION_POOL_SIZE = int(os.getenv('QUESTION_POOL_SIZE', '200'))
+QUESTION_POOL_BATCH = int(os.getenv('QUESTION_POOL_BATCH', '50'))
+QUESTION_NO_REPEAT = int(os.getenv('QUESTION_NO_REPEAT', '3'))
+# Как часто проверять, не изменился ли словарь в БД (секунды)
+CATALOG_CHECK_SECONDS = int(os.getenv('CATALOG_CHECK_SECONDS', '30'))
+# Двоичный снимок словаря для быстрого старта процессов (bot/snapshot.py); пусто – не использовать
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', '')
+# Сколько отметок об отправке слов копить перед одним пакетным upsert (bot/sent_log.py)
+SENT_LOG_FLUSH_SIZE = int(os.getenv('SENT_LOG_FLUSH_SIZE', '1000'))
+# Интервальное повторение (bot/srs.py): какая доля слов рассылки – повторение слов, у которых подошёл срок
+SRS_REVIEW_SHARE = float(os.getenv('SRS_REVIEW_SHARE', '0.4'))
+# Запись ответов в тестах (bot/answer_log.py): сброс буфера раз в N секунд или по M ответам
+ANSWER_FLUSH_SECONDS = int(os.getenv('ANSWER_FLUSH_SECONDS', '5'))
+ANSWER_FLUSH_EVENTS = int(os.getenv('ANSWER_FLUSH_EVENTS', '200'))
+# Ожидающие ответа тесты с вводом текста (bot/pending_store.py): memory – в процессе бота,
+# db – таблица в DATABASE_URL, общая для всех процессов и машин (по умолчанию при SCHEDULER_WORKERS > 0
+# или WEBHOOK_PROCESSES > 1), sqlite – файл PENDING_SQLITE_PATH, общий только для процессов одной машины
+PENDING_STORE = os.getenv('PENDING_STORE', 'db' if SCHEDULER_WORKERS > 0 or WEBHOOK_PROCESSES > 1 else 'memory')
+PENDING_SQLITE_PATH = os.getenv('PENDING_SQLITE_PATH', 'pending_tests.db')
+PENDING_TTL_SECONDS = int(os.getenv('PENDING_TTL_SECONDS', str(12 * 3600)))
+PENDING_MAX_SIZE = int(os.getenv('PENDING_MAX_SIZE', '100000'))
+# Загрузка аудио слов (bot/audio_fetch.py)
+AUDIO_CONCURRENCY = int(os.getenv('AUDIO_CONCURRENCY', '20'))
+AUDIO_TIMEOUT_SECONDS = float(os.getenv('AUDIO_TIMEOUT_SECONDS', '10'))
+AUDIO_RETRIES = int(os.getenv('AUDIO_RETRIES', '2'))
+# Как часто сверять исходный mp3 с загруженным в Telegram (bot/audio_cache.py), секунды
+AUDIO_REVALIDATE_SECONDS = int(os.getenv('AUDIO_REVALIDATE_SECONDS', str(24 * 3600)))
+# Сколько секунд помнить, что file_id слова в БД нет, чтобы не спрашивать БД на каждое нажатие
+AUDIO_MISS_SECONDS = int(os.getenv('AUDIO_MISS_SECONDS', '60'))
+# Предварительный прогрев аудио слов из рассылок (bot/audio_prewarm.py).
+# AUDIO_CACHE_CHAT_ID – служебный чат/канал, куда бот загружает mp3 ради file_id;
+# без него mp3 держатся в памяти процесса бота (до AUDIO_PREWARM_FILES файлов)
+AUDIO_CACHE_CHAT_ID = os.getenv('AUDIO_CACHE_CHAT_ID', '')
+AUDIO_PREWARM_WORKERS = int(os.getenv('AUDIO_PREWARM_WORKERS', '4'))
+AUDIO_PREWARM_QUEUE = int(os.getenv('AUDIO_PREWARM_QUEUE', '500'))
+AUDIO_PREWARM_FILES = int(os.getenv('AUDIO_PREWARM_FILES', '300'))
@@ -1,44 +1,237 @@
+# import_words.py
+"""
+Импорт словаря в таблицу words.
+
+    python import_words.py words.xlsx
+    python import_words.py corpus.csv --dry-run
+    python import_words.py corpus.jsonl --batch-size 10000 --no-update
+
+Поддерживаются .xlsx (первая строка – заголовки), .csv (первая строка – заголовки)
+и .jsonl (объекты с ключами word_et, part_of_speech, translation, ai_generated_text).
+Колонки xlsx/csv: 1 - слово, 2 - часть речи, 3 - перевод, 4 - развёрнутый пример.
+
+Строки читаются потоком (xlsx – в режиме read_only), дубликаты ищутся по заранее
+загруженному множеству ключей (word_et, part_of_speech) без запроса на каждую строку.
+Новые слова записываются пачками (executemany, для PostgreSQL через psycopg2 – COPY),
+у существующих обновляются изменившиеся перевод и пример (--no-update – пропускаются;
+пустой пример в файле не стирает сохранённый).
+Повтор ключа внутри файла пропускается: действует первая строка. --dry-run печатает
+разницу с базой и ничего не пишет.
+"""
+import argparse
+import csv
+import io
+import json
 import os
+import time
+from collections import Counter
 from openpyxl import load_workbook
+from sqlalchemy import insert, update
 from bot.database import SessionLocal, Word, init_db
+from bot.catalog import bump_catalog_version
 
-def import_words_from_excel(excel_path):
+FIELDS = ('word_et', 'part_of_speech', 'translation', 'ai_generated_text')
+DEFAULT_BATCH_SIZE = 5000
+
+
+def _read_xlsx(path):
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(min_row=2, values_only=True):
+            yield row
+    finally:
+        wb.close()
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        yield from reader
+
+
+def _read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                yield tuple(item.get(field) for field in FIELDS)
+
+
+READERS = {'xlsx': _read_xlsx, 'csv': _read_csv, 'jsonl': _read_jsonl}
+
+
+def read_rows(path: str, fmt: str = None):
+    """Строки файла как кортежи (word_et, part_of_speech, translation, ai_generated_text)."""
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in READERS:
+        raise ValueError(f"Неизвестный формат файла: {path} (поддерживаются {', '.join(READERS)})")
+    for row in READERS[fmt](path):
+        row = [_clean(value) for value in list(row[:4]) + [None] * (4 - len(row))]
+        yield tuple(row)
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def load_existing(session):
+    """(word_et, part_of_speech) -> (id, перевод, hash примера) для всех слов в базе."""
+    existing = {}
+    query = session.query(Word.id, Word.word_et, Word.part_of_speech, Word.translation, Word.ai_generated_text)
+    for word_id, word_et, part_of_speech, translation, ai_generated_text in query.yield_per(10000):
+        # Сам пример не держим в памяти: для сравнения хватает hash
+        existing[(word_et, part_of_speech)] = (word_id, translation, hash(ai_generated_text))
+    return existing
+
+
+def _insert_rows(session, rows):
+    bind = session.get_bind()
+    if bind.dialect.name == 'postgresql' and bind.dialect.driver == 'psycopg2':
+        # COPY – самый быстрый путь записи в PostgreSQL
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            (row['word_et'], row['part_of_speech'], row['translation'], row['ai_generated_text'], 0, 0, False)
+            for row in rows)
+        buffer.seek(0)
+        cursor = session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                'COPY words (word_et, part_of_speech, translation, ai_generated_text, '
+                'correct_answers, incorrect_answers, repeat_more) FROM STDIN WITH (FORMAT csv)', buffer)
+        finally:
+            cursor.close()
+        return
+    session.execute(insert(Word.__table__), rows)
+
+
+def _update_rows(session, rows):
+    # UPDATE ... WHERE id = ? одним executemany на каждый набор изменяемых столбцов
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+    for group in groups.values():
+        session.execute(update(Word), group)
+
+
+def import_words(path: str, fmt: str = None, dry_run: bool = False, update_existing: bool = True,
+                 batch_size: int = DEFAULT_BATCH_SIZE, show: int = 20) -> Counter:
+    """
+    Импортирует файл; возвращает счётчики: read, inserted, updated, unchanged,
+    duplicates, skipped (строки без слова, части речи или перевода).
+    """
+    started = time.monotonic()
+    stats = Counter()
     session = SessionLocal()
-    wb = load_workbook(excel_path)
-    sheet = wb.active
-
-    # Предполагаем, что первая строка – заголовки:
-    # Колонки: 1 - слово, 2 - часть речи, 3 - перевод, 4 - развёрнутый пример
-    count = 0
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        word_et, part_of_speech, translation, ai_generated_text = row[:4]
-
-        # Проверяем, есть ли уже такое слово с данной частью речи
-        existing = session.query(Word).filter_by(
-            word_et=word_et,
-            part_of_speech=part_of_speech
-        ).first()
-
-        if existing:
-            print(f"Слово '{word_et}' с частью речи '{part_of_speech}' уже есть. Пропускаем.")
-            continue
-
-        new_word = Word(
-            word_et=word_et,
-            part_of_speech=part_of_speech,
-            translation=translation,
-            ai_generated_text=ai_generated_text
-        )
-        session.add(new_word)
-        count += 1
-
-    session.commit()
-    session.close()
-    print(f"Импортировано {count} новых слов.")
+    try:
+        existing = load_existing(session)
+        stats['existing'] = len(existing)
+        seen = set()
+        inserts, updates = [], []
+        write_seconds = 0.0
 
-if __name__ == '__main__':
+        def write():
+            nonlocal write_seconds
+            t0 = time.monotonic()
+            if inserts:
+                _insert_rows(session, inserts)
+                inserts.clear()
+            if updates:
+                _update_rows(session, updates)
+                updates.clear()
+            write_seconds += time.monotonic() - t0
+
+        for word_et, part_of_speech, translation, ai_generated_text in read_rows(path, fmt):
+            stats['read'] += 1
+            if not word_et or not part_of_speech or not translation:
+                stats['skipped'] += 1
+                continue
+            key = (word_et, part_of_speech)
+            if key in seen:
+                stats['duplicates'] += 1
+                continue
+            seen.add(key)
+            current = existing.get(key)
+            if current is None:
+                stats['inserted'] += 1
+                if dry_run:
+                    if stats['inserted'] <= show:
+                        print(f"+ {word_et} ({part_of_speech}): {translation}")
+                    continue
+                inserts.append({'word_et': word_et, 'part_of_speech': part_of_speech,
+                                'translation': translation, 'ai_generated_text': ai_generated_text,
+                                'correct_answers': 0, 'incorrect_answers': 0, 'repeat_more': False})
+            else:
+                word_id, old_translation, old_text_hash = current
+                # Пустой пример в файле не стирает уже сохранённый
+                text_changed = ai_generated_text is not None and old_text_hash != hash(ai_generated_text)
+                if old_translation == translation and not text_changed:
+                    stats['unchanged'] += 1
+                    continue
+                if not update_existing:
+                    stats['unchanged'] += 1
+                    continue
+                stats['updated'] += 1
+                if dry_run:
+                    if stats['updated'] <= show:
+                        change = (f"{old_translation} -> {translation}" if old_translation != translation
+                                  else "новый пример")
+                        print(f"~ {word_et} ({part_of_speech}): {change}")
+                    continue
+                row = {'id': word_id, 'translation': translation}
+                if text_changed:
+                    row['ai_generated_text'] = ai_generated_text
+                updates.append(row)
+            if len(inserts) + len(updates) >= batch_size:
+                write()
+        if not dry_run:
+            write()
+            if stats['inserted'] or stats['updated']:
+                # Запущенные боты перечитают словарь при следующей проверке версии
+                bump_catalog_version(session)
+            session.commit()
+        stats['write_ms'] = int(write_seconds * 1000)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    stats['elapsed_ms'] = int((time.monotonic() - started) * 1000)
+    return stats
+
+
+def print_report(stats: Counter, dry_run: bool = False):
+    elapsed = stats['elapsed_ms'] / 1000 or 1e-9
+    prefix = "Пробный прогон, в базу ничего не записано. " if dry_run else ""
+    print(f"{prefix}Прочитано строк: {stats['read']}, новых слов: {stats['inserted']}, "
+          f"обновлено: {stats['updated']}, без изменений: {stats['unchanged']}, "
+          f"повторов в файле: {stats['duplicates']}, пропущено: {stats['skipped']}")
+    print(f"Время: {elapsed:.2f} с (запись {stats['write_ms'] / 1000:.2f} с), "
+          f"{stats['read'] / elapsed:.0f} строк/с; слов в базе до импорта: {stats['existing']}")
+
+
+def import_words_from_excel(excel_path):
+    print_report(import_words(excel_path, 'xlsx'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт словаря из xlsx / csv / jsonl")
+    parser.add_argument("path", nargs="?", default="words.xlsx")
+    parser.add_argument("--format", choices=sorted(READERS), help="по умолчанию – по расширению файла")
+    parser.add_argument("--dry-run", action="store_true", help="показать разницу с базой и ничего не писать")
+    parser.add_argument("--no-update", action="store_true", help="не менять перевод и пример у существующих слов")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--show", type=int, default=20, help="сколько изменений печатать при --dry-run")
+    args = parser.parse_args()
     # Инициализируем базу (создаёт таблицы, если их нет)
     init_db()
-    # Путь к файлу Excel, который у вас находится по указанному пути
-    excel_file = os.path.join("C:", os.sep, "Users", "Андрей", "Desktop", "телеграм эстонский", "words-final.xlsx")
-    import_words_from_excel(excel_file)
+    stats = import_words(args.path, args.format, dry_run=args.dry_run, update_existing=not args.no_update,
+                         batch_size=args.batch_size, show=args.show)
+    print_report(stats, dry_run=args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+# loadtest/__init__.py
+"""
+Нагрузочный тест всего бота: bot.main против локального фейкового Bot API (loadtest/fake_api.py).
+
+    python -m loadtest --users 100000 --presses 20000 --rate 500
+    python -m loadtest --mode webhook --latency-ms 50 --error-rate 0.02
+    python -m loadtest --users 20000 --save baseline.json
+    python -m loadtest --users 20000 --baseline baseline.json --tolerance 0.2
+
+Готовит временную SQLite-базу (или --database-url) со словарём и пользователями, у которых
+подошло время рассылки, запускает bot.main.main() целиком, прогоняет тик рассылки слов и тик
+тестов, затем нажимает кнопки из отправленных сообщений и шлёт /random_test с заданной частотой.
+Отчёт: время тиков и сообщений в секунду, p50/p99 задержки нажатий, SQL-запросов на пользователя
+и на нажатие, вызовы Bot API. Нарушенный порог (--max-*, --min-*) или ухудшение относительно
+--baseline больше --tolerance – код выхода 1.
+"""
@@ -0,0 +1,4 @@
+# loadtest/__main__.py
+from loadtest.harness import main
+
+main()
@@ -0,0 +1,201 @@
+# loadtest/fake_api.py
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+from aiohttp import ClientSession, TCPConnector, web
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# Методы, которые Telegram ограничивает по частоте – только им отдаётся 429
+THROTTLED_METHODS = {'sendmessage', 'sendaudio', 'editmessagetext'}
+
+
+class FakeBotAPI:
+    """
+    Локальная замена Bot API для нагрузочного теста. Работает в своём потоке со своим
+    event loop, чтобы не делить его с ботом. Поддерживает:
+
+        getUpdates (long polling) или доставку апдейтов POST-запросами на адрес из setWebhook;
+        sendMessage, sendAudio, editMessageText – отвечают сообщением с новым message_id;
+        answerCallbackQuery, deleteMessage, setWebhook, deleteWebhook, getMe;
+        GET /audio/<слово>.mp3 – вместо хранилища аудио (AUDIO_BASE_URL).
+
+    Каждый вызов ждёт latency_ms ± jitter_ms; методы отправки с вероятностью error_rate
+    отвечают 429 с retry_after. Для замера задержки обработки тест регистрирует ожидание
+    (expect) – по id нажатия (ответ answerCallbackQuery) или по чату (первое сообщение
+    в чат), а сервер отмечает время, когда ожидание выполнилось.
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0.0,
+                 retry_after: int = 1, audio_size: int = 4096):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.audio = b'ID3' + bytes(audio_size)
+        self.base_url = None
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.markups = {}       # chat_id -> reply_markup последнего сообщения с inline-кнопками
+        self.done = {}          # ключ ожидания -> время выполнения
+        self._expected = set()
+        self._updates = deque()
+        self._message_ids = itertools.count(1)
+        self._loop = None
+        self._arrived = None
+        self._session = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.connected = threading.Event()   # бот впервые вызвал getUpdates или setWebhook
+        # Метрики
+        self.calls = Counter()
+        self.throttled = 0
+        self.webhook_retries = 0
+
+    # Запуск и остановка
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._run, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._serve())
+
+    async def _serve(self):
+        self._arrived = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._session = ClientSession(connector=TCPConnector(limit=100))
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self._api)
+        app.router.add_get('/audio/{name}', self._audio)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        self.base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        self._ready.set()
+        await self._stop.wait()
+        # Отпускаем висящий long polling, иначе его обработчик останется незавершённым
+        self._arrived.set()
+        await asyncio.sleep(0.1)
+        await self._session.close()
+        await runner.cleanup()
+
+    # Апдейты
+
+    def expect(self, key):
+        """Ждать события key: ('callback', id нажатия) или ('chat', chat_id)."""
+        self._loop.call_soon_threadsafe(self._expected.add, key)
+
+    def push(self, update: dict):
+        """Отдать апдейт боту (потокобезопасно): через getUpdates или POST на webhook."""
+        self._loop.call_soon_threadsafe(self._push, update)
+
+    def _push(self, update: dict):
+        if self.webhook_url:
+            asyncio.ensure_future(self._deliver(update))
+            return
+        self._updates.append(update)
+        self._arrived.set()
+
+    async def _deliver(self, update: dict):
+        headers = {SECRET_HEADER: self.webhook_secret} if self.webhook_secret else {}
+        while True:
+            try:
+                async with self._session.post(self.webhook_url, json=update, headers=headers) as response:
+                    if response.status < 500 and response.status != 429:
+                        return
+                    delay = float(response.headers.get('Retry-After', 1))
+            except OSError:
+                delay = 1
+            # Как Telegram: повтор доставки после отказа
+            self.webhook_retries += 1
+            await asyncio.sleep(delay)
+
+    # Bot API
+
+    def _message(self, chat_id, **fields) -> dict:
+        return {'message_id': next(self._message_ids), 'date': int(time.time()),
+                'chat': {'id': int(chat_id), 'type': 'private'}, **fields}
+
+    def _mark(self, key):
+        if key in self._expected:
+            self._expected.discard(key)
+            self.done[key] = time.monotonic()
+
+    async def _api(self, request: web.Request) -> web.Response:
+        method = request.match_info['method'].lower()
+        self.calls[method] += 1
+        params = await request.post()
+        if method == 'getupdates':
+            return await self._get_updates(params)
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if method in THROTTLED_METHODS and self.error_rate and random.random() < self.error_rate:
+            self.throttled += 1
+            return web.json_response({'ok': False, 'error_code': 429,
+                                      'description': f"Too Many Requests: retry after {self.retry_after}",
+                                      'parameters': {'retry_after': self.retry_after}}, status=429)
+        chat_id = params.get('chat_id')
+        if method == 'sendmessage':
+            markup = params.get('reply_markup')
+            if markup and 'inline_keyboard' in markup:
+                self.markups[int(chat_id)] = markup
+            self._mark(('chat', int(chat_id)))
+            return self._ok(self._message(chat_id, text=params.get('text', '')))
+        if method == 'sendaudio':
+            self._mark(('chat', int(chat_id)))
+            audio = {'file_id': f"audio{next(self._message_ids)}", 'file_unique_id': "u", 'duration': 1}
+            return self._ok(self._message(chat_id, audio=audio))
+        if method == 'editmessagetext':
+            self._mark(('chat', int(chat_id)))
+            return self._ok(self._message(chat_id, text=params.get('text', '')))
+        if method == 'answercallbackquery':
+            self._mark(('callback', params.get('callback_query_id')))
+            return self._ok(True)
+        if method == 'setwebhook':
+            self.webhook_url = params.get('url')
+            self.webhook_secret = params.get('secret_token')
+            self.connected.set()
+            return self._ok(True)
+        if method == 'deletewebhook':
+            self.webhook_url = None
+            return self._ok(True)
+        if method == 'getme':
+            return self._ok({'id': 1, 'is_bot': True, 'first_name': "loadtest", 'username': "loadtest_bot"})
+        return self._ok(True)
+
+    async def _get_updates(self, params) -> web.Response:
+        self.connected.set()
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout=float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._ok(list(itertools.islice(self._updates, limit)))
+
+    async def _audio(self, request: web.Request) -> web.Response:
+        self.calls['audio'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=self.audio, content_type='audio/mpeg', headers={'ETag': '"loadtest"'})
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.Response(text=json.dumps({'ok': True, 'result': result}), content_type='application/json')
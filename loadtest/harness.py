@@ -0,0 +1,310 @@
+# loadtest/harness.py
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from loadtest.fake_api import FakeBotAPI
+
+TOKEN = "123456789:AAHloadtestloadtestloadtestloadtest"
+
+# Показатели прогона: (описание, что считается ухудшением – рост 'max' или падение 'min')
+METRICS = {
+    'words_tick_s': ("тик рассылки слов, с", 'max'),
+    'tests_tick_s': ("тик рассылки тестов, с", 'max'),
+    'words_per_s': ("отправка карточек, сообщений/с", 'min'),
+    'sql_per_user_words': ("SQL на пользователя в тике слов", 'max'),
+    'sql_per_user_tests': ("SQL на пользователя в тике тестов", 'max'),
+    'press_p50_ms': ("нажатие: p50, мс", 'max'),
+    'press_p99_ms': ("нажатие: p99, мс", 'max'),
+    'press_per_s': ("нажатий обработано в секунду", 'min'),
+    'sql_per_press': ("SQL на нажатие", 'max'),
+    'lost_presses': ("нажатий без ответа", 'max'),
+}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def configure_environment(args, api_url: str, workdir: str):
+    """Настройки бота для прогона; config.settings читает их при импорте, поэтому – до импорта bot.*"""
+    env = {
+        'TELEGRAM_TOKEN': TOKEN,
+        'TELEGRAM_API_URL': api_url,
+        'AUDIO_BASE_URL': f"{api_url}/audio",
+        'DATABASE_URL': args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        'PENDING_SQLITE_PATH': os.path.join(workdir, 'pending_tests.db'),
+        'BOT_MODE': args.mode,
+        'SCHEDULER_WORKERS': '0',
+        # Тики запускает сам тест; собственные интервальные задачи планировщика не должны успеть сработать
+        'MAILING_TICK_SECONDS': '86400',
+        'SENDER_GLOBAL_RATE': str(args.send_rate),
+        'CATALOG_SNAPSHOT_PATH': '',
+    }
+    if args.mode == 'webhook':
+        import socket
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        env.update({'WEBHOOK_URL': f"http://127.0.0.1:{port}", 'WEBHOOK_HOST': '127.0.0.1',
+                    'WEBHOOK_PORT': str(port), 'WEBHOOK_SECRET': 'loadtest', 'WEBHOOK_PROCESSES': '1'})
+    os.environ.update(env)
+
+
+def seed(args):
+    """Словарь и пользователи, у которых рассылка слов и тестов уже подошла."""
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+    from bot.database import SessionLocal, Word, UserSettings, init_db
+    from bot.catalog import bump_catalog_version
+
+    init_db()
+    parts = ["nimisõna", "tegusõna", "omadussõna", "määrsõna"]
+    due = datetime.now() - timedelta(minutes=1)
+    session = SessionLocal()
+    try:
+        if session.query(Word).count() < args.words:
+            session.execute(insert(Word.__table__), [
+                {'word_et': f"sõna{i}", 'part_of_speech': parts[i % len(parts)], 'translation': f"перевод{i}",
+                 'ai_generated_text': f"Пример использования слова sõna{i}.", 'correct_answers': 0,
+                 'incorrect_answers': 0, 'repeat_more': False}
+                for i in range(args.words)
+            ])
+            bump_catalog_version(session)
+        existing = session.query(UserSettings).count()
+        for start in range(existing, args.users, 10000):
+            session.execute(insert(UserSettings.__table__), [
+                {'chat_id': str(1000000 + i), 'words_per_hour': args.words_per_user, 'interval_minutes': 60,
+                 'start_time': "00:00", 'end_time': "23:59", 'test_interval_minutes': 90,
+                 'tests_per_batch': 1, 'next_words_at': due, 'next_test_at': due}
+                for i in range(start, min(start + 10000, args.users))
+            ])
+        session.commit()
+    finally:
+        session.close()
+
+
+class StatementCounter:
+    """Число SQL-запросов через движок SQLAlchemy (событие before_cursor_execute)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def _callback_update(update_id: int, chat_id: int, data: str) -> dict:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': "load"}
+    return {'update_id': update_id, 'callback_query': {
+        'id': f"cb{update_id}", 'chat_instance': str(chat_id), 'data': data, 'from': user,
+        'message': {'message_id': update_id, 'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'text': "…"},
+    }}
+
+
+def _command_update(update_id: int, chat_id: int, text: str) -> dict:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': "load"}
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'text': text, 'from': user,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+    }}
+
+
+async def run_ticks(results: dict, statements: StatementCounter, users: int):
+    from bot import scheduler
+    from bot.sender import message_sender
+
+    for name, tick in (('words', scheduler.send_new_words), ('tests', scheduler.send_test_question)):
+        sent_before, sql_before = message_sender.sent, statements.count
+        started = time.monotonic()
+        await tick(None)
+        elapsed = time.monotonic() - started
+        sent = message_sender.sent - sent_before
+        results[f'{name}_tick_s'] = elapsed
+        results[f'{name}_messages'] = sent
+        results[f'{name}_per_s'] = sent / elapsed if elapsed else 0.0
+        results[f'sql_per_user_{name}'] = (statements.count - sql_before) / max(users, 1)
+
+
+async def run_presses(args, api: FakeBotAPI, results: dict, statements: StatementCounter):
+    """
+    Нажатия на кнопки из сообщений, которые бот действительно отправил (после тиков у каждого
+    пользователя есть карточка или тест), и команды /random_test – с частотой args.rate.
+    Задержка – от передачи апдейта до answerCallbackQuery (для команды – до ответа в чат).
+    """
+    chats = list(api.markups)
+    update_ids = itertools.count(1)
+    pushed = {}
+    sql_before = statements.count
+    started = time.monotonic()
+    for i in range(args.presses):
+        delay = started + i / args.rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update_id = next(update_ids)
+        chat_id = random.choice(chats) if chats else 1000000 + random.randrange(args.users)
+        markup = api.markups.get(chat_id)
+        if markup is None or random.random() < args.command_share:
+            key, update = ('chat', chat_id), _command_update(update_id, chat_id, "/random_test")
+        else:
+            buttons = [button for row in json.loads(markup)['inline_keyboard'] for button in row]
+            data = random.choice(buttons)['callback_data']
+            key, update = ('callback', f"cb{update_id}"), _callback_update(update_id, chat_id, data)
+        if key in pushed:
+            continue
+        pushed[key] = time.monotonic()
+        api.expect(key)
+        api.push(update)
+    deadline = time.monotonic() + args.drain_timeout
+    while len([key for key in pushed if key in api.done]) < len(pushed) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    latencies = [api.done[key] - at for key, at in pushed.items() if key in api.done]
+    finished = max((api.done[key] for key in pushed if key in api.done), default=time.monotonic())
+    results['presses'] = len(pushed)
+    results['lost_presses'] = len(pushed) - len(latencies)
+    results['press_p50_ms'] = percentile(latencies, 50) * 1000
+    results['press_p99_ms'] = percentile(latencies, 99) * 1000
+    results['press_per_s'] = len(latencies) / (finished - started) if latencies else 0.0
+    results['sql_per_press'] = (statements.count - sql_before) / max(len(pushed), 1)
+
+
+async def run_scenario(args, api: FakeBotAPI) -> dict:
+    from bot import main as bot_main
+    from bot.database import engine
+    from bot.dispatch_queue import dispatch_queue
+    from bot.callbacks import callback_router
+    from bot.questions import question_pool
+
+    results = {}
+    statements = StatementCounter(engine)
+    # Настоящий стек бота: bot.main.main() с диспетчером, очередью апдейтов, планировщиком и отправкой
+    bot_task = asyncio.create_task(bot_main.main())
+    while not api.connected.is_set():
+        if bot_task.done():
+            bot_task.result()
+        await asyncio.sleep(0.05)
+    try:
+        await run_ticks(results, statements, args.users)
+        await run_presses(args, api, results, statements)
+    finally:
+        results['dispatch'] = dispatch_queue.stats()
+        results['callbacks'] = callback_router.stats()
+        results['questions'] = question_pool.stats()
+        bot_task.cancel()
+        await asyncio.gather(bot_task, return_exceptions=True)
+    return results
+
+
+def print_report(args, api: FakeBotAPI, results: dict):
+    print(f"\n{args.users} пользователей, {args.words} слов, режим {args.mode}; Bot API: задержка "
+          f"{args.latency_ms:g}±{args.jitter_ms:g} мс, 429 – {args.error_rate:.1%}, лимит отправки {args.send_rate:g}/с")
+    for name in ('words', 'tests'):
+        print(f"тик {name:<6} {results[f'{name}_messages']:>7} сообщений за {results[f'{name}_tick_s']:7.2f} с "
+              f"({results[f'{name}_per_s']:8.1f}/с), SQL на пользователя: {results[f'sql_per_user_{name}']:.2f}")
+    print(f"нажатия     n={results['presses']:<6} p50={results['press_p50_ms']:8.2f} мс "
+          f"p99={results['press_p99_ms']:8.2f} мс  {results['press_per_s']:8.1f}/с, "
+          f"SQL на нажатие: {results['sql_per_press']:.2f}, без ответа: {results['lost_presses']}, "
+          f"ошибок в обработчиках: {results['dispatch']['failed']}")
+    handlers = results['dispatch'].get('handlers', {})
+    for kind, item in sorted(handlers.items(), key=lambda pair: -pair[1]['count']):
+        print(f"  {kind:<26} n={item['count']:<6} ожидание {item['avg_wait_ms']:7.2f} мс, "
+              f"обработка {item['avg_run_ms']:7.2f} мс")
+    print(f"Bot API: {dict(api.calls.most_common())}; 429 отдано: {api.throttled}, "
+          f"повторов webhook: {api.webhook_retries}")
+    print(f"кнопки: {results['callbacks']}; тесты: {results['questions']}")
+
+
+def check_thresholds(args, results: dict) -> list:
+    """Нарушенные пороги: явные (--max-*/--min-*) и ухудшение относительно --baseline."""
+    failures = []
+    limits = {
+        'words_tick_s': args.max_tick_s, 'tests_tick_s': args.max_tick_s, 'press_p99_ms': args.max_p99_ms,
+        'press_per_s': args.min_press_rate, 'sql_per_press': args.max_sql_per_press,
+        'sql_per_user_words': args.max_sql_per_user, 'sql_per_user_tests': args.max_sql_per_user,
+        'lost_presses': args.max_lost,
+    }
+    for name, limit in limits.items():
+        if limit is None:
+            continue
+        description, worse = METRICS[name]
+        value = results[name]
+        if (worse == 'max' and value > limit) or (worse == 'min' and value < limit):
+            failures.append(f"{description}: {value:.2f}, порог {limit:g}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for name, (description, worse) in METRICS.items():
+            if name not in baseline:
+                continue
+            value, base = results[name], baseline[name]
+            if worse == 'max' and value > base * (1 + args.tolerance) + 1e-9:
+                failures.append(f"{description}: {value:.2f} против {base:.2f} в базовом прогоне")
+            if worse == 'min' and value < base * (1 - args.tolerance):
+                failures.append(f"{description}: {value:.2f} против {base:.2f} в базовом прогоне")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота против локального фейкового Bot API")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=1800)
+    parser.add_argument("--words-per-user", type=int, default=1, help="слов на пользователя за тик")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--database-url", help="по умолчанию – временная SQLite-база")
+    parser.add_argument("--presses", type=int, default=5000, help="нажатий кнопок и команд")
+    parser.add_argument("--rate", type=float, default=200, help="нажатий в секунду")
+    parser.add_argument("--command-share", type=float, default=0.1, help="доля команд /random_test среди нажатий")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="сколько ждать ответов на нажатия, с")
+    parser.add_argument("--send-rate", type=float, default=5000, help="SENDER_GLOBAL_RATE на время прогона")
+    parser.add_argument("--latency-ms", type=float, default=20, help="задержка ответа Bot API")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.01, help="доля ответов 429 на отправку")
+    thresholds = parser.add_argument_group("пороги: прогон завершается с кодом 1, если они нарушены")
+    thresholds.add_argument("--max-tick-s", type=float)
+    thresholds.add_argument("--max-p99-ms", type=float)
+    thresholds.add_argument("--min-press-rate", type=float)
+    thresholds.add_argument("--max-sql-per-press", type=float)
+    thresholds.add_argument("--max-sql-per-user", type=float)
+    thresholds.add_argument("--max-lost", type=int, help="нажатий без ответа (при --error-rate > 0 часть ответов получает 429)")
+    thresholds.add_argument("--baseline", help="JSON прошлого прогона (--save): сравнить с ним")
+    thresholds.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение относительно --baseline")
+    parser.add_argument("--save", help="записать показатели прогона в JSON (базовый прогон)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    api = FakeBotAPI(args.latency_ms, args.jitter_ms, args.error_rate)
+    api_url = api.start()
+    workdir = tempfile.mkdtemp(prefix="eesti_loadtest_")
+    configure_environment(args, api_url, workdir)
+    import logging
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    started = time.monotonic()
+    seed(args)
+    print(f"данные подготовлены за {time.monotonic() - started:.1f} с ({workdir})")
+    try:
+        results = asyncio.run(run_scenario(args, api))
+    finally:
+        api.stop()
+    print_report(args, api, results)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({name: results[name] for name in METRICS}, f, indent=2)
+    failures = check_thresholds(args, results)
+    for failure in failures:
+        print(f"РЕГРЕССИЯ: {failure}")
+    sys.exit(1 if failures else 0)
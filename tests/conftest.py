@@ -0,0 +1,43 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# Тесты работают со своей временной БД: переменные окружения задаются до импорта bot.*
+_TMP_DIR = tempfile.mkdtemp(prefix="eesti_kell_bot_tests_")
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TMP_DIR, 'bot.db')}"
+os.environ['PENDING_SQLITE_PATH'] = os.path.join(_TMP_DIR, 'pending.db')
+os.environ.setdefault('CATALOG_SNAPSHOT_PATH', '')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import text
+from bot.database import Base, SessionLocal, Word, engine, init_db
+
+
+@pytest.fixture
+def tmp_dir():
+    return _TMP_DIR
+
+
+@pytest.fixture
+def db():
+    """Чистая схема с применёнными миграциями; возвращает фабрику сессий."""
+    Base.metadata.drop_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS schema_version'))
+    init_db()
+    yield SessionLocal
+
+
+@pytest.fixture
+def words(db):
+    """Небольшой словарь в БД и каталоге процесса."""
+    from bot.catalog import word_catalog
+    session = db()
+    session.add_all([Word(word_et=f"sõna{i}", part_of_speech="nimisõna", translation=f"слово{i}")
+                     for i in range(1, 21)])
+    session.commit()
+    catalog = word_catalog.load(session)
+    session.close()
+    return catalog
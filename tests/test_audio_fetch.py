@@ -0,0 +1,78 @@
+# tests/test_audio_fetch.py
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from bot.audio_fetch import AudioFetcher
+
+
+def make_app(hits: dict, versions: dict):
+    """Локальная замена хранилища аудио: missing*.mp3 – 404, flaky.mp3 – 503 на первый запрос."""
+    async def serve(request):
+        name = request.match_info['name']
+        hits[name] = hits.get(name, 0) + 1
+        await asyncio.sleep(0.05)
+        if name.startswith('missing'):
+            raise web.HTTPNotFound()
+        if name == 'flaky' and hits[name] == 1:
+            raise web.HTTPServiceUnavailable()
+        # ETag меняется, если «перезалить» файл: versions[name] += 1
+        etag = f'"{name}-{versions.get(name, 0)}"'
+        if request.headers.get('If-None-Match') == etag:
+            raise web.HTTPNotModified()
+        return web.Response(body=b'ID3' + name.encode() * 100, content_type='audio/mpeg',
+                            headers={'ETag': etag})
+
+    app = web.Application()
+    app.router.add_route('*', '/{name}.mp3', serve)
+    return app
+
+
+def run_with_server(scenario):
+    hits, versions = {}, {}
+
+    async def main():
+        fetcher = AudioFetcher(retries=1)
+        async with TestServer(make_app(hits, versions)) as server:
+            try:
+                return await scenario(fetcher, str(server.make_url('')).rstrip('/'), versions)
+            finally:
+                await fetcher.close()
+
+    return asyncio.run(main()), hits
+
+
+def test_concurrent_presses_share_one_download():
+    async def scenario(fetcher, base_url, versions):
+        results = await asyncio.gather(*(fetcher.fetch(f"{base_url}/sõna{i % 3}.mp3") for i in range(30)))
+        return results, fetcher.shared
+
+    (results, shared), hits = run_with_server(scenario)
+    assert all(result.content.startswith(b'ID3') for result in results)
+    assert sum(hits.values()) == 3
+    assert shared == 27
+
+
+def test_missing_file_and_retry_after_503():
+    async def scenario(fetcher, base_url, versions):
+        missing = await fetcher.fetch(f"{base_url}/missing.mp3")
+        flaky = await fetcher.fetch(f"{base_url}/flaky.mp3")
+        return missing, flaky, fetcher.retried
+
+    (missing, flaky, retried), hits = run_with_server(scenario)
+    assert missing is None
+    assert flaky.content.startswith(b'ID3')
+    assert retried == 1 and hits['flaky'] == 2
+
+
+def test_is_modified_follows_etag():
+    async def scenario(fetcher, base_url, versions):
+        url = f"{base_url}/sõna.mp3"
+        download = await fetcher.fetch(url)
+        unchanged = await fetcher.is_modified(url, etag=download.etag)
+        versions['sõna'] = 1
+        changed = await fetcher.is_modified(url, etag=download.etag)
+        return unchanged, changed
+
+    (unchanged, changed), _ = run_with_server(scenario)
+    assert unchanged is False
+    assert changed is True
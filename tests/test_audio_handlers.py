@@ -0,0 +1,96 @@
+# tests/test_audio_handlers.py
+import asyncio
+from types import SimpleNamespace
+import pytest
+from aiogram.utils.exceptions import BadRequest, InvalidQueryID, WrongFileIdentifier
+from bot import audio_cache as audio_cache_module
+from bot.audio_cache import AudioCache, audio_cache
+from bot.audio_fetch import audio_fetcher
+from bot.audio_handlers import send_word_audio
+
+
+class FakeMessage:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    async def answer_audio(self, audio, title):
+        self.sent.append(audio)
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(audio=SimpleNamespace(file_id=audio))
+
+
+class FakeCallback:
+    def __init__(self, message, stale=False):
+        self.message = message
+        self.stale = stale
+        self.answers = []
+
+    async def answer(self, text=None):
+        if self.stale:
+            raise InvalidQueryID('Query is too old and response timeout expired or query id is invalid')
+        self.answers.append(text)
+
+
+def test_stale_callback_keeps_file_id(words, monkeypatch):
+    word = words.get(1)
+    asyncio.run(audio_cache.remember(word.word_et, 'file-1'))
+    monkeypatch.setattr(audio_cache, 'revalidate_later', lambda *args: None)
+    message = FakeMessage()
+
+    asyncio.run(send_word_audio(FakeCallback(message, stale=True), word.id))
+
+    assert message.sent == ['file-1']
+    assert audio_cache.peek(word.word_et).file_id == 'file-1'
+
+
+def test_wrong_file_id_is_invalidated(words, monkeypatch):
+    word = words.get(2)
+    asyncio.run(audio_cache.remember(word.word_et, 'file-2'))
+
+    async def no_download(url):
+        return None
+    monkeypatch.setattr(audio_fetcher, 'fetch', no_download)
+    callback = FakeCallback(FakeMessage(WrongFileIdentifier('Wrong file identifier/http url specified')))
+
+    asyncio.run(send_word_audio(callback, word.id))
+
+    assert audio_cache.peek(word.word_et) is None
+    assert callback.answers == ["Аудиофайл не найден!"]
+
+
+def test_other_bad_request_still_answers_callback(words, monkeypatch):
+    # Свои записи в памяти кэша: file_id этого теста не должен достаться другим
+    monkeypatch.setattr(audio_cache, '_entries', {})
+    word = words.get(3)
+    asyncio.run(audio_cache.remember(word.word_et, 'file-3'))
+    callback = FakeCallback(FakeMessage(BadRequest('Message to reply not found')))
+
+    with pytest.raises(BadRequest):
+        asyncio.run(send_word_audio(callback, word.id))
+
+    # file_id не тронут, а кнопка не осталась «крутиться»
+    assert audio_cache.peek(word.word_et).file_id == 'file-3'
+    assert callback.answers == ["Не удалось отправить аудио"]
+
+
+def test_missing_file_id_is_not_looked_up_on_every_press(db, monkeypatch):
+    lookups = []
+    load_entry = audio_cache_module._load_entry
+
+    def counting_load_entry(session, word):
+        lookups.append(word)
+        return load_entry(session, word)
+    monkeypatch.setattr(audio_cache_module, '_load_entry', counting_load_entry)
+    cache = AudioCache(miss_seconds=60)
+
+    async def scenario():
+        for _ in range(5):
+            assert await cache.get('sõna') is None
+        await cache.remember('sõna', 'file-1')
+        return await cache.get('sõna')
+
+    assert asyncio.run(scenario()).file_id == 'file-1'
+    assert lookups == ['sõna']
+    assert cache.stats()['misses'] == 5
@@ -0,0 +1,53 @@
+# tests/test_audio_prewarm.py
+import asyncio
+from types import SimpleNamespace
+from aiogram.utils.exceptions import NetworkError
+from bot import audio_prewarm
+from bot.audio_cache import audio_cache
+from bot.audio_fetch import audio_fetcher
+from bot.audio_prewarm import AudioPrewarmer
+from bot.sender import FanoutSender
+
+CONTENT = b'ID3' + b'\x00' * 1000
+
+
+class FlakyBot:
+    """Первая загрузка обрывается, как при сетевой ошибке; поток при этом уже прочитан и закрыт."""
+
+    def __init__(self):
+        self.uploads = []
+
+    async def send_audio(self, chat_id, audio, title, disable_notification):
+        stream = audio.file
+        self.uploads.append(stream.read())
+        stream.close()
+        if len(self.uploads) == 1:
+            raise NetworkError('Connection reset')
+        return SimpleNamespace(message_id=1, audio=SimpleNamespace(file_id='file-1'))
+
+    async def delete_message(self, chat_id, message_id):
+        pass
+
+
+def test_retry_uploads_whole_file(words, monkeypatch):
+    async def fetch(url):
+        return SimpleNamespace(content=CONTENT, etag='"1"', last_modified=None)
+    monkeypatch.setattr(audio_fetcher, 'fetch', fetch)
+
+    async def scenario():
+        bot = FlakyBot()
+        sender = FanoutSender(global_rate=100, chat_interval=0, workers=1)
+        sender.start(bot)
+        monkeypatch.setattr(audio_prewarm, 'message_sender', sender)
+        prewarmer = AudioPrewarmer(chat_id='-100')
+        prewarmer._bot = bot
+        try:
+            assert await prewarmer._warm('sõna3')
+        finally:
+            await sender.close()
+        return bot, sender
+
+    bot, sender = asyncio.run(scenario())
+    assert bot.uploads == [CONTENT, CONTENT]
+    assert sender.retries == 1
+    assert audio_cache.peek('sõna3').file_id == 'file-1'
@@ -0,0 +1,49 @@
+# tests/test_callbacks.py
+import asyncio
+from types import SimpleNamespace
+from bot.answer_log import answer_log
+from bot.callbacks import callback_router, TEST_ANSWER
+from bot.handlers import register_handlers
+from tests.test_dispatch_queue import make_dispatcher
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+
+
+class FakeCallback:
+    def __init__(self, data: str):
+        self.data = data
+        self.bot = FakeBot()
+        self.message = SimpleNamespace(chat=SimpleNamespace(id=42))
+        self.answers = []
+
+    async def answer(self, text=None):
+        self.answers.append(text)
+
+
+def press(data: str) -> FakeCallback:
+    callback = FakeCallback(data)
+    asyncio.run(callback_router.dispatch(callback))
+    return callback
+
+
+def test_unsigned_legacy_answer_is_shown_but_not_recorded(words, monkeypatch):
+    register_handlers(make_dispatcher())
+    recorded = []
+    monkeypatch.setattr(answer_log, 'record', lambda *args: recorded.append(args))
+
+    # Клиент подставил «правильный» вариант сам: ответ виден, но в SRS не попадает
+    legacy = press('test_answer:3:0:0')
+    assert legacy.bot.sent == ["✅ Верно!"] and legacy.answers == [None]
+    legacy_rev = press('test_answer_rev:3:1:0')
+    assert legacy_rev.bot.sent == ["❌ Неверно. Правильный ответ: sõna3"]
+    assert recorded == []
+
+    signed = press(TEST_ANSWER.data(3, 0, True))
+    assert signed.bot.sent == ["✅ Верно!"]
+    assert [args[:2] for args in recorded] == [('42', 3)]
@@ -0,0 +1,22 @@
+# tests/test_catalog.py
+from bot.catalog import CatalogStore, bump_catalog_version
+
+
+def test_reload_closes_previous_snapshot(db, words, tmp_path):
+    store = CatalogStore(str(tmp_path / 'catalog.snapshot'))
+    session = db()
+    store.load(session)                  # из БД, заодно пишется снимок
+    first = store.load(session)          # из снимка
+    assert first.snapshot is not None
+
+    bump_catalog_version(session)
+    session.commit()
+    store.load(session)                  # версия сменилась – снова из БД и новый снимок
+    second = store.load(session)
+
+    assert first.snapshot.closed
+    assert not second.snapshot.closed
+    # Старый объект каталога у запоздавшего читателя продолжает работать
+    assert first.find('sõna5', 'nimisõna').id == 5
+    assert second.find('sõna5', 'nimisõna').id == 5
+    session.close()
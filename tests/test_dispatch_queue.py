@@ -0,0 +1,90 @@
+# tests/test_dispatch_queue.py
+import asyncio
+from aiogram import Bot, Dispatcher, types
+from bot.dispatch_queue import ChatDispatchQueue, handler_key, poll_updates
+
+TOKEN = '123456:test'
+
+
+def message_update(update_id: int, text: str) -> types.Update:
+    return types.Update(**{
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'date': 0, 'text': text,
+                    'chat': {'id': update_id % 7, 'type': 'private'},
+                    'from': {'id': 1, 'is_bot': False, 'first_name': 'test'}},
+    })
+
+
+def make_dispatcher() -> Dispatcher:
+    dp = Dispatcher(Bot(token=TOKEN))
+
+    async def noop(message):
+        pass
+    dp.register_message_handler(noop, commands=['start', 'random_word'])
+    dp.register_message_handler(noop)
+    return dp
+
+
+def test_unknown_commands_share_one_key():
+    async def scenario():
+        dp = make_dispatcher()
+        queue = ChatDispatchQueue(workers=2)
+        queue.start(dp)
+        for i in range(50):
+            queue.put_nowait(message_update(i, f"/junk{i} x"))
+        queue.put_nowait(message_update(100, "/Start@eesti_kell_bot"))
+        queue.put_nowait(message_update(101, "tere"))
+        await queue.close()
+        await (await dp.bot.get_session()).close()
+        return queue.stats()['handlers']
+
+    handlers = asyncio.run(scenario())
+    assert set(handlers) == {'other', '/start', 'message'}
+    assert handlers['other']['count'] == 50
+    assert handler_key(message_update(1, "/random_word")) == '/random_word'
+
+
+class PollingBot(Bot):
+    """getUpdates отдаёт заранее заготовленные пачки и запоминает offset каждого запроса."""
+
+    def __init__(self, batches):
+        super().__init__(token=TOKEN)
+        self.batches = list(batches)
+        self.offsets = []
+
+    async def delete_webhook(self, *args, **kwargs):
+        return True
+
+    async def get_updates(self, offset=None, timeout=None, **kwargs):
+        self.offsets.append(offset)
+        if self.batches:
+            return self.batches.pop(0)
+        await asyncio.sleep(3600)
+
+
+def test_polling_waits_for_full_chat_instead_of_dropping():
+    async def scenario():
+        # Все апдейты – из одного чата, их больше, чем помещается в очередь чата
+        updates = [message_update(7 * i, "tere") for i in range(1, 11)]
+        bot = PollingBot([updates[:6], updates[6:]])
+        dp = Dispatcher(bot)
+        handled = []
+
+        async def slow(message):
+            await asyncio.sleep(0.01)
+            handled.append(message.message_id)
+        dp.register_message_handler(slow)
+        queue = ChatDispatchQueue(workers=2, max_per_chat=2)
+        queue.start(dp)
+        polling = asyncio.create_task(poll_updates(dp, queue))
+        while len(bot.offsets) < 3:
+            await asyncio.sleep(0.01)
+        polling.cancel()
+        await queue.close()
+        await (await bot.get_session()).close()
+        return handled, bot.offsets, queue.stats()['shed']
+
+    handled, offsets, shed = asyncio.run(scenario())
+    assert handled == [7 * i for i in range(1, 11)]
+    assert offsets == [None, 43, 71]
+    assert shed == 0
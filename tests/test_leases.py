@@ -0,0 +1,65 @@
+# tests/test_leases.py
+import multiprocessing
+import time
+from bot.database import SchedulerLease, UserSettings
+from bot.leases import PartitionLease, partition_of, in_partitions
+
+PARTITIONS = 8
+LEASE_SECONDS = 1
+
+
+def _hold(worker_id, start, seconds, report_after, results):
+    """Воркер планировщика: heartbeat каждые 0.1 с; через report_after с сообщает свои партиции."""
+    from bot.database import SessionLocal
+    lease = PartitionLease(worker_id, partitions=PARTITIONS, lease_seconds=LEASE_SECONDS)
+    session = SessionLocal()
+    start.wait(30)
+    started = time.monotonic()
+    reported = False
+    while time.monotonic() - started < seconds:
+        lease.heartbeat(session)
+        if not reported and time.monotonic() - started >= report_after:
+            results.put((worker_id, 'stable', sorted(lease.owned)))
+            reported = True
+        time.sleep(0.1)
+    results.put((worker_id, 'final', sorted(lease.owned)))
+    # Выходим без release_all – как упавший процесс
+    session.close()
+
+
+def test_partitions_split_between_processes_and_fail_over(db):
+    session = db()
+    chat_ids = [str(5000 + i) for i in range(64)]
+    session.add_all([UserSettings(chat_id=chat_id) for chat_id in chat_ids])
+    session.commit()
+
+    ctx = multiprocessing.get_context('spawn')
+    start, results = ctx.Event(), ctx.Queue()
+    # w0 переживает w1 на время, за которое истекает аренда упавшего
+    workers = [ctx.Process(target=_hold, args=('w0', start, 6, 2.5, results)),
+               ctx.Process(target=_hold, args=('w1', start, 3, 2.5, results))]
+    for worker in workers:
+        worker.start()
+    start.set()
+    reports = {}
+    for _ in range(4):
+        worker_id, phase, owned = results.get(timeout=60)
+        reports[(worker_id, phase)] = set(owned)
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    w0, w1 = reports[('w0', 'stable')], reports[('w1', 'stable')]
+    assert not w0 & w1
+    assert w0 | w1 == set(range(PARTITIONS))
+    assert len(w0) == len(w1) == PARTITIONS // 2
+    # Партиции упавшего w1 после истечения аренды забрал w0
+    assert reports[('w0', 'final')] == set(range(PARTITIONS))
+    session.expire_all()
+    assert {row.owner for row in session.query(SchedulerLease)} == {'w0'}
+
+    # Условие SQL выбирает ровно тех пользователей, что partition_of относит к партициям
+    for owned in (w0, w1):
+        selected = {user.chat_id for user in session.query(UserSettings).filter(in_partitions(PARTITIONS, owned))}
+        assert selected == {chat_id for chat_id in chat_ids if partition_of(chat_id, PARTITIONS) in owned}
+    session.close()
@@ -0,0 +1,24 @@
+# tests/test_metrics.py
+import asyncio
+from bot.dispatch_queue import ChatDispatchQueue, handler_key
+from bot.metrics import MAX_SERIES, HandlerMetricsMiddleware, handler_seconds, metrics
+from tests.test_dispatch_queue import make_dispatcher, message_update
+
+
+def test_junk_commands_do_not_create_series():
+    async def scenario():
+        dp = make_dispatcher()
+        dp.middleware.setup(HandlerMetricsMiddleware(handler_key))
+        queue = ChatDispatchQueue(workers=4, max_per_chat=MAX_SERIES * 2)
+        queue.start(dp)
+        for i in range(MAX_SERIES + 50):
+            queue.put_nowait(message_update(i, f"/junk{i}"))
+        queue.put_nowait(message_update(1000, "/random_word"))
+        await queue.close()
+        await (await dp.bot.get_session()).close()
+
+    asyncio.run(scenario())
+    labels = {values[0] for values in handler_seconds._series}
+    assert labels <= {'other', 'message', '/start', '/random_word'}
+    assert '/random_word' in labels
+    assert 'handler_seconds_count{handler="/random_word"} 1' in metrics.render()
@@ -0,0 +1,95 @@
+# tests/test_pending_store.py
+import multiprocessing
+import os
+import subprocess
+import sys
+import pytest
+from bot.pending_store import PendingStore, MemoryPendingStore, SqlitePendingStore, DbPendingStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _ask(path, chat_id, message_id):
+    # Процесс-планировщик отправил тест с вводом ответа
+    SqlitePendingStore(path).put(chat_id, message_id, 7, 'sõna')
+
+
+def test_question_from_another_process(tmp_path):
+    path = str(tmp_path / 'pending.db')
+    bot_store = SqlitePendingStore(path)
+    ctx = multiprocessing.get_context('spawn')
+    workers = [ctx.Process(target=_ask, args=(path, str(chat_id), 100 + chat_id)) for chat_id in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    assert len(bot_store) == 4
+    assert bot_store.take('2') == {'word_id': 7, 'expected': 'sõna'}
+    assert bot_store.take('2') is None
+    assert bot_store.take('3', 103) == {'word_id': 7, 'expected': 'sõna'}
+
+
+def _ask_db(chat_id, message_id):
+    # Планировщик на другой машине: общая у процессов только DATABASE_URL
+    DbPendingStore().put(chat_id, message_id, 7, 'sõna')
+
+
+def test_question_from_another_process_in_db(db):
+    bot_store = DbPendingStore()
+    ctx = multiprocessing.get_context('spawn')
+    workers = [ctx.Process(target=_ask_db, args=(str(chat_id), 100 + chat_id)) for chat_id in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    assert len(bot_store) == 4
+    assert bot_store.take('2') == {'word_id': 7, 'expected': 'sõna'}
+    assert bot_store.take('2') is None
+    assert bot_store.take('3', 999) is None
+    assert bot_store.take('3', 103) == {'word_id': 7, 'expected': 'sõna'}
+    assert bot_store.stats() == {'size': 2, 'hits': 2, 'misses': 2, 'expired': 0, 'evicted': 0}
+
+
+def test_db_store_expires_and_evicts(db):
+    store = DbPendingStore(ttl=60, max_size=3)
+    store.CAP_CHECK_EVERY = 1
+    for message_id in range(5):
+        store.put('1', message_id, message_id, 'sõna')
+    assert len(store) == 3
+    assert store.take('1', 0) is None
+    assert store.take('1')['word_id'] == 4
+
+    expired = DbPendingStore(ttl=0)
+    expired.put('2', 1, 1, 'sõna')
+    assert expired.take('2') is None
+
+
+def _pending_store_default(**env):
+    env = {**os.environ, **env}
+    env.pop('PENDING_STORE', None)
+    return subprocess.run([sys.executable, '-c', 'from config.settings import PENDING_STORE; print(PENDING_STORE)'],
+                          cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout.strip()
+
+
+def test_procfile_default_is_single_process():
+    with open(os.path.join(ROOT, 'Procfile')) as f:
+        processes = dict(line.split(': ', 1) for line in f.read().splitlines() if line.strip())
+    # Рассылки ведёт сам бот, пока отдельные планировщики не включены явно
+    assert processes == {'worker': 'python -m bot.main'}
+    assert _pending_store_default(SCHEDULER_WORKERS='0') == 'memory'
+    # Включённые планировщики могут работать на другом dyno – нужна общая БД, а не локальный файл
+    assert _pending_store_default(SCHEDULER_WORKERS='1') == 'db'
+
+
+def test_store_must_implement_interface():
+    class Incomplete(PendingStore):
+        def put(self, chat_id, message_id, word_id, expected):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete(60, 10)
+    assert len(MemoryPendingStore()) == 0
@@ -0,0 +1,43 @@
+# tests/test_repeat_more.py
+from datetime import datetime, timedelta
+from bot.answer_log import AnswerLog
+from bot.catalog import read_catalog_version, word_catalog
+from bot.database import UserWordStatus
+from bot.handlers import toggle_repeat
+from bot.srs import QUALITY_TYPED, pick_mailing_words
+
+
+def test_toggle_is_per_user_and_keeps_catalog(db, words):
+    session = db()
+    version = read_catalog_version(session)
+    catalog = word_catalog.current
+
+    assert toggle_repeat(session, '1', 3).repeat_more is True
+    session.commit()
+    assert toggle_repeat(session, '2', 3).repeat_more is True
+    assert toggle_repeat(session, '2', 3).repeat_more is False
+    session.commit()
+
+    assert read_catalog_version(session) == version
+    assert word_catalog.current is catalog and not catalog.get(3).repeat_more
+    flags = dict(session.query(UserWordStatus.chat_id, UserWordStatus.repeat_more).filter_by(word_id=3))
+    assert flags == {'1': True, '2': False}
+    session.close()
+
+
+def test_user_flag_shortens_interval_and_marks_card(db, words):
+    session = db()
+    toggle_repeat(session, '1', 4)
+    session.commit()
+    answered_at = datetime(2024, 1, 1, 9)
+    answers = AnswerLog()
+    for day in range(4):
+        answers.record('1', 4, QUALITY_TYPED, answered_at + timedelta(days=day))
+        answers.record('2', 4, QUALITY_TYPED, answered_at + timedelta(days=day))
+    answers.flush(session, commit=True)
+
+    intervals = dict(session.query(UserWordStatus.chat_id, UserWordStatus.srs_interval).filter_by(word_id=4))
+    assert intervals['1'] == 1 and intervals['2'] > 1
+    review = pick_mailing_words(session, '1', 1, answered_at + timedelta(days=5))
+    assert [(word.id, word.repeat_more) for word in review] == [(4, True)]
+    session.close()
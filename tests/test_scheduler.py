@@ -0,0 +1,39 @@
+# tests/test_scheduler.py
+from sqlalchemy import insert, text
+from bot import scheduler
+from bot.database import UserSettings, engine
+from bot.leases import PartitionLease, partition_of
+from bot.migrations import _user_chat_hash
+
+
+def test_daily_statistics_only_for_owned_partitions(db, words, monkeypatch):
+    session = db()
+    chat_ids = [str(1000 + i) for i in range(40)]
+    # Пользователи и через ORM, и пачкой через Core (как в loadtest/harness.py)
+    session.add_all([UserSettings(chat_id=chat_id) for chat_id in chat_ids[:20]])
+    session.execute(insert(UserSettings.__table__), [{'chat_id': chat_id} for chat_id in chat_ids[20:]])
+    session.commit()
+
+    lease = PartitionLease('test', partitions=4)
+    lease.owned = {1, 3}
+    monkeypatch.setattr(scheduler, 'lease', lease)
+    messages = scheduler._collect_daily_statistics(session)
+    session.close()
+
+    expected = {chat_id for chat_id in chat_ids if partition_of(chat_id, 4) in lease.owned}
+    assert expected and len(expected) < len(chat_ids)
+    assert {chat_id for _, chat_id, _ in messages} == expected
+
+
+def test_migration_fills_chat_hash(db):
+    session = db()
+    session.add_all([UserSettings(chat_id=str(i)) for i in range(5)])
+    session.commit()
+    session.execute(text('UPDATE user_settings SET chat_hash = NULL'))
+    session.commit()
+    with engine.begin() as conn:
+        _user_chat_hash(conn)
+    session.expire_all()
+    assert {(u.chat_id, u.chat_hash % 7) for u in session.query(UserSettings)} == \
+        {(str(i), partition_of(str(i), 7)) for i in range(5)}
+    session.close()
@@ -0,0 +1,47 @@
+# tests/test_sender.py
+import asyncio
+import time
+import pytest
+from aiogram.utils.exceptions import RetryAfter
+from bot.sender import TokenBucket, FanoutSender
+
+
+def test_no_burst_after_pause():
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=20)
+        for _ in range(20):
+            await bucket.acquire()
+        bucket.pause(0.5)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # После паузы токены копятся заново: 5 штук при 20/с – ещё ~0.25 с, а не сразу
+    assert asyncio.run(scenario()) >= 0.5 + 0.2
+
+
+class FloodedBot:
+    def __init__(self):
+        self.calls = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        raise RetryAfter(0)
+
+
+def test_flood_control_retries_are_limited():
+    async def scenario():
+        bot = FloodedBot()
+        sender = FanoutSender(global_rate=1000, chat_interval=0, workers=1, max_retries=2)
+        sender.start(bot)
+        try:
+            with pytest.raises(RetryAfter):
+                await asyncio.wait_for(sender.send_message('1', 'tere'), 5)
+        finally:
+            await sender.close()
+        return bot.calls, sender.stats()
+
+    calls, stats = asyncio.run(scenario())
+    assert calls == 3
+    assert stats['retries'] == 2 and stats['failed'] == 1
@@ -0,0 +1,34 @@
+# tests/test_shutdown.py
+import asyncio
+import os
+import signal
+from bot.answer_log import AnswerLog
+from bot.database import UserWordStatus
+from bot.main import wait_for_stop
+from bot.srs import QUALITY_TYPED
+
+
+def test_sigterm_stops_polling():
+    async def scenario():
+        polling = asyncio.create_task(asyncio.sleep(60))
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, os.kill, os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(wait_for_stop(polling), 5)
+        assert not polling.done()
+        polling.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_close_commits_buffered_answers(db, words):
+    async def scenario():
+        answers = AnswerLog(flush_seconds=3600)
+        answers.start()
+        answers.record('1', 1, QUALITY_TYPED)
+        answers.record('1', 2, QUALITY_TYPED)
+        await answers.close()
+
+    asyncio.run(scenario())
+    session = db()
+    assert session.query(UserWordStatus).filter_by(chat_id='1', correct_answers=1).count() == 2
+    session.close()
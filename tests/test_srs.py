@@ -0,0 +1,46 @@
+# tests/test_srs.py
+from datetime import datetime, timedelta
+from bot.answer_log import AnswerLog
+from bot.database import UserWordStatus
+from bot.sent_log import SentWordLog
+from bot.srs import QUALITY_WRONG, QUALITY_TYPED, due_word_ids
+
+
+def _show(session, chat_id, word_ids, sent_at):
+    log = SentWordLog()
+    for word_id in word_ids:
+        log.add(session, chat_id, word_id, sent_at)
+    log.flush(session)
+    session.commit()
+
+
+def test_shown_words_are_not_due(db, words):
+    session = db()
+    start = datetime(2024, 1, 1, 9)
+    for day in range(5):
+        _show(session, '1', [1, 2, 3], start + timedelta(days=day))
+
+    assert {status.due_at for status in session.query(UserWordStatus)} == {None}
+    assert due_word_ids(session, '1', 10, start + timedelta(days=30)) == []
+    session.close()
+
+
+def test_graded_word_shown_after_due_waits_a_day(db, words):
+    session = db()
+    start = datetime(2024, 1, 1, 9)
+    _show(session, '1', [1, 2], start)
+    answers = AnswerLog()
+    answers.record('1', 1, QUALITY_WRONG, start + timedelta(minutes=1))
+    answers.record('1', 2, QUALITY_TYPED, start + timedelta(minutes=1))
+    answers.flush(session)
+    session.commit()
+
+    # Неверный ответ – слово в очереди сразу, верный – через день
+    now = start + timedelta(hours=1)
+    assert due_word_ids(session, '1', 10, now) == [1]
+
+    # Показ после наступления срока откладывает повторение на сутки, но не трогает due_at
+    _show(session, '1', [1], now)
+    assert due_word_ids(session, '1', 10, now + timedelta(hours=2)) == []
+    assert due_word_ids(session, '1', 10, now + timedelta(days=1, minutes=1)) == [1, 2]
+    session.close()
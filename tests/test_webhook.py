@@ -0,0 +1,33 @@
+# tests/test_webhook.py
+import asyncio
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+from bot.dispatch_queue import ChatDispatchQueue
+from bot.webhook import WebhookServer
+
+
+def _update(update_id: int, chat_id: int) -> dict:
+    return {'update_id': update_id,
+            'message': {'message_id': update_id, 'date': 0, 'text': 'tere',
+                        'chat': {'id': chat_id, 'type': 'private'},
+                        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'test'}}}
+
+
+def test_shed_update_is_not_acknowledged():
+    async def scenario():
+        # Очередь без обработчиков: апдейты копятся, пока не упрутся в лимиты
+        dp = Dispatcher(Bot(token='123456:test'))
+        dispatch = ChatDispatchQueue(workers=0, max_pending=3, max_per_chat=2)
+        dispatch.start(dp)
+        server = WebhookServer(dispatch, path='/webhook', secret='')
+        statuses = []
+        async with TestClient(TestServer(server.make_app())) as client:
+            for update_id, chat_id in ((1, 10), (2, 10), (3, 10), (4, 20), (5, 30)):
+                response = await client.post('/webhook', json=_update(update_id, chat_id))
+                statuses.append((response.status, response.headers.get('Retry-After')))
+        await (await dp.bot.get_session()).close()
+        return statuses, server.stats()
+
+    statuses, stats = asyncio.run(scenario())
+    assert statuses == [(200, None), (200, None), (429, '1'), (200, None), (503, '1')]
+    assert stats == {'received': 3, 'rejected': 1, 'throttled': 1}
@@ -0,0 +1,71 @@
+# tests/test_word_sampler.py
+from bot.sent_log import SentWordLog
+from bot.word_sampler import WordSampler
+
+
+def _process(catalog):
+    """Выборщик и журнал отправок одного процесса (бота или планировщика)."""
+    sampler = WordSampler()
+    sampler.on_catalog(catalog)
+    log = SentWordLog()
+    log.subscribe(sampler.on_flushed)
+    return sampler, log
+
+
+def _send(session, sampler, log, chat_id, word_ids):
+    for word_id in word_ids:
+        log.add(session, chat_id, word_id)
+        sampler.mark_seen(chat_id, word_id)
+    log.flush(session)
+    session.commit()
+
+
+def test_samplers_see_each_others_sends(db, words):
+    bot, bot_log = _process(words)
+    scheduler, scheduler_log = _process(words)
+    session = db()
+
+    # Оба процесса закэшировали множество непоказанных слов
+    sent_by_bot = bot.sample_unseen(session, '1', 5)
+    assert len(scheduler.sample_unseen(session, '1', 20)) == 20
+    _send(session, bot, bot_log, '1', sent_by_bot)
+
+    sent_by_scheduler = scheduler.sample_unseen(session, '1', 20)
+    assert len(sent_by_scheduler) == 15
+    assert not set(sent_by_scheduler) & set(sent_by_bot)
+    _send(session, scheduler, scheduler_log, '1', sent_by_scheduler[:10])
+
+    left = set(bot.sample_unseen(session, '1', 20))
+    assert left == set(sent_by_scheduler[10:])
+    session.close()
+
+
+def test_own_sends_keep_cache(db, words):
+    sampler, log = _process(words)
+    session = db()
+    sent = sampler.sample_unseen(session, '1', 5)
+    cached = sampler._users['1']
+    _send(session, sampler, log, '1', sent)
+
+    assert len(sampler.sample_unseen(session, '1', 20)) == 15
+    assert sampler._users['1'] is cached
+    session.close()
+
+
+def test_new_cycle_survives_restart(db, words):
+    sampler, log = _process(words)
+    session = db()
+    _send(session, sampler, log, '1', sampler.sample_unseen(session, '1', 20))
+    assert sampler.sample_unseen(session, '1', 20) == []
+
+    sampler.reset(session, '1')
+    new_cycle = sampler.sample_unseen(session, '1', 5)
+    _send(session, sampler, log, '1', new_cycle)
+
+    # Перезапуск процесса (или другой процесс): круг не схлопывается обратно
+    restarted, _ = _process(words)
+    left = restarted.sample_unseen(session, '1', 20)
+    assert len(left) == 15
+    assert not set(left) & set(new_cycle)
+    assert set(sampler.sample_unseen(session, '1', 20)) == set(left)
+    session.close()